@@ -0,0 +1,309 @@
+# 🌸 Nanali Music Bot v3.0 - Caché de audio en disco
+# Guarda las canciones como Ogg/Opus para que las repeticiones no vuelvan a descargarse
+
+import asyncio
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import discord
+from discord.oggparse import OggStream
+
+from audio_config import FFMPEG_BEFORE_OPTIONS, FFMPEG_PROBE_OPTIONS, log_debug, seek_options
+
+# ═══════════════════════════════════════════════════════════════
+# 💾 ÍNDICE Y ARCHIVOS
+# ═══════════════════════════════════════════════════════════════
+
+# Pistas recientes cuyo número de reproducciones se recuerda antes de guardarlas
+_STREAMED_LIMIT = 4096
+
+class AudioFileCache:
+    """Caché de archivos Ogg/Opus indexados por ID de video con presupuesto de bytes
+
+    Una pista se guarda en segundo plano a partir de su reproducción número
+    store_after: guardarla la primera vez duplicaría la descarga de todas las
+    canciones que luego no se repiten. Al superar el presupuesto se eliminan primero los menos
+    reproducidos ('lfu') o los usados hace más tiempo ('lru').
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        db_path: str,
+        max_bytes: int = 2 * 1024 ** 3,
+        eviction_policy: str = 'lfu',
+        max_duration: int = 900,
+        bitrate: str = '128k',
+        concurrency: int = 1,
+        store_after: int = 2,
+        enabled: bool = True
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.eviction_policy = eviction_policy
+        self.max_duration = max_duration
+        self.bitrate = bitrate
+        self.store_after = store_after
+        self.enabled = enabled
+        # video_id -> {'size', 'last_access', 'play_count'}
+        self._entries: Dict[str, Dict] = {}
+        # video_id -> reproducciones por streaming aún sin guardar (solo en memoria)
+        self._streamed: OrderedDict = OrderedDict()
+        self._writing = set()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+        db_directory = os.path.dirname(db_path)
+        if db_directory:
+            os.makedirs(db_directory, exist_ok=True)
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS audio_files ('
+            'video_id TEXT PRIMARY KEY, size INTEGER NOT NULL, '
+            'last_access REAL NOT NULL, play_count INTEGER NOT NULL)'
+        )
+        self._db.commit()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='audio-cache')
+        self._load()
+
+    def _path(self, video_id: str) -> str:
+        # Los IDs "extractor:id" no son nombres de archivo válidos en Windows
+        return os.path.join(self.directory, video_id.replace(':', '_') + '.ogg')
+
+    def _load(self):
+        """Reconstruye el índice descartando filas sin archivo y archivos a medias"""
+        for name in os.listdir(self.directory):
+            if name.endswith('.part'):
+                os.remove(os.path.join(self.directory, name))
+
+        rows = self._db.execute('SELECT video_id, size, last_access, play_count FROM audio_files').fetchall()
+        for video_id, size, last_access, play_count in rows:
+            if os.path.exists(self._path(video_id)):
+                self._entries[video_id] = {'size': size, 'last_access': last_access, 'play_count': play_count}
+                self.total_bytes += size
+            else:
+                self._db.execute('DELETE FROM audio_files WHERE video_id = ?', (video_id,))
+        self._db.commit()
+
+    def get(self, video_id: Optional[str]) -> Optional[str]:
+        """Devuelve la ruta del archivo si la canción está en caché y cuenta la reproducción"""
+        entry = self._entries.get(video_id) if video_id and self.enabled else None
+        if entry is None:
+            self.misses += 1
+            return None
+
+        path = self._path(video_id)
+        if not os.path.exists(path):
+            self._remove(video_id)
+            self.misses += 1
+            return None
+
+        entry['last_access'] = time.time()
+        entry['play_count'] += 1
+        self._writer.submit(self._db_put, video_id, dict(entry))
+        self.hits += 1
+        return path
+
+    def __contains__(self, video_id: Optional[str]) -> bool:
+        return bool(video_id) and video_id in self._entries
+
+    def is_cacheable(self, video_id: Optional[str], duration: Optional[int]) -> bool:
+        """Indica si la pista puede llegar a guardarse (ahora o al repetirse)"""
+        return self.enabled and bool(video_id) and bool(duration) and duration <= self.max_duration
+
+    def should_store(self, video_id: Optional[str], duration: Optional[int]) -> bool:
+        return (
+            self.is_cacheable(video_id, duration)
+            and video_id not in self._entries
+            and video_id not in self._writing
+        )
+
+    async def store(self, video_id: str, stream: Dict, on_stored: Optional[Callable[[str], None]] = None):
+        """Descarga la pista a Ogg/Opus (copiando el Opus original si es posible)
+
+        on_stored(path) se llama cuando el archivo queda disponible.
+        """
+        if video_id in self._writing:
+            return
+        self._writing.add(video_id)
+        path = self._path(video_id)
+        part_path = path + '.part'
+        process = None
+        try:
+            async with self._semaphore:
+                codec = ['-c:a', 'copy'] if stream.get('acodec') == 'opus' else [
+                    '-c:a', 'libopus', '-b:a', self.bitrate, '-ar', '48000', '-ac', '2'
+                ]
+                process = await asyncio.create_subprocess_exec(
+                    'ffmpeg', *FFMPEG_BEFORE_OPTIONS.split(), '-i', stream['url'],
+                    '-vn', '-map_metadata', '-1', *codec, '-f', 'ogg', '-y', part_path,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.DEVNULL
+                )
+                returncode = await process.wait()
+
+            if returncode != 0 or not os.path.exists(part_path) or not os.path.getsize(part_path):
+                log_debug(f"FFmpeg terminó con código {returncode} al cachear {video_id}", "audio_cache")
+                return
+
+            os.replace(part_path, path)
+            size = os.path.getsize(path)
+            entry = {'size': size, 'last_access': time.time(), 'play_count': 1}
+            self._entries[video_id] = entry
+            self.total_bytes += size
+            self._writer.submit(self._db_put, video_id, dict(entry))
+            log_debug(f"Audio cacheado: {video_id} ({size / 1024 / 1024:.1f} MB)", "audio_cache")
+            self._enforce_budget(keep=video_id)
+            if on_stored:
+                on_stored(path)
+        except asyncio.CancelledError:
+            if process is not None and process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+        except Exception as e:
+            log_debug(f"No se pudo cachear {video_id}: {e}", "audio_cache")
+        finally:
+            self._writing.discard(video_id)
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    def schedule_store(
+        self,
+        video_id: Optional[str],
+        stream: Dict,
+        duration: Optional[int],
+        on_stored: Optional[Callable[[str], None]] = None
+    ) -> bool:
+        """Programa la escritura en segundo plano si la pista es cacheable y se repite"""
+        if not self.should_store(video_id, duration) or not stream.get('url'):
+            return False
+        if not self._count_stream(video_id):
+            return False
+        asyncio.get_running_loop().create_task(self.store(video_id, stream, on_stored))
+        return True
+
+    def _count_stream(self, video_id: str) -> bool:
+        """Anota una reproducción por streaming e indica si ya toca guardarla"""
+        plays = self._streamed.pop(video_id, 0) + 1
+        if plays >= self.store_after:
+            return True
+        self._streamed[video_id] = plays
+        # Recordar solo las más recientes para que el contador no crezca sin fin
+        while len(self._streamed) > _STREAMED_LIMIT:
+            self._streamed.popitem(last=False)
+        return False
+
+    def _eviction_order(self):
+        if self.eviction_policy == 'lru':
+            key = lambda item: item[1]['last_access']
+        else:
+            key = lambda item: (item[1]['play_count'], item[1]['last_access'])
+        return [video_id for video_id, _ in sorted(self._entries.items(), key=key)]
+
+    def _enforce_budget(self, keep: Optional[str] = None):
+        if self.total_bytes <= self.max_bytes:
+            return
+        for video_id in self._eviction_order():
+            if self.total_bytes <= self.max_bytes:
+                break
+            if video_id != keep:
+                self._remove(video_id)
+
+    def _remove(self, video_id: str):
+        entry = self._entries.pop(video_id, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry['size']
+        try:
+            # En Linux un archivo ya mapeado sigue siendo legible tras borrarlo
+            os.remove(self._path(video_id))
+        except OSError:
+            pass
+        self._writer.submit(self._db_delete, video_id)
+
+    def _db_put(self, video_id: str, entry: Dict):
+        self._db.execute(
+            'INSERT OR REPLACE INTO audio_files (video_id, size, last_access, play_count) VALUES (?, ?, ?, ?)',
+            (video_id, entry['size'], entry['last_access'], entry['play_count'])
+        )
+        self._db.commit()
+
+    def _db_delete(self, video_id: str):
+        self._db.execute('DELETE FROM audio_files WHERE video_id = ?', (video_id,))
+        self._db.commit()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def close(self) -> None:
+        """Termina las escrituras pendientes del índice y cierra la base de datos"""
+        self._writer.shutdown(wait=True)
+        self._db.close()
+
+# ═══════════════════════════════════════════════════════════════
+# 🎧 REPRODUCCIÓN DESDE ARCHIVOS MAPEADOS
+# ═══════════════════════════════════════════════════════════════
+
+class MappedOpusAudio(discord.AudioSource):
+    """Fuente Opus que lee los paquetes de un Ogg mapeado en memoria, sin FFmpeg"""
+
+    def __init__(self, path: str):
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._packets = OggStream(self._map).iter_packets()
+
+    def read(self) -> bytes:
+        for packet in self._packets:
+            # Las cabeceras OpusHead/OpusTags no son audio
+            if not packet.startswith((b'OpusHead', b'OpusTags')):
+                return packet
+        return b''
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self) -> None:
+        if not self._map.closed:
+            self._map.close()
+        self._file.close()
+
+class MappedPCMAudio(discord.FFmpegPCMAudio):
+    """Decodifica un archivo de la caché a PCM leyéndolo mapeado en memoria"""
+
+    def __init__(self, path: str, options: Dict, start: float = 0.0):
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            super().__init__(
+                self._map,
+                pipe=True,
+                before_options=f'{seek_options(start)}{FFMPEG_PROBE_OPTIONS} -nostdin -loglevel error',
+                options=options['options']
+            )
+        except Exception:
+            self._map.close()
+            raise
+
+    def cleanup(self) -> None:
+        writer = getattr(self, '_pipe_writer_thread', None)
+        super().cleanup()
+        # El hilo que copia el mapa a FFmpeg termina al morir el proceso; no cerrar el
+        # mapa mientras aún lo lee
+        if writer is not None and writer is not threading.current_thread():
+            writer.join(timeout=1)
+            if writer.is_alive():
+                return
+        if not self._map.closed:
+            self._map.close()
@@ -68,7 +68,64 @@ PERFORMANCE_CONFIG = {
     'auto_disconnect_delay': 300,  # 5 minutos
     'extraction_timeout': 30,
     'playback_timeout': 10,
-    'max_retries': 3
+    'max_retries': 3,
+    'prefetch_lead_time': 30,  # Segundos antes del final para resolver la siguiente canción
+    'extraction_workers': 2,  # Procesos yt-dlp dedicados
+    'extraction_queue_size': 16,  # Máximo de extracciones pendientes
+    'playlist_page_size': 25,  # Entradas de playlist por extracción plana
+    'opus_passthrough': True  # Enviar el Opus original sin decodificar cuando no hay efectos
+}
+
+# Configuración de la caché de pistas resueltas
+TRACK_CACHE_CONFIG = {
+    'db_path': os.path.join('data', 'nanali_cache.db'),
+    'max_entries': 500,
+    'expiry_margin': 300,  # No usar URLs firmadas a menos de 5 minutos de caducar
+    'default_ttl': 600  # Para URLs sin 'expire=' (0 = no guardarlas)
+}
+
+# Configuración de la caché de búsquedas
+SEARCH_CACHE_CONFIG = {
+    'max_entries': 1000,
+    'ttl': 21600  # 6 horas
+}
+
+# Precalentamiento de las playlists temáticas
+WARM_POOL_CONFIG = {
+    'enabled': True,
+    'concurrency': 1,  # Extracciones simultáneas dedicadas al precalentamiento
+    'refresh_interval': 1800,  # Cada cuánto se revisan las playlists
+    'refresh_margin': 3600  # Re-resolver si la URL caduca antes de este margen
+}
+
+# Timeouts adaptativos y circuit breaker del extractor
+EXTRACTION_HEALTH_CONFIG = {
+    'window_size': 50,  # Extracciones recientes consideradas
+    'min_samples': 10,  # Hasta tenerlas se usa 'extraction_timeout'
+    'multiplier': 2.0,  # Timeout = p95 observado x multiplicador
+    'min_timeout': 8,  # Nunca por debajo de esto (máximo: 'extraction_timeout')
+    'error_rate_threshold': 0.5,  # Abrir el circuito si falla esta fracción de la ventana
+    'max_open_time': 300  # Tope del backoff exponencial del circuito
+}
+
+# Caché de audio en disco (archivos Ogg/Opus)
+AUDIO_CACHE_CONFIG = {
+    'enabled': True,
+    'directory': os.path.join('data', 'audio'),
+    'db_path': os.path.join('data', 'nanali_cache.db'),
+    'max_bytes': 2 * 1024 ** 3,  # 2 GB
+    'eviction_policy': 'lfu',  # 'lfu' (menos reproducidas) o 'lru' (más antiguas)
+    'max_duration': 900,  # No cachear canciones de más de 15 minutos
+    'bitrate': '128k',  # Solo si hay que recodificar a Opus
+    'concurrency': 1,  # Descargas simultáneas a la caché
+    'store_after': 2  # Guardar a partir de la 2ª reproducción (1 = desde la primera)
+}
+
+# Enlaces directos a archivos de audio (sin yt-dlp)
+MEDIA_PROBE_CONFIG = {
+    'timeout': 3,  # Segundos máximos del sondeo HEAD/rango
+    'max_connections': 10,
+    'media_extensions': ('.mp3', '.ogg', '.opus', '.m4a', '.aac', '.flac', '.wav', '.webm', '.mp4')
 }
 
 # Mensajes de error personalizados
@@ -79,47 +136,90 @@ ERROR_MESSAGES = {
     'connection_failed': "❌ Error de conexión al canal de voz",
     'invalid_url': "❌ URL no válida o video no disponible",
     'timeout': "❌ Tiempo de espera agotado",
-    'permission_denied': "❌ Sin permisos para reproducir en este canal"
+    'permission_denied': "❌ Sin permisos para reproducir en este canal",
+    'extractor_unavailable': "❌ YouTube no está respondiendo, reintentaré en {seconds}s",
+    'stream_interrupted': "🔄 Se cortó el audio de **{title}**, retomando desde {position}..."
 }
 
 # Configuración de calidad de audio por defecto
 AUDIO_QUALITY_PRESETS = {
+    # sample_rate debe ser 48000: discord.py interpreta el PCM siempre a 48 kHz
     'low': {
         'bitrate': '96k',
-        'sample_rate': '44100',
+        'sample_rate': '48000',
         'channels': '2',
-        'volume': '0.6'
+        'volume': '0.6',
+        'bandwidth': 'superwide'  # Paso de banda del codificador Opus (hasta 12 kHz)
     },
     'medium': {
         'bitrate': '128k',
         'sample_rate': '48000',
         'channels': '2',
-        'volume': '0.7'
+        'volume': '0.7',
+        'bandwidth': 'full'
     },
     'high': {
         'bitrate': '192k',
         'sample_rate': '48000',
         'channels': '2',
-        'volume': '0.8'
+        'volume': '0.8',
+        'bandwidth': 'full'
     }
 }
 
+# Calidad adaptativa según la carga (quality.py); cada límite es (tranquilo, saturado)
+ADAPTIVE_QUALITY_CONFIG = {
+    'enabled': True,
+    'interval': 5,  # Segundos entre muestras
+    'cpu_percent': (60, 85),  # CPU del proceso del bot, en % de un núcleo
+    'loop_lag': (0.02, 0.1),  # Retraso del event loop en segundos
+    'streams': (4, 12),  # Canales de voz reproduciendo a la vez
+    'upgrade_after': 3  # Muestras seguidas en calma antes de subir un nivel
+}
+
 # Configuración actual (medium por defecto)
 CURRENT_QUALITY = 'medium'
 
-def get_ffmpeg_options(quality='medium'):
-    """Obtiene las opciones de FFmpeg según la calidad especificada"""
+# Sondeo corto: las pistas son de audio con un solo flujo, no hace falta analizar 5 s ni 5 MB
+FFMPEG_PROBE_OPTIONS = '-probesize 1048576 -analyzeduration 1000000'
+FFMPEG_BEFORE_OPTIONS = f'-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 {FFMPEG_PROBE_OPTIONS} -nostdin -loglevel error'
+
+def seek_options(start=0.0):
+    """Opción -ss de entrada para empezar la pista en un segundo dado"""
+    return f'-ss {start:.2f} ' if start > 0 else ''
+
+def get_ffmpeg_options(quality='medium', apply_volume=True, start=0.0):
+    """Obtiene las opciones de FFmpeg según la calidad especificada
+
+    Con apply_volume=False el volumen del preset no se aplica en FFmpeg
+    (lo aplica el reproductor, igual que en el modo de paso directo).
+    start > 0 empieza la lectura en ese segundo.
+    """
     preset = AUDIO_QUALITY_PRESETS.get(quality, AUDIO_QUALITY_PRESETS['medium'])
+    volume_filter = f'-filter:a "volume={preset["volume"]}" ' if apply_volume else ''
     
     return {
-        'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -nostdin -loglevel error',
-        'options': f'-vn -filter:a "volume={preset["volume"]}" -ac {preset["channels"]} -ar {preset["sample_rate"]} -b:a {preset["bitrate"]} -bufsize 64k'
+        'before_options': seek_options(start) + FFMPEG_BEFORE_OPTIONS,
+        'options': f'-vn {volume_filter}-ac {preset["channels"]} -ar {preset["sample_rate"]} -b:a {preset["bitrate"]} -bufsize 64k'
+    }
+
+def get_passthrough_options(start=0.0):
+    """Opciones de FFmpeg para copiar los paquetes Opus sin recodificar"""
+    return {
+        'before_options': seek_options(start) + FFMPEG_BEFORE_OPTIONS,
+        'options': '-vn'
     }
 
-def get_ytdl_options(debug=False):
+def get_ytdl_options(debug=False, prefer_opus=None):
     """Obtiene las opciones de yt-dlp con configuración de depuración opcional"""
     options = YTDL_OPTIONS_OPTIMIZED.copy()
     
+    if prefer_opus is None:
+        prefer_opus = PERFORMANCE_CONFIG['opus_passthrough']
+    if prefer_opus:
+        # El Opus de YouTube (webm) puede enviarse a Discord tal cual
+        options['format'] = 'bestaudio[acodec=opus]/bestaudio/best'
+    
     if debug:
         options.update({
             'quiet': False,
@@ -169,27 +269,87 @@ RECONNECT_CONFIG = {
     'exponential_backoff': True
 }
 
-# Filtros de audio disponibles
+# Filtros de audio disponibles (ganancias en dB de la etapa DSP del bot)
 AUDIO_FILTERS = {
-    'bass_boost': 'bass=g=5',
-    'treble_boost': 'treble=g=3',
-    'normalize': 'loudnorm',
-    'noise_reduction': 'afftdn=nf=-25',
-    'echo': 'aecho=0.8:0.9:1000:0.3',
-    'reverb': 'afreqshift=shift=0.1'
-}
-
-def get_filter_string(filters_list):
-    """Genera string de filtros para FFmpeg"""
-    if not filters_list:
-        return 'volume=0.7'
-    
-    filter_strings = []
-    for filter_name in filters_list:
-        if filter_name in AUDIO_FILTERS:
-            filter_strings.append(AUDIO_FILTERS[filter_name])
-    
-    if not filter_strings:
-        return 'volume=0.7'
-    
-    return ','.join(filter_strings)
\ No newline at end of file
+    'bass_boost': {'bass': 5},
+    'treble_boost': {'treble': 3},
+    'vocal': {'bass': -3, 'treble': 2},
+    'loud': {'gain': 4}
+}
+
+# Parámetros de la etapa DSP (audio_sources.py)
+DSP_CONFIG = {
+    'bass_frequency': 100,  # Hz del filtro low-shelf
+    'treble_frequency': 3000,  # Hz del filtro high-shelf
+    'limiter_ceiling': 0.97,  # Pico máximo tras los efectos (fracción de escala completa)
+    'limiter_release': 0.05  # Recuperación de ganancia del limitador por frame
+}
+
+# Control de volumen (audio_sources.VolumeAudioSource)
+VOLUME_CONFIG = {
+    'max_volume': 1.5,  # 150%, el máximo que anuncia !volume
+    'ramp_step': 0.25,  # Cambio máximo de ganancia por frame de 20 ms
+    'soft_clip_knee': 0.8  # Por encima del 100%, saturación suave desde este nivel
+}
+
+# Búfer de lectura anticipada de las fuentes FFmpeg (audio_sources.BufferedAudioSource)
+BUFFER_CONFIG = {
+    'enabled': True,
+    'seconds': 3.0,  # Audio que el hilo lector mantiene por delante del reproductor
+    'prefill': 0.5,  # Segundos a acumular antes de entregar el primer frame
+    'startup_timeout': 5.0,  # Espera máxima del primer frame (arranque de FFmpeg)
+    'underrun_wait': 0.01  # Espera ante un búfer vacío antes de enviar silencio
+}
+
+# Normalización de sonoridad precalculada (loudness.py)
+LOUDNESS_CONFIG = {
+    'enabled': True,
+    'db_path': os.path.join('data', 'nanali_cache.db'),
+    'target_lufs': -16.0,  # Sonoridad integrada objetivo de todas las pistas
+    'max_gain': 6.0,  # dB máximos de subida
+    'min_gain': -12.0,  # dB máximos de bajada
+    'max_duration': 900,  # No analizar por URL pistas más largas
+    'concurrency': 1
+}
+# Diferencias menores que esta (dB) no justifican perder el paso directo Opus
+LOUDNESS_PASSTHROUGH_TOLERANCE = 1.5
+
+# Recuperación de cortes a mitad de canción (URL caducada o conexión perdida)
+RECOVERY_CONFIG = {
+    'enabled': True,
+    'end_tolerance': 5,  # Un final más de 5 s antes de la duración conocida es un corte
+    'max_attempts': 3,  # Reintentos por canción antes de pasar a la siguiente
+    'rewind': 1.0  # Segundos que se retrocede al retomar para no perder audio
+}
+
+# Reparto de la cola entre quienes piden canciones (tracks.TrackQueue)
+QUEUE_SCHEDULER_CONFIG = {
+    'scheduler': 'round_robin',  # fifo, round_robin (una canción por persona y turno) o weighted
+    'max_per_user': 20,  # Canciones en cola por persona (None = sin límite)
+    'weights': {},  # Peso por ID de usuario de Discord en el modo weighted (1 por defecto)
+    'default_duration': 240  # Coste de las canciones sin duración conocida en weighted
+}
+
+# Persistencia de las colas por servidor (queue_store.py)
+QUEUE_STORE_CONFIG = {
+    'enabled': True,
+    'db_path': os.path.join('data', 'nanali_cache.db'),
+    'flush_delay': 2.0,  # Segundos que se agrupan los cambios antes de escribir
+    'checkpoint_interval': 15.0  # Cada cuánto se guarda la posición de lo que suena
+}
+
+# Transiciones entre canciones (audio_sources.CrossfadeMixer)
+CROSSFADE_CONFIG = {
+    'duration': 0,  # Segundos de fundido por defecto (0 = encadenado sin hueco, sin fundido)
+    'max_duration': 12,  # Máximo que permite !crossfade
+    'curve': 'equal_power',  # 'equal_power' o 'linear'
+    'transition_lead': 5  # Segundos antes del fundido en que se abre la siguiente canción
+}
+
+def get_filter_params(filters_list):
+    """Combina las ganancias de varios filtros en un único juego de parámetros"""
+    params = {'bass': 0, 'treble': 0, 'gain': 0}
+    for filter_name in filters_list or []:
+        for key, value in AUDIO_FILTERS.get(filter_name, {}).items():
+            params[key] += value
+    return params
@@ -0,0 +1,657 @@
+# 🌸 Nanali Music Bot v3.0 - Procesamiento de audio en el bot
+# Efectos (bass boost, agudos, ganancia, limitador) aplicados a cada frame PCM con NumPy
+
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+import discord
+import numpy as np
+
+from audio_config import get_filter_params, log_debug
+
+# Formato PCM que entrega FFmpegPCMAudio: 48 kHz, estéreo, int16, frames de 20 ms
+SAMPLE_RATE = 48000
+CHANNELS = 2
+FRAME_SAMPLES = 960
+FRAME_BYTES = FRAME_SAMPLES * CHANNELS * 2
+FRAME_DURATION = FRAME_SAMPLES / SAMPLE_RATE
+SUB_BLOCK = 64
+
+# ═══════════════════════════════════════════════════════════════
+# 🎛️ FILTROS BIQUAD
+# ═══════════════════════════════════════════════════════════════
+
+def shelf_coefficients(kind: str, gain_db: float, frequency: float, sample_rate: int = SAMPLE_RATE):
+    """Coeficientes (b, a) normalizados de un filtro shelf (Audio EQ Cookbook, pendiente 1)"""
+    amplitude = 10 ** (gain_db / 40)
+    w0 = 2 * np.pi * frequency / sample_rate
+    cos_w0 = np.cos(w0)
+    alpha = np.sin(w0) / 2 * np.sqrt(2)
+    two_sqrt_a_alpha = 2 * np.sqrt(amplitude) * alpha
+    ap1, am1 = amplitude + 1, amplitude - 1
+
+    if kind == 'low':
+        b = (
+            amplitude * (ap1 - am1 * cos_w0 + two_sqrt_a_alpha),
+            2 * amplitude * (am1 - ap1 * cos_w0),
+            amplitude * (ap1 - am1 * cos_w0 - two_sqrt_a_alpha)
+        )
+        a = (ap1 + am1 * cos_w0 + two_sqrt_a_alpha, -2 * (am1 + ap1 * cos_w0), ap1 + am1 * cos_w0 - two_sqrt_a_alpha)
+    else:
+        b = (
+            amplitude * (ap1 + am1 * cos_w0 + two_sqrt_a_alpha),
+            -2 * amplitude * (am1 + ap1 * cos_w0),
+            amplitude * (ap1 + am1 * cos_w0 - two_sqrt_a_alpha)
+        )
+        a = (ap1 - am1 * cos_w0 + two_sqrt_a_alpha, 2 * (am1 - ap1 * cos_w0), ap1 - am1 * cos_w0 - two_sqrt_a_alpha)
+
+    return tuple(c / a[0] for c in b), (a[1] / a[0], a[2] / a[0])
+
+class BlockBiquad:
+    """Biquad evaluado por bloques con su forma de espacio de estados
+
+    La recursión muestra a muestra se reescribe como productos de matrices:
+    cada sub-bloque de 64 muestras es la convolución con la respuesta al
+    impulso más la contribución del estado, y el estado se propaga entre
+    sub-bloques con potencias de A. Así un frame de 20 ms completo se filtra
+    con unas pocas operaciones vectorizadas y sin bucles de Python.
+    """
+
+    def __init__(self, b, a, channels: int = CHANNELS, block: int = SUB_BLOCK, frame: int = FRAME_SAMPLES):
+        b0, b1, b2 = b
+        a1, a2 = a
+        state_matrix = np.array([[-a1, 1.0], [-a2, 0.0]])
+        input_vector = np.array([b1 - a1 * b0, b2 - a2 * b0])
+        blocks = frame // block
+
+        powers = [np.eye(2)]
+        for _ in range(max(block, blocks)):
+            powers.append(state_matrix @ powers[-1])
+
+        # Respuesta al impulso y matriz de Toeplitz (L x L) de la parte de entrada
+        impulse = np.empty(block)
+        impulse[0] = b0
+        for m in range(1, block):
+            impulse[m] = (powers[m - 1] @ input_vector)[0]
+        lag = np.arange(block)[:, None] - np.arange(block)[None, :]
+        self.toeplitz = np.where(lag >= 0, impulse[np.clip(lag, 0, None)], 0.0)
+        # Salida debida al estado inicial del sub-bloque (fila k: C·A^k)
+        self.observe = np.array([powers[k][0] for k in range(block)])
+        # Estado final de un sub-bloque en función de sus entradas (columna j: A^(L-1-j)·B)
+        self.gather = np.stack([powers[block - 1 - j] @ input_vector for j in range(block)], axis=1)
+
+        # Propagación del estado entre sub-bloques usando F = A^L
+        block_step = powers[block]
+        step_powers = [np.eye(2)]
+        for _ in range(blocks):
+            step_powers.append(block_step @ step_powers[-1])
+        self.initial = np.stack(step_powers[:blocks])
+        carry = np.zeros((blocks, blocks, 2, 2))
+        for current in range(blocks):
+            for previous in range(current):
+                carry[current, previous] = step_powers[current - 1 - previous]
+        # Aplanadas para que cada paso sea un único producto de matrices
+        self.carry = carry.transpose(0, 2, 1, 3).reshape(blocks * 2, blocks * 2)
+        self.final_initial = step_powers[blocks]
+        self.final_carry = np.stack([step_powers[blocks - 1 - k] for k in range(blocks)]).transpose(1, 0, 2).reshape(2, blocks * 2)
+
+        self.state = np.zeros((2, channels))
+        self._input_part = np.empty((blocks, block, channels))
+        self._gathered = np.empty((blocks, 2, channels))
+        self._states = np.empty((blocks, 2, channels))
+
+    def process(self, blocks: np.ndarray, out: np.ndarray) -> np.ndarray:
+        """Filtra un frame con forma (sub-bloques, muestras, canales)"""
+        np.matmul(self.toeplitz, blocks, out=self._input_part)
+        np.matmul(self.gather, blocks, out=self._gathered)
+        gathered = self._gathered.reshape(-1, self.state.shape[1])
+        np.matmul(self.initial, self.state, out=self._states)
+        self._states.reshape(gathered.shape)[:] += self.carry @ gathered
+        np.matmul(self.observe, self._states, out=out)
+        out += self._input_part
+        self.state = self.final_initial @ self.state + self.final_carry @ gathered
+        return out
+
+# ═══════════════════════════════════════════════════════════════
+# 🎚️ EFECTOS Y FUENTE DE AUDIO
+# ═══════════════════════════════════════════════════════════════
+
+class AudioEffects:
+    """Estado de los efectos; los comandos lo modifican y la fuente lo lee en cada frame"""
+
+    def __init__(self, bass_levels: Dict[int, float]):
+        self.bass_levels = bass_levels
+        self.bass_level = 0
+        self.filters: List[str] = []
+        self.version = 0
+        self._neutral = (None, True)
+
+    def set_bass_level(self, level: int):
+        self.bass_level = level
+        self.version += 1
+
+    def toggle_filter(self, name: str) -> bool:
+        """Activa o desactiva un filtro; devuelve si quedó activo"""
+        if name in self.filters:
+            self.filters.remove(name)
+        else:
+            self.filters.append(name)
+        self.version += 1
+        return name in self.filters
+
+    def clear_filters(self):
+        self.filters = []
+        self.version += 1
+
+    def parameters(self) -> Dict[str, float]:
+        """Ganancias combinadas en dB del nivel de bass boost y los filtros activos"""
+        params = get_filter_params(self.filters)
+        params['bass'] += self.bass_levels.get(self.bass_level, 0)
+        return params
+
+    def is_neutral(self) -> bool:
+        # Se consulta en cada frame: recalcular solo cuando cambian los efectos
+        version, neutral = self._neutral
+        if version != self.version:
+            neutral = not any(self.parameters().values())
+            self._neutral = (self.version, neutral)
+        return neutral
+
+class EffectsProcessor:
+    """Aplica bass (low-shelf), agudos (high-shelf), ganancia y limitador a frames int16"""
+
+    def __init__(
+        self,
+        effects: AudioEffects,
+        bass_frequency: float = 100,
+        treble_frequency: float = 3000,
+        limiter_ceiling: float = 0.97,
+        limiter_release: float = 0.05
+    ):
+        self.effects = effects
+        self.bass_frequency = bass_frequency
+        self.treble_frequency = treble_frequency
+        self.limiter_ceiling = limiter_ceiling
+        self.limiter_release = limiter_release
+        self._version = None
+        self._filters: List[BlockBiquad] = []
+        self._gain = 1.0
+        self._limiter_gain = 1.0
+        blocks = FRAME_SAMPLES // SUB_BLOCK
+        self._blocks = np.empty((blocks, SUB_BLOCK, CHANNELS))
+        self._filtered = np.empty((blocks, SUB_BLOCK, CHANNELS))
+        self._ramp = np.arange(1, FRAME_SAMPLES + 1, dtype=np.float64) / FRAME_SAMPLES
+
+    def _rebuild(self):
+        params = self.effects.parameters()
+        previous = self._filters
+        self._filters = []
+        for kind, key, frequency in (('low', 'bass', self.bass_frequency), ('high', 'treble', self.treble_frequency)):
+            if params[key]:
+                self._filters.append(BlockBiquad(*shelf_coefficients(kind, params[key], frequency)))
+        # Conservar el estado para que el cambio no produzca un chasquido
+        for old, new in zip(previous, self._filters):
+            new.state = old.state
+        self._gain = 10 ** (params['gain'] / 20)
+        self._version = self.effects.version
+
+    def process(self, frame: bytes) -> bytes:
+        if self._version != self.effects.version:
+            self._rebuild()
+
+        pcm = np.frombuffer(frame, dtype=np.int16)
+        blocks = self._blocks
+        np.multiply(pcm.reshape(blocks.shape), 1 / 32768, out=blocks)
+        for biquad in self._filters:
+            biquad.process(blocks, self._filtered)
+            blocks, self._filtered = self._filtered, blocks
+        self._blocks = blocks
+        samples = blocks.reshape(FRAME_SAMPLES, CHANNELS)
+        if self._gain != 1.0:
+            samples *= self._gain
+
+        # Limitador: ataque inmediato, liberación gradual y rampa dentro del frame
+        peak = float(np.abs(samples).max())
+        target = min(1.0, self.limiter_ceiling / peak) if peak > 0 else 1.0
+        gain = target if target < self._limiter_gain else min(target, self._limiter_gain + self.limiter_release)
+        if gain != 1.0 or self._limiter_gain != 1.0:
+            samples *= (self._limiter_gain + (gain - self._limiter_gain) * self._ramp)[:, None]
+        self._limiter_gain = gain
+
+        np.clip(samples * 32768, -32768, 32767, out=samples)
+        return samples.astype(np.int16).tobytes()
+
+class DSPAudioSource(discord.AudioSource):
+    """Envuelve una fuente PCM y le aplica los efectos activos frame a frame
+
+    Los cambios de efectos se notan en el siguiente frame (20 ms) sin
+    reiniciar FFmpeg; sin efectos activos el frame pasa sin tocarse.
+    """
+
+    def __init__(self, original: discord.AudioSource, effects: AudioEffects, **options):
+        self.original = original
+        self.effects = effects
+        self.processor = EffectsProcessor(effects, **options)
+
+    def read(self) -> bytes:
+        frame = self.original.read()
+        if len(frame) != FRAME_BYTES or self.effects.is_neutral():
+            return frame
+        return self.processor.process(frame)
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self) -> None:
+        self.original.cleanup()
+
+# ═══════════════════════════════════════════════════════════════
+# 🔊 VOLUMEN
+# ═══════════════════════════════════════════════════════════════
+
+class VolumeAudioSource(discord.AudioSource):
+    """Control de volumen en NumPy que sustituye a PCMVolumeTransformer (audioop)
+
+    Los cambios de volumen se reparten en rampas de como mucho 'ramp_step'
+    por frame para evitar chasquidos, y por encima del 100% se aplica una
+    saturación suave (tanh) a partir de 'soft_clip_knee' en lugar de recortar.
+    'gain' es una ganancia fija de la pista (normalización de sonoridad) que
+    se multiplica al volumen del usuario. Todos los búferes se reservan al
+    crear la fuente: en read() solo se crea el bytes final que exige el
+    codificador Opus de discord.py.
+    """
+
+    def __init__(
+        self,
+        original: discord.AudioSource,
+        volume: float = 1.0,
+        gain: float = 1.0,
+        max_volume: float = 1.5,
+        ramp_step: float = 0.25,
+        soft_clip_knee: float = 0.8
+    ):
+        self.original = original
+        self.max_volume = max_volume
+        self.ramp_step = ramp_step
+        self.soft_clip_knee = soft_clip_knee
+        self.gain = gain
+        self._volume = min(max(volume, 0.0), max_volume)
+        self._applied = self._volume * gain
+
+        self._samples = np.empty(FRAME_SAMPLES * CHANNELS, dtype=np.float32)
+        self._stereo = self._samples.reshape(FRAME_SAMPLES, CHANNELS)
+        self._scratch = np.empty_like(self._samples)
+        self._linear = np.empty_like(self._samples)
+        self._gain = np.empty((FRAME_SAMPLES, 1), dtype=np.float32)
+        self._ramp = (np.arange(1, FRAME_SAMPLES + 1, dtype=np.float32) / FRAME_SAMPLES).reshape(FRAME_SAMPLES, 1)
+        self._pcm = np.empty(FRAME_SAMPLES * CHANNELS, dtype=np.int16)
+
+    @property
+    def volume(self) -> float:
+        return self._volume
+
+    @volume.setter
+    def volume(self, value: float):
+        self._volume = min(max(value, 0.0), self.max_volume)
+
+    def _soft_clip(self):
+        # |y| = min(|x|, k) + (1 - k)·tanh(max(|x| - k, 0) / (1 - k)), con el signo de x
+        knee = self.soft_clip_knee
+        np.abs(self._samples, out=self._scratch)
+        np.minimum(self._scratch, knee, out=self._linear)
+        self._scratch -= self._linear
+        self._scratch *= 1 / (1 - knee)
+        np.tanh(self._scratch, out=self._scratch)
+        self._scratch *= 1 - knee
+        self._scratch += self._linear
+        np.copysign(self._scratch, self._samples, out=self._samples)
+
+    def read(self) -> bytes:
+        frame = self.original.read()
+        start, target = self._applied, self._volume * self.gain
+        if len(frame) != FRAME_BYTES or start == target == 1.0:
+            return frame
+
+        end = start + min(max(target - start, -self.ramp_step), self.ramp_step)
+        np.copyto(self._samples, np.frombuffer(frame, dtype=np.int16), casting='unsafe')
+        self._samples *= 1 / 32768
+        if end != start:
+            np.multiply(self._ramp, end - start, out=self._gain)
+            self._gain += start
+            self._stereo *= self._gain
+        else:
+            self._samples *= end
+        self._applied = end
+
+        if max(start, end) > 1.0:
+            self._soft_clip()
+        else:
+            np.clip(self._samples, -1.0, 1.0, out=self._samples)
+        self._samples *= 32767
+        np.copyto(self._pcm, self._samples, casting='unsafe')
+        return self._pcm.tobytes()
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self) -> None:
+        self.original.cleanup()
+
+# ═══════════════════════════════════════════════════════════════
+# 📶 BÚFER DE LECTURA ANTICIPADA
+# ═══════════════════════════════════════════════════════════════
+
+# Frame Opus de silencio (el mismo que envía discord.py) y tamaño máximo de paquete
+OPUS_SILENCE = b'\xf8\xff\xfe'
+MAX_OPUS_PACKET = 4000
+
+class BufferedAudioSource(discord.AudioSource):
+    """Lee la fuente original en un hilo propio y guarda los frames en un búfer circular
+
+    El hilo lector se adelanta hasta 'seconds' segundos, así un corte breve
+    de red (la ruta -reconnect de FFmpeg) o del disco se absorbe sin que el
+    reproductor lo note. Si aun así el búfer se vacía se entrega un frame de
+    silencio y se cuenta como underrun, en lugar de cortar la canción.
+    """
+
+    def __init__(
+        self,
+        original: discord.AudioSource,
+        seconds: float = 3.0,
+        prefill: float = 0.5,
+        startup_timeout: float = 5.0,
+        underrun_wait: float = 0.01
+    ):
+        self.original = original
+        self.capacity = max(2, int(seconds / FRAME_DURATION))
+        self.startup_timeout = startup_timeout
+        self.underrun_wait = underrun_wait
+        self.underruns = 0
+        self._opus = original.is_opus()
+        self._slot_size = MAX_OPUS_PACKET if self._opus else FRAME_BYTES
+        self._silence = OPUS_SILENCE if self._opus else bytes(FRAME_BYTES)
+        self._buffer = memoryview(bytearray(self.capacity * self._slot_size))
+        self._lengths = [0] * self.capacity
+        self._head = 0
+        self._count = 0
+        self._prefill = min(self.capacity, max(1, int(prefill / FRAME_DURATION)))
+        self._started = False
+        self._eof = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._fill, name='audio-buffer', daemon=True)
+        self._thread.start()
+
+    @property
+    def fill_level(self) -> float:
+        """Fracción del búfer ocupada (0-1)"""
+        return self._count / self.capacity
+
+    def _fill(self):
+        condition = self._condition
+        while True:
+            with condition:
+                while self._count == self.capacity and not self._closed:
+                    condition.wait()
+                if self._closed:
+                    return
+            try:
+                data = self.original.read()
+            except Exception:
+                # cleanup() puede cerrar la tubería de FFmpeg mientras se lee
+                data = b''
+            with condition:
+                if not data or self._closed or len(data) > self._slot_size:
+                    self._eof = True
+                    condition.notify_all()
+                    return
+                tail = (self._head + self._count) % self.capacity
+                start = tail * self._slot_size
+                self._buffer[start:start + len(data)] = data
+                self._lengths[tail] = len(data)
+                self._count += 1
+                condition.notify_all()
+
+    def read(self) -> bytes:
+        condition = self._condition
+        with condition:
+            if not self._started:
+                condition.wait_for(lambda: self._count >= self._prefill or self._eof, timeout=self.startup_timeout)
+                self._started = True
+            if not self._count and not self._eof:
+                condition.wait(timeout=self.underrun_wait)
+            if not self._count:
+                if self._eof:
+                    return b''
+                self.underruns += 1
+                return self._silence
+
+            start = self._head * self._slot_size
+            data = bytes(self._buffer[start:start + self._lengths[self._head]])
+            self._head = (self._head + 1) % self.capacity
+            self._count -= 1
+            condition.notify_all()
+            return data
+
+    def is_opus(self) -> bool:
+        return self._opus
+
+    def cleanup(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self.original.cleanup()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+
+# ═══════════════════════════════════════════════════════════════
+# 🔀 TRANSICIONES ENTRE PISTAS
+# ═══════════════════════════════════════════════════════════════
+
+class CrossfadeMixer(discord.AudioSource):
+    """Fuente única del reproductor que encadena las pistas sin huecos
+
+    La siguiente pista se abre antes de que termine la actual (set_next). Si
+    hay fundido configurado y ambas son PCM, los últimos segundos se mezclan
+    con una curva de potencia constante o lineal; si no, se cambia de fuente
+    en el mismo frame en que la actual se agota. on_advance(token) se llama
+    desde el hilo de audio en cuanto empieza a sonar la siguiente pista.
+
+    Si la pista actual se acaba más de 'end_tolerance' segundos antes de su
+    duración (URL caducada, conexión perdida) no se pasa a la siguiente: el
+    mezclador termina y deja la posición en interrupted_at para retomarla.
+    start_offset indica desde qué segundo empieza la primera pista.
+    """
+
+    def __init__(
+        self,
+        source: discord.AudioSource,
+        duration: Optional[float] = None,
+        crossfade: float = 0.0,
+        curve: str = 'equal_power',
+        on_advance: Optional[Callable[[Any], None]] = None,
+        start_offset: float = 0.0,
+        end_tolerance: Optional[float] = None
+    ):
+        self.current = source
+        self.current_duration = duration
+        self.crossfade = crossfade
+        self.curve = curve
+        self.on_advance = on_advance
+        self.end_tolerance = end_tolerance
+        self.interrupted_at: Optional[float] = None
+        self.frames_played = 0
+        self._start_frames = int(start_offset / FRAME_DURATION)
+        self._next = None
+        self._outgoing = None
+        self._fade_frames = 0
+        self._fade_position = 0
+        self._lock = threading.Lock()
+        # Llamadas que deben correr en el hilo de audio, antes de codificar el siguiente frame
+        self._audio_thread_calls = deque()
+
+        self._offsets = np.arange(FRAME_SAMPLES, dtype=np.float32).reshape(FRAME_SAMPLES, 1) / FRAME_SAMPLES
+        self._progress = np.empty((FRAME_SAMPLES, 1), dtype=np.float32)
+        self._gain_in = np.empty_like(self._progress)
+        self._gain_out = np.empty_like(self._progress)
+        self._incoming = np.empty((FRAME_SAMPLES, CHANNELS), dtype=np.float32)
+        self._mixed = np.empty_like(self._incoming)
+        self._pcm = np.empty((FRAME_SAMPLES, CHANNELS), dtype=np.int16)
+
+    @property
+    def position(self) -> float:
+        """Segundo de la pista actual que está sonando
+
+        Los frames de silencio enviados por un búfer vacío no cuentan: no
+        avanzaron la pista.
+        """
+        underruns = sum(stage.underruns for stage in find_stages(self.current, BufferedAudioSource))
+        return (self._start_frames + self.frames_played - underruns) * FRAME_DURATION
+
+    @property
+    def next_token(self) -> Any:
+        pending = self._next
+        return pending[2] if pending else None
+
+    def set_next(self, source: discord.AudioSource, duration: Optional[float], token: Any = None) -> bool:
+        """Deja preparada la siguiente pista; solo se encadenan fuentes del mismo tipo"""
+        with self._lock:
+            if source.is_opus() != self.current.is_opus():
+                return False
+            if self._next:
+                self._next[0].cleanup()
+            self._next = (source, duration, token)
+            return True
+
+    def clear_next(self):
+        """Descarta la siguiente pista preparada (p. ej. porque cambió la cola)"""
+        with self._lock:
+            if self._next:
+                self._next[0].cleanup()
+            self._next = None
+
+    def _fade_length(self) -> int:
+        if not self.crossfade or self.current.is_opus():
+            return 0
+        durations = [d for d in (self.current_duration, self._next[1]) if d]
+        # En canciones muy cortas el fundido no puede comerse la canción entera
+        seconds = min([self.crossfade] + [d / 3 for d in durations])
+        return int(seconds / FRAME_DURATION)
+
+    def _advance(self):
+        source, duration, token = self._next
+        self._next = None
+        self.current, self.current_duration, self.frames_played = source, duration, 0
+        self._start_frames = 0
+        if self.on_advance:
+            self.on_advance(token)
+
+    def _ended_early(self) -> bool:
+        return (
+            self.end_tolerance is not None
+            and bool(self.current_duration)
+            and self.position < self.current_duration - self.end_tolerance
+        )
+
+    def _finish_fade(self):
+        self._outgoing.cleanup()
+        self._outgoing = None
+
+    def _mix(self, incoming: bytes) -> bytes:
+        outgoing = self._outgoing.read()
+        if len(outgoing) != FRAME_BYTES or len(incoming) != FRAME_BYTES:
+            self._finish_fade()
+            return incoming
+
+        np.add(self._offsets, self._fade_position, out=self._progress)
+        self._progress *= 1 / self._fade_frames
+        if self.curve == 'linear':
+            np.copyto(self._gain_in, self._progress)
+            np.subtract(1, self._progress, out=self._gain_out)
+        else:
+            # Potencia constante: el volumen percibido no baja a mitad del fundido
+            self._progress *= np.pi / 2
+            np.sin(self._progress, out=self._gain_in)
+            np.cos(self._progress, out=self._gain_out)
+
+        np.copyto(self._incoming, np.frombuffer(incoming, dtype=np.int16).reshape(FRAME_SAMPLES, CHANNELS))
+        np.copyto(self._mixed, np.frombuffer(outgoing, dtype=np.int16).reshape(FRAME_SAMPLES, CHANNELS))
+        self._mixed *= self._gain_out
+        self._incoming *= self._gain_in
+        self._mixed += self._incoming
+        np.clip(self._mixed, -32768, 32767, out=self._mixed)
+        np.copyto(self._pcm, self._mixed, casting='unsafe')
+
+        self._fade_position += 1
+        if self._fade_position >= self._fade_frames:
+            self._finish_fade()
+        return self._pcm.tobytes()
+
+    def call_in_audio_thread(self, callback: Callable[[], None]):
+        """Ejecuta callback en el hilo de audio justo antes de leer el siguiente frame
+
+        Sirve para tocar el codificador Opus del cliente de voz sin competir
+        con el hilo que está codificando con él.
+        """
+        self._audio_thread_calls.append(callback)
+
+    def read(self) -> bytes:
+        while self._audio_thread_calls:
+            try:
+                self._audio_thread_calls.popleft()()
+            except Exception as e:
+                log_debug(f"Error en una llamada del hilo de audio: {e}", "mixer")
+        with self._lock:
+            if self._next and self._outgoing is None and self.current_duration:
+                fade_frames = self._fade_length()
+                if fade_frames and self.position >= self.current_duration - fade_frames * FRAME_DURATION:
+                    self._outgoing = self.current
+                    self._fade_frames = fade_frames
+                    self._fade_position = 0
+                    self._advance()
+
+            frame = self.current.read()
+            if not frame and self._ended_early():
+                # No encadenar la siguiente: el bot vuelve a abrir esta pista donde se cortó
+                self.interrupted_at = self.position
+                return b''
+            if not frame and self._next and self._outgoing is None:
+                # La pista terminó: la siguiente empieza en este mismo frame
+                self.current.cleanup()
+                self._advance()
+                frame = self.current.read()
+
+            if self._outgoing is not None:
+                frame = self._mix(frame)
+            if frame:
+                self.frames_played += 1
+            return frame
+
+    def is_opus(self) -> bool:
+        return self.current.is_opus()
+
+    def cleanup(self) -> None:
+        with self._lock:
+            for source in (self.current, self._outgoing, self._next[0] if self._next else None):
+                if source is not None:
+                    source.cleanup()
+            self._outgoing = None
+            self._next = None
+
+def iter_sources(source: Optional[discord.AudioSource]):
+    """Recorre una cadena de fuentes, incluidas las pistas que maneja el mezclador"""
+    if source is None:
+        return
+    yield source
+    if isinstance(source, CrossfadeMixer):
+        pending = source._next
+        children = (source.current, source._outgoing, pending[0] if pending else None)
+    else:
+        children = (getattr(source, 'original', None),)
+    for child in children:
+        yield from iter_sources(child)
+
+def find_stages(source: Optional[discord.AudioSource], stage_type: type) -> List[discord.AudioSource]:
+    """Etapas de un tipo dado (volumen, efectos...) dentro de la cadena de fuentes"""
+    return [stage for stage in iter_sources(source) if isinstance(stage, stage_type)]
@@ -1,191 +1,828 @@
 import discord
 from discord.ext import commands
 import asyncio
-import yt_dlp
 import os
 import time
 from dotenv import load_dotenv
 from audio_config import (
     get_ytdl_options, 
     get_ffmpeg_options, 
+    get_passthrough_options,
     log_debug, 
     format_duration, 
     validate_audio_url,
     ERROR_MESSAGES,
-    PERFORMANCE_CONFIG
+    PERFORMANCE_CONFIG,
+    TRACK_CACHE_CONFIG,
+    SEARCH_CACHE_CONFIG,
+    WARM_POOL_CONFIG,
+    EXTRACTION_HEALTH_CONFIG,
+    RECONNECT_CONFIG,
+    MEDIA_PROBE_CONFIG,
+    AUDIO_CACHE_CONFIG,
+    AUDIO_FILTERS,
+    DSP_CONFIG,
+    VOLUME_CONFIG,
+    CROSSFADE_CONFIG,
+    BUFFER_CONFIG,
+    RECOVERY_CONFIG,
+    ADAPTIVE_QUALITY_CONFIG,
+    AUDIO_QUALITY_PRESETS,
+    LOUDNESS_CONFIG,
+    LOUDNESS_PASSTHROUGH_TOLERANCE,
+    QUEUE_STORE_CONFIG,
+    QUEUE_SCHEDULER_CONFIG
 )
+from cache import ResolvedTrackCache, SearchCache
+from extractor import (
+    CircuitBreaker,
+    ExtractionEngine,
+    ExtractionTimeout,
+    ExtractorUnavailable,
+    SingleFlight
+)
+from media_probe import MediaProbe
+from audio_cache import AudioFileCache, MappedOpusAudio, MappedPCMAudio
+from loudness import LoudnessAnalyzer
+from audio_sources import (
+    BufferedAudioSource,
+    CrossfadeMixer,
+    DSPAudioSource,
+    VolumeAudioSource,
+    find_stages
+)
+from config import BASS_BOOST_FILTERS, BOT_CONFIG, THEMED_PLAYLISTS, get_random_song
+from warm_pool import CatalogWarmer
+from quality import QualityController
+from player import PlayerRegistry
+from queue_store import QueueStore
+from tracks import SCHEDULERS, QueueFull, Track
+from utils import MusicUtils
 
 # Cargar variables de entorno
 load_dotenv()
 
-# Cola de reproducción global
-song_queue = []
-voice_client = None
-current_song = None
-is_processing = False
 last_activity = time.time()
 
 # Usar configuración optimizada
 YTDL_OPTIONS = get_ytdl_options(debug=False)
-# Crear instancia de yt-dlp
-ydl = yt_dlp.YoutubeDL(YTDL_OPTIONS)
+# Motor de extracción: procesos yt-dlp dedicados (uno por worker)
+extraction_engine = ExtractionEngine(
+    YTDL_OPTIONS,
+    workers=PERFORMANCE_CONFIG['extraction_workers'],
+    max_pending=PERFORMANCE_CONFIG['extraction_queue_size'],
+    timeout=PERFORMANCE_CONFIG['extraction_timeout'],
+    health={k: v for k, v in EXTRACTION_HEALTH_CONFIG.items() if k != 'max_open_time'},
+    # Ante fallos sostenidos se deja de insistir con backoff exponencial
+    breaker=CircuitBreaker(
+        failure_threshold=RECONNECT_CONFIG['max_attempts'],
+        base_delay=RECONNECT_CONFIG['delay_between_attempts'],
+        max_delay=EXTRACTION_HEALTH_CONFIG['max_open_time'],
+        exponential_backoff=RECONNECT_CONFIG['exponential_backoff']
+    )
+)
+# Extracciones en curso, compartidas entre peticiones idénticas
+inflight_extractions = SingleFlight()
+# Búsquedas planas: solo id, título, duración y canal de cada resultado
+FLAT_EXTRACTION_OPTIONS = {'extract_flat': 'in_playlist'}
+# Caché de pistas resueltas (memoria + SQLite)
+track_cache = ResolvedTrackCache(**TRACK_CACHE_CONFIG)
+# Caché de resultados de búsqueda (consultas normalizadas)
+search_cache = SearchCache(**SEARCH_CACHE_CONFIG)
+# Sondeo de enlaces directos (.mp3, .ogg...) que FFmpeg reproduce sin yt-dlp
+media_probe = MediaProbe(**MEDIA_PROBE_CONFIG)
+# Caché de audio en disco: las repeticiones se leen de archivos locales
+audio_cache = AudioFileCache(**AUDIO_CACHE_CONFIG)
+# Ganancia de normalización por pista, medida una sola vez en segundo plano
+loudness = LoudnessAnalyzer(**LOUDNESS_CONFIG)
+# Colas guardadas en SQLite para sobrevivir a los reinicios
+queue_store = QueueStore(**QUEUE_STORE_CONFIG)
+
+def restore_player(player):
+    """Recupera la cola guardada de un servidor la primera vez que se usa su reproductor"""
+    state = queue_store.load(player.guild_id)
+    if not state or not state['tracks']:
+        return
+    player.queue.extend(state['tracks'])
+    player.loop_mode = state['loop_mode']
+    player.volume = state['volume']
+    if state['position']:
+        player.resume_from = (state['tracks'][0], state['position'])
+    if state['text_channel_id']:
+        player.text_channel = bot.get_channel(state['text_channel_id'])
+    log_debug(f"Cola restaurada en {player.guild_id}: {len(state['tracks'])} canciones", "queue_store")
+
+def save_state(player):
+    """Programa el guardado de la cola del servidor (agrupado, fuera del event loop)"""
+    queue_store.mark_dirty(player)
+
+# Reproductor de cada servidor: cola, conexión de voz, efectos y volumen propios
+players = PlayerRegistry(
+    on_create=restore_player,
+    bass_levels=BASS_BOOST_FILTERS,
+    crossfade=CROSSFADE_CONFIG['duration'],
+    crossfade_curve=CROSSFADE_CONFIG['curve'],
+    queue_options={
+        **QUEUE_SCHEDULER_CONFIG,
+        'max_size': min(PERFORMANCE_CONFIG['max_queue_size'], BOT_CONFIG['max_queue_size'])
+    }
+)
 
 # Crear instancia del bot
 intents = discord.Intents.default()
 intents.message_content = True
 intents.guilds = True
 intents.voice_states = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+class NanaliBot(commands.Bot):
+    """Bot que cierra sus recursos asíncronos al desconectarse"""
+
+    # on_ready se repite en cada reconexión: las colas guardadas solo se retoman una vez
+    restored = False
+
+    async def close(self):
+        # Antes de desconectar la voz: el cierre no debe guardarse como cola terminada
+        queue_store.shutdown(players)
+        quality.stop()
+        await media_probe.close()
+        await super().close()
+
+bot = NanaliBot(command_prefix='!', intents=intents)
+
+def get_cache_key(url):
+    """Obtiene el ID canónico del video para usarlo como clave de caché"""
+    if MusicUtils.validate_youtube_url(url):
+        return MusicUtils.extract_video_id(url)
+    return None
+
+def get_request_key(query):
+    """Normaliza una URL o búsqueda para agrupar extracciones idénticas"""
+    query = query.strip()
+    video_id = get_cache_key(query)
+    if video_id:
+        return f"youtube:{video_id}"
+    if query.startswith(('http://', 'https://')):
+        return query
+    return ' '.join(query.split()).casefold()
+
+async def extract_shared(query, flat=False):
+    """Extrae con el motor, compartiendo el resultado con peticiones idénticas en curso"""
+    key = get_request_key(query)
+    overrides = None
+    if flat:
+        key = f"flat:{key}"
+        overrides = FLAT_EXTRACTION_OPTIONS
+    return await inflight_extractions.do(
+        key,
+        lambda: extraction_engine.extract(query, overrides=overrides)
+    )
+
+async def search_entries(query, limit):
+    """Busca en YouTube con extracción plana: solo metadatos, sin resolver streams"""
+    cached = search_cache.get(query, limit)
+    if cached is not None:
+        log_debug(f"Acierto de caché de búsqueda: {query[:50]}", "search")
+        return cached
+    
+    data = await extract_shared(f"ytsearch{limit}:{query}", flat=True)
+    if not data or not data.get('entries'):
+        return []
+    return search_cache.put(query, limit, [entry for entry in data['entries'] if entry and entry.get('id')])
+
+def get_track_key(data):
+    """Obtiene la clave de caché a partir de los datos extraídos por yt-dlp"""
+    if not data.get('id'):
+        return None
+    extractor = data.get('extractor_key', '')
+    if extractor == 'Youtube':
+        return data['id']
+    return f"{extractor.lower()}:{data['id']}"
 
 # Función para obtener la fuente de audio usando yt-dlp
-async def get_audio_source(url):
+async def get_audio_source(url, cache_key=None, refresh=False):
+    """Resuelve una URL o búsqueda en un diccionario con la URL de audio y sus metadatos"""
     global last_activity
     last_activity = time.time()
     
-    loop = asyncio.get_running_loop()
     start_time = time.time()
     
+    cached = None if refresh else track_cache.get(cache_key or get_cache_key(url))
+    if cached:
+        log_debug(f"Acierto de caché para: {cached['title']}", "extraction")
+        return cached
+    
+    # Los enlaces directos a archivos van a FFmpeg sin pasar por el extractor
+    if MediaProbe.is_candidate(url):
+        track = await media_probe.probe(url)
+        if track:
+            log_debug(f"Enlace directo ({track['content_type']}) en {time.time() - start_time:.2f}s: {track['title']}", "extraction")
+            return track
+    
     try:
         log_debug(f"Iniciando extracción para: {url[:50]}...", "extraction")
         
-        # Extraer información sin descargar con timeout
-        data = await asyncio.wait_for(
-            loop.run_in_executor(None, lambda: ydl.extract_info(url, download=False)),
-            timeout=PERFORMANCE_CONFIG['extraction_timeout']
-        )
+        # Extraer información sin descargar en un worker dedicado (con timeout)
+        data = await extract_shared(url)
         
         # Si es una playlist, tomar el primer elemento
         if 'entries' in data:
             if not data['entries']:
                 log_debug("La playlist está vacía", "extraction")
-                return None, None, None, None
+                return None
             data = data['entries'][0]
         
         # Verificar que tenemos los datos necesarios
         if not data:
             log_debug("No se pudieron extraer datos del video", "extraction")
-            return None, None, None, None
-            
-        audio_url = data.get('url')
-        title = data.get('title', 'Título desconocido')
-        duration = data.get('duration')
-        uploader = data.get('uploader', 'Canal desconocido')
+            return None
+        
+        track = {
+            'url': data.get('url'),
+            'title': data.get('title') or 'Título desconocido',
+            'duration': data.get('duration'),
+            'uploader': data.get('uploader') or 'Canal desconocido',
+            'webpage_url': data.get('webpage_url') or url,
+            'cache_key': get_track_key(data),
+            'acodec': data.get('acodec')
+        }
         
         # Verificar que tenemos una URL de audio válida
-        if not validate_audio_url(audio_url):
+        if not validate_audio_url(track['url']):
             log_debug("URL de audio no válida", "extraction")
-            return None, None, None, None
+            return None
+        
+        track_cache.put(track['cache_key'], track)
         
         extraction_time = time.time() - start_time
-        log_debug(f"Extracción exitosa en {extraction_time:.2f}s: {title}", "extraction")
+        log_debug(f"Extracción exitosa en {extraction_time:.2f}s: {track['title']}", "extraction")
         
-        return audio_url, title, duration, uploader
+        return track
         
-    except asyncio.TimeoutError:
-        log_debug(f"Timeout en extracción después de {PERFORMANCE_CONFIG['extraction_timeout']}s", "extraction")
-        return None, None, None, None
+    except ExtractionTimeout as e:
+        log_debug(f"Timeout en extracción: {e}", "extraction")
+        return None
+    except ExtractorUnavailable as e:
+        log_debug(f"Extractor no disponible ({e.retry_after:.0f}s): {e}", "extraction")
+        return None
     except Exception as e:
         log_debug(f"Error en extracción: {e}", "extraction")
-        return None, None, None, None
+        return None
+
+def can_passthrough(player, stream, gain_db=0.0):
+    """Indica si el audio puede enviarse sin decodificar: Opus y sin volumen ni efectos"""
+    return (
+        PERFORMANCE_CONFIG['opus_passthrough']
+        and stream.get('acodec') == 'opus'
+        and player.volume == 100
+        and abs(gain_db) < LOUDNESS_PASSTHROUGH_TOLERANCE
+        and player.effects.is_neutral()
+        and not player.crossfade_seconds
+    )
+
+def buffered(source):
+    """Envuelve una fuente FFmpeg en el búfer de lectura anticipada"""
+    if not BUFFER_CONFIG['enabled']:
+        return source
+    return BufferedAudioSource(source, **{k: v for k, v in BUFFER_CONFIG.items() if k != 'enabled'})
+
+def build_audio_source(player, stream, cache_key=None, start=0.0):
+    """Crea la fuente de audio para una URL resuelta
+
+    En modo de paso directo FFmpeg solo copia los paquetes Opus; si hay que
+    cambiar el volumen o aplicar efectos, se decodifica a PCM. Las canciones
+    de la caché de audio se leen del archivo local mapeado en memoria.
+    Todo lo que pasa por FFmpeg se lee con antelación en un hilo aparte.
+    start > 0 empieza la pista en ese segundo (al retomar tras un corte).
+    """
+    local_path = stream.get('local_path')
+    gain_db = loudness.get_gain(cache_key)
+    # El lector de Ogg mapeado no sabe buscar: un archivo local a mitad se decodifica con FFmpeg
+    if can_passthrough(player, stream, gain_db) and not (local_path and start):
+        log_debug("Paso directo de Opus (sin recodificar)", "playback")
+        if local_path:
+            return MappedOpusAudio(local_path)
+        return buffered(discord.FFmpegOpusAudio(stream['url'], codec='copy', **get_passthrough_options(start)))
+    
+    if local_path:
+        source = MappedPCMAudio(local_path, get_ffmpeg_options(quality.level, apply_volume=False), start)
+    else:
+        source = discord.FFmpegPCMAudio(stream['url'], **get_ffmpeg_options(quality.level, apply_volume=False, start=start))
+    # El búfer va antes de los efectos para que los cambios se oigan al instante
+    source = DSPAudioSource(buffered(source), player.effects, **DSP_CONFIG)
+    return VolumeAudioSource(
+        source,
+        volume=player.volume / 100,
+        gain=10 ** (gain_db / 20),
+        **VOLUME_CONFIG
+    )
+
+async def resolve_stream(song_info):
+    """Obtiene una URL de audio vigente para una canción de la cola"""
+    return await get_audio_source(song_info.webpage_url, cache_key=song_info.cache_key)
+
+async def open_track(player, song_info):
+    """Obtiene la fuente de audio de una canción: archivo de la caché o URL resuelta
+
+    Returns:
+        tuple: (stream, local_path); local_path es None si no está en caché
+    """
+    local_path = audio_cache.get(song_info.cache_key)
+    if local_path:
+        # Repetición: el Ogg/Opus local evita resolver y descargar de nuevo
+        return {'url': local_path, 'acodec': 'opus', 'local_path': local_path}, local_path
+    
+    # Resolver la URL justo antes de reproducir (normalmente ya pre-resuelta)
+    stream = await resolve_stream(song_info)
+    
+    # Verificar que la URL de audio es válida
+    if not stream or not validate_audio_url(stream['url']):
+        raise Exception(ERROR_MESSAGES['no_audio_url'])
+    return stream, None
+
+async def prefetch_next(player, song_info, started_at):
+    """Resuelve la siguiente canción de la cola poco antes de que termine la actual"""
+    if song_info.duration:
+        elapsed = time.time() - started_at
+        delay = song_info.duration - PERFORMANCE_CONFIG['prefetch_lead_time'] - elapsed
+        if delay > 0:
+            await asyncio.sleep(delay)
+    
+    next_song = player.upcoming()
+    if next_song is None or next_song.cache_key in audio_cache:
+        return
+    log_debug(f"Pre-resolviendo siguiente canción: {next_song.title}", "prefetch")
+    await resolve_stream(next_song)
+
+async def warm_entry(entry, refresh=False):
+    """Resuelve (o refresca) la URL de audio de un resultado de búsqueda"""
+    url = f"https://www.youtube.com/watch?v={entry['id']}"
+    return await get_audio_source(url, cache_key=entry['id'], refresh=refresh)
 
-async def connect_to_voice(ctx):
-    global voice_client
+# Calidad de los streams según la carga del proceso
+quality = QualityController(
+    AUDIO_QUALITY_PRESETS,
+    voice_clients=lambda: bot.voice_clients,
+    **ADAPTIVE_QUALITY_CONFIG
+)
+
+# Precalentamiento de las playlists temáticas de config.py
+catalog_warmer = CatalogWarmer(
+    THEMED_PLAYLISTS,
+    search=search_entries,
+    resolve=warm_entry,
+    track_cache=track_cache,
+    is_busy=lambda: extraction_engine.pending > 0,
+    concurrency=WARM_POOL_CONFIG['concurrency'],
+    refresh_interval=WARM_POOL_CONFIG['refresh_interval'],
+    refresh_margin=WARM_POOL_CONFIG['refresh_margin']
+)
+
+def schedule_prefetch(player, song_info):
+    """Programa la pre-resolución de la siguiente canción, cancelando la anterior"""
+    if player.prefetch_task and not player.prefetch_task.done():
+        player.prefetch_task.cancel()
+    player.prefetch_task = bot.loop.create_task(prefetch_next(player, song_info, time.time()))
+
+async def connect_to_voice(ctx, player):
     channel = ctx.author.voice.channel
     if not channel:
         await ctx.send("¡Únete a un canal de voz primero!")
         return None
+    voice_client = player.voice_client
     if voice_client is None or not voice_client.is_connected():
         try:
-            voice_client = await channel.connect()
+            player.voice_client = await channel.connect()
         except discord.ClientException:
             await ctx.send("Ya estoy conectado a un canal de voz.")
-            return voice_client
+            player.voice_client = ctx.guild.voice_client
         except discord.opus.OpusNotLoaded:
             await ctx.send("La librería opus no está cargada. Asegúrate de tener libopus instalado.")
             return None
     elif voice_client.channel != channel:
         await voice_client.move_to(channel)
-    return voice_client
+    return player.voice_client
 
-async def play_next(ctx):
-    global song_queue, voice_client, current_song
-    
-    if not song_queue:
-        current_song = None
-        if voice_client and voice_client.is_connected():
-            embed = discord.Embed(
-                title="🎵 Reproducción terminada",
-                description="¡He terminado de reproducir todas las canciones!\n¿Quieres añadir más música?",
-                color=0x32cd32
-            )
-            file = discord.File("nanali.jpg", filename="nanali.jpg")
-            embed.set_thumbnail(url="attachment://nanali.jpg")
-            embed.set_footer(text="Usa !p <url> para añadir más música • Nanali Music Bot", icon_url="attachment://nanali.jpg")
-            await ctx.send(file=file, embed=embed)
-        return
+async def send_now_playing(player, song_info):
+    """Anuncia la canción que acaba de empezar"""
+    embed = discord.Embed(
+        title="🎵 Reproduciendo ahora",
+        description=f"**{song_info.title}**",
+        color=0x9932cc
+    )
+    embed.add_field(name="👤 Canal", value=song_info.uploader, inline=True)
+    embed.add_field(name="⏱️ Duración", value=format_duration(song_info.duration), inline=True)
+    embed.add_field(name="📋 En cola", value=str(len(player.queue)), inline=True)
     
-    # Obtener la siguiente canción
-    song_info = song_queue.pop(0)
-    current_song = song_info
+    # Añadir imagen de Nanali
+    file = discord.File("nanali.jpg", filename="nanali.jpg")
+    embed.set_thumbnail(url="attachment://nanali.jpg")
+    embed.set_footer(text=f"Solicitado por {song_info.requester} • Nanali Music Bot", icon_url="attachment://nanali.jpg")
     
-    if voice_client is None or not voice_client.is_connected():
-        voice_client = await connect_to_voice(ctx)
-        if voice_client is None:
-            return
+    await player.text_channel.send(file=file, embed=embed)
+
+async def start_track(player, song_info, stream, local_path, announce=True):
+    """Trabajo común al empezar una pista: prefetch, caché de audio, transición y aviso"""
+    schedule_prefetch(player, song_info)
+    
+    # Sonoridad: medir el archivo en caché (o en cuanto se guarde, aunque sea al repetirse);
+    # la URL solo si la pista nunca va a cachearse, para no descargarla otra vez
+    cache_key, duration = song_info.cache_key, song_info.duration
+    if local_path:
+        loudness.schedule(cache_key, local_path, duration)
+    elif not audio_cache.schedule_store(
+        cache_key, stream, duration,
+        on_stored=lambda path: loudness.schedule(cache_key, path, duration)
+    ) and not audio_cache.is_cacheable(cache_key, duration):
+        loudness.schedule(cache_key, stream['url'], duration)
+    schedule_transition(player, song_info)
+    if announce:
+        await send_now_playing(player, song_info)
+
+async def prepare_transition(player, target_mixer, song_info):
+    """Abre la siguiente canción poco antes del final para encadenarla sin hueco
+
+    La fuente se crea unos segundos antes: FFmpeg arranca, sondea y llena el
+    búfer de lectura, y luego queda bloqueado en la tubería (sin consumir
+    CPU ni red) hasta que el mezclador empieza a leerla.
+    """
+    delay = song_info.duration - player.crossfade_seconds - CROSSFADE_CONFIG['transition_lead'] - target_mixer.position
+    if delay > 0:
+        await asyncio.sleep(delay)
+    
+    next_song = player.upcoming()
+    if target_mixer is not player.mixer or next_song is None:
+        return
+    try:
+        stream, local_path = await open_track(player, next_song)
+    except Exception as e:
+        # play_next lo reintentará (y avisará) cuando termine la canción actual
+        log_debug(f"No se pudo preparar la transición: {e}", "transition")
+        return
     
-    # Usar configuración optimizada de FFmpeg
-    FFMPEG_OPTIONS = get_ffmpeg_options('medium')
+    # La cola pudo cambiar mientras se resolvía
+    if target_mixer is not player.mixer or player.upcoming() is not next_song:
+        return
+    source = build_audio_source(player, stream, next_song.cache_key)
+    if target_mixer.set_next(source, next_song.duration, (next_song, stream, local_path)):
+        log_debug(f"Transición preparada: {next_song.title}", "transition")
+    else:
+        # Paso directo Opus <-> PCM: no se pueden encadenar en la misma fuente,
+        # pero FFmpeg ya arrancó y llenó el búfer; play_next la usará tal cual
+        player.discard_prepared()
+        player.prepared_track = (next_song, stream, local_path, source)
+        log_debug(f"Siguiente canción abierta en espera: {next_song.title}", "transition")
+
+def recheck_prepared(player):
+    """Reabre la siguiente canción ya abierta si cambió el paso directo Opus/PCM
+
+    Un cambio de volumen o efectos puede hacer que la pista preparada (en el
+    mezclador o en espera) ya no deba ir en paso directo, o al revés.
+    """
+    stale = False
+    if player.prepared_track is not None:
+        song_info, stream, _, source = player.prepared_track
+        if source.is_opus() != can_passthrough(player, stream, loudness.get_gain(song_info.cache_key)):
+            player.discard_prepared()
+            stale = True
+    token = player.mixer.next_token if player.mixer is not None else None
+    if token is not None:
+        song_info, stream, _ = token
+        # La pista encadenada tiene el mismo formato que la actual
+        if player.mixer.is_opus() != can_passthrough(player, stream, loudness.get_gain(song_info.cache_key)):
+            player.mixer.clear_next()
+            stale = True
+    if stale and player.current_song is not None:
+        schedule_transition(player, player.current_song)
+
+def schedule_transition(player, song_info):
+    """Programa la preparación de la siguiente canción, cancelando la anterior"""
+    if player.transition_task and not player.transition_task.done():
+        player.transition_task.cancel()
+    if player.mixer is not None and song_info.duration:
+        player.transition_task = bot.loop.create_task(prepare_transition(player, player.mixer, song_info))
+
+def refresh_transition(player):
+    """Rehace la transición si la siguiente canción de la cola ya no es la preparada"""
+    if player.mixer is None or player.current_song is None:
+        return
+    pending = player.mixer.next_token or player.prepared_track
+    if pending is not None and player.upcoming() is pending[0]:
+        return
+    player.mixer.clear_next()
+    player.discard_prepared()
+    schedule_transition(player, player.current_song)
+
+async def track_advanced(player, token):
+    """El mezclador pasó a la canción preparada: actualizar la cola y avisar"""
+    song_info, stream, local_path = token
+    player.recovery_attempts = 0
+    finished = player.current_song
+    if player.upcoming() is song_info:
+        player.advance()
+    else:
+        player.current_song = song_info
+    save_state(player)
+    # Una canción repetida no se vuelve a anunciar
+    await start_track(player, song_info, stream, local_path, announce=song_info is not finished)
+
+def play_source(player, source, song_info, start=0.0):
+    """Pone a sonar una fuente en un mezclador nuevo; al terminar se pasa a play_next"""
     
     def after_playing(error):
         if error:
             print(f"Error durante la reproducción: {error}")
-        asyncio.run_coroutine_threadsafe(play_next(ctx), bot.loop)
-    
+        asyncio.run_coroutine_threadsafe(play_next(player), bot.loop)
+    
+    def on_advance(token):
+        # Se llama desde el hilo de audio al empezar la pista preparada
+        asyncio.run_coroutine_threadsafe(track_advanced(player, token), bot.loop)
+    
+    player.mixer = CrossfadeMixer(
+        source,
+        duration=song_info.duration,
+        crossfade=player.crossfade_seconds,
+        curve=player.crossfade_curve,
+        on_advance=on_advance,
+        start_offset=start,
+        end_tolerance=RECOVERY_CONFIG['end_tolerance'] if RECOVERY_CONFIG['enabled'] else None
+    )
+    # Bitrate y paso de banda del codificador según la carga actual
+    voice_client = player.voice_client
+    voice_client.play(player.mixer, after=after_playing, **quality.play_kwargs(voice_client.channel.bitrate))
+
+async def resume_track(player, song_info, position):
+    """Vuelve a abrir la canción actual donde se cortó, con una URL recién resuelta"""
+    player.recovery_attempts += 1
+    start = max(0.0, position - RECOVERY_CONFIG['rewind'])
+    log_debug(f"Corte en {song_info.title} a los {position:.0f}s (intento {player.recovery_attempts})", "recovery")
+    await player.text_channel.send(ERROR_MESSAGES['stream_interrupted'].format(title=song_info.title, position=format_duration(int(start))))
+    
+    # La URL anterior probablemente caducó: saltarse la caché de pistas
+    stream = await get_audio_source(song_info.webpage_url, cache_key=song_info.cache_key, refresh=True)
+    if not stream or not validate_audio_url(stream['url']):
+        raise Exception(ERROR_MESSAGES['no_audio_url'])
+    
+    play_source(player, build_audio_source(player, stream, song_info.cache_key, start=start), song_info, start)
+    schedule_transition(player, song_info)
+    save_state(player)
+    log_debug(f"Reproducción retomada en {start:.0f}s: {song_info.title}", "recovery")
+
+async def play_next(player):
+    """Pasa a la siguiente canción (o retoma la actual tras un corte)
+
+    Mientras se resuelve y abre la pista no suena nada, así que el
+    reproductor se marca ocupado todo ese tiempo: un !play simultáneo no
+    debe creer que está libre y arrancar un segundo voice_client.play().
+    """
+    player.is_processing = True
     try:
-        # Verificar que la URL de audio es válida
-        if not validate_audio_url(song_info['url']):
-            raise Exception(ERROR_MESSAGES['no_audio_url'])
-            
-        log_debug(f"Intentando reproducir: {song_info['title']}", "playback")
-        log_debug(f"URL de audio: {song_info['url'][:100]}...", "playback")
-        
-        source = discord.FFmpegPCMAudio(song_info['url'], **FFMPEG_OPTIONS)
-        voice_client.play(source, after=after_playing)
-        
-        # Crear embed para mostrar información de la canción
+        await advance_playback(player)
+    finally:
+        player.is_processing = False
+
+async def advance_playback(player):
+    # ¿Terminó la canción por un corte y no porque acabara?
+    interrupted_at = player.mixer.interrupted_at if player.mixer is not None else None
+    player.mixer = None
+    if (
+        interrupted_at is not None and player.current_song is not None
+        and player.recovery_attempts < RECOVERY_CONFIG['max_attempts']
+        and player.is_connected()
+    ):
+        try:
+            await resume_track(player, player.current_song, interrupted_at)
+            return
+        except Exception as e:
+            log_debug(f"No se pudo retomar la canción: {e}", "recovery")
+    player.recovery_attempts = 0
+    
+    if not player.is_connected():
+        # Sin conexión de voz no hay dónde sonar; la cola se conserva
+        player.current_song = None
+        save_state(player)
+        return
+    
+    # Obtener la siguiente canción (la misma si se repite, la terminada al final si se repite la cola)
+    finished = player.current_song
+    song_info = player.advance()
+    if song_info is None:
+        player.discard_prepared()
+        save_state(player)
         embed = discord.Embed(
-            title="🎵 Reproduciendo ahora",
-            description=f"**{song_info['title']}**",
-            color=0x9932cc
+            title="🎵 Reproducción terminada",
+            description="¡He terminado de reproducir todas las canciones!\n¿Quieres añadir más música?",
+            color=0x32cd32
         )
-        embed.add_field(name="👤 Canal", value=song_info['uploader'], inline=True)
-        embed.add_field(name="⏱️ Duración", value=format_duration(song_info['duration']), inline=True)
-        embed.add_field(name="📋 En cola", value=str(len(song_queue)), inline=True)
-        
-        # Añadir imagen de Nanali
         file = discord.File("nanali.jpg", filename="nanali.jpg")
         embed.set_thumbnail(url="attachment://nanali.jpg")
-        embed.set_footer(text=f"Solicitado por {song_info['requester']} • Nanali Music Bot", icon_url="attachment://nanali.jpg")
-        
-        await ctx.send(file=file, embed=embed)
-        log_debug(f"Reproducción iniciada exitosamente: {song_info['title']}", "playback")
+        embed.set_footer(text="Usa !p <url> para añadir más música • Nanali Music Bot", icon_url="attachment://nanali.jpg")
+        await player.text_channel.send(file=file, embed=embed)
+        return
+    
+    # Una cola restaurada retoma su primera canción donde se quedó
+    start = player.resume_from[1] if player.resume_from and player.resume_from[0] is song_info else 0.0
+    player.resume_from = None
+    save_state(player)
+    
+    try:
+        prepared = player.take_prepared(song_info)
+        if prepared:
+            # FFmpeg ya está abierto y con el búfer lleno: sin latencia de arranque
+            stream, local_path, source = prepared
+            log_debug(f"Usando la canción abierta en espera: {song_info.title}", "playback")
+        else:
+            stream, local_path = await open_track(player, song_info)
+            
+            log_debug(f"Intentando reproducir: {song_info.title}", "playback")
+            log_debug(f"URL de audio: {stream['url'][:100]}...", "playback")
+            
+            source = build_audio_source(player, stream, song_info.cache_key, start=start)
+        play_source(player, source, song_info, start)
+        await start_track(player, song_info, stream, local_path, announce=song_info is not finished)
+        log_debug(f"Reproducción iniciada exitosamente: {song_info.title}", "playback")
         
     except Exception as e:
         log_debug(f"Error crítico al reproducir: {e}", "playback")
+        if extraction_engine.breaker.is_open:
+            # El extractor está caído: no vaciar la cola, reintentar cuando se pueda
+            player.queue.push_front(song_info)
+            player.current_song = None
+            save_state(player)
+            retry_after = extraction_engine.breaker.retry_after()
+            await player.text_channel.send(ERROR_MESSAGES['extractor_unavailable'].format(seconds=int(retry_after) + 1))
+            await asyncio.sleep(retry_after)
+            if player.is_connected() and not player.is_playing():
+                await advance_playback(player)
+            return
         embed = discord.Embed(
             title="❌ Error de reproducción",
-            description=f"No pude reproducir **{song_info['title']}**.\n\n**Error:** {str(e)[:100]}\n\nSaltando a la siguiente canción...",
+            description=f"No pude reproducir **{song_info.title}**.\n\n**Error:** {str(e)[:100]}\n\nSaltando a la siguiente canción...",
             color=0xff4500
         )
         file = discord.File("nanali.jpg", filename="nanali.jpg")
         embed.set_thumbnail(url="attachment://nanali.jpg")
         embed.set_footer(text="Continuando con la siguiente • Nanali Music Bot", icon_url="attachment://nanali.jpg")
+        await player.text_channel.send(file=file, embed=embed)
+        # No repetir una canción que no se puede reproducir
+        player.current_song = None
+        await advance_playback(player)
+
+def song_from_entry(entry, requester):
+    """Crea una canción de la cola a partir de un resultado plano (búsqueda o playlist)
+
+    requester es el miembro que la pidió: su nombre se muestra y su ID cuenta para los cupos.
+    """
+    ie_key = entry.get('ie_key') or 'Youtube'
+    if ie_key == 'Youtube':
+        webpage_url = f"https://www.youtube.com/watch?v={entry['id']}"
+        cache_key = entry['id']
+    else:
+        webpage_url = entry.get('url')
+        cache_key = f"{ie_key.lower()}:{entry['id']}"
+    return Track(
+        title=entry.get('title') or 'Título desconocido',
+        duration=entry.get('duration'),
+        uploader=entry.get('uploader') or entry.get('channel') or 'Canal desconocido',
+        requester=requester.display_name,
+        webpage_url=webpage_url,
+        cache_key=cache_key,
+        requester_id=requester.id
+    )
+
+def is_playable_entry(entry):
+    """Descarta entradas de playlist borradas o privadas"""
+    return bool(
+        entry and entry.get('id') and entry.get('url')
+        and entry.get('title') not in ('[Private video]', '[Deleted video]')
+    )
+
+async def start_playback(ctx, player):
+    """Conecta al canal de voz del autor y arranca la cola si no está sonando nada"""
+    if not player.is_idle():
+        return
+    if await connect_to_voice(ctx, player) is not None:
+        await play_next(player)
+
+async def import_playlist(ctx, player, url, processing_msg):
+    """Importa una playlist por páginas, encolando cada página en cuanto llega
+    
+    Cada página (playlist_items) es una extracción completa: yt-dlp vuelve a
+    recorrer la playlist desde el principio hasta la página pedida, así que el
+    coste total crece con el número de páginas. Se acepta a cambio de liberar
+    el worker entre páginas y empezar a sonar sin esperar a la playlist entera
+    (una extracción perezosa no puede compartirse con el proceso del worker).
+    
+    Devuelve (título, añadidas, truncada, error); error es el mensaje a mostrar
+    si una página falló después de haber añadido canciones.
+    """
+    page_size = PERFORMANCE_CONFIG['playlist_page_size']
+    requester = ctx.author
+    playlist_title = None
+    added = 0
+    truncated = False
+    error = None
+    playback_started = False
+    start = 1
+    
+    while True:
+        # Cupo de la cola del servidor y de quien importa la playlist
+        room = player.queue.room_for(requester.id)
+        if room <= 0:
+            truncated = True
+            break
+        
+        # Cada página es una extracción corta: el worker queda libre entre páginas
+        end = start + min(page_size, room) - 1
+        try:
+            data = await extraction_engine.extract(url, overrides={
+                **FLAT_EXTRACTION_OPTIONS,
+                'noplaylist': False,
+                'playlist_items': f"{start}-{end}"
+            })
+        except Exception as e:
+            # Sin nada encolado el fallo es de la petición entera
+            if not added:
+                raise
+            log_debug(f"Fallo en la página {start}-{end} de la playlist: {e}", "playlist")
+            if isinstance(e, ExtractorUnavailable):
+                error = ERROR_MESSAGES['extractor_unavailable'].format(seconds=int(e.retry_after) + 1)
+            elif extraction_engine.breaker.is_open:
+                retry_after = int(extraction_engine.breaker.retry_after()) + 1
+                error = ERROR_MESSAGES['extractor_unavailable'].format(seconds=retry_after)
+            else:
+                error = f"❌ No pude leer el resto de la playlist:\n```{str(e)[:200]}```"
+            break
+        entries = data.get('entries') or []
+        playlist_title = playlist_title or data.get('title')
+        
+        try:
+            for entry in entries:
+                if is_playable_entry(entry):
+                    player.queue.enqueue(song_from_entry(entry, requester))
+                    added += 1
+        except QueueFull:
+            # Otras peticiones llenaron la cola mientras se extraía la página
+            truncated = True
+        save_state(player)
+        
+        await processing_msg.edit(content=f"📥 Importando **{playlist_title or 'playlist'}**... ({added} canciones por ahora)")
+        # La reproducción empieza con la primera página que aporta canciones
+        if added and not playback_started:
+            playback_started = True
+            await start_playback(ctx, player)
+        
+        if truncated or len(entries) < end - start + 1:
+            break
+        start = end + 1
+    
+    return playlist_title, added, truncated, error
+
+
+async def enqueue_song(ctx, song_info, processing_msg=None):
+    """Añade una canción a la cola, lo confirma y arranca la reproducción si hace falta"""
+    player = players.get(ctx.guild)
+    player.text_channel = ctx.channel
+    
+    # Añadir a la cola, si caben más canciones del servidor y de quien la pide
+    try:
+        player.queue.enqueue(song_info)
+    except QueueFull as e:
+        if processing_msg:
+            await processing_msg.edit(content=f"❌ {e}")
+        else:
+            await ctx.send(f"❌ {e}")
+        return
+    save_state(player)
+    
+    # Si ya pasó el momento de pre-resolver, resolver la nueva siguiente canción ahora
+    if len(player.queue) == 1 and player.prefetch_task and player.prefetch_task.done():
+        player.prefetch_task = bot.loop.create_task(resolve_stream(song_info))
+    refresh_transition(player)
+    
+    # Crear embed de confirmación
+    embed = discord.Embed(
+        title="✅ Añadido a la cola",
+        description=f"**{song_info.title}**",
+        color=0x00ff7f
+    )
+    embed.add_field(name="👤 Canal", value=song_info.uploader, inline=True)
+    embed.add_field(name="⏱️ Duración", value=format_duration(song_info.duration), inline=True)
+    embed.add_field(name="📍 Posición en cola", value=str(len(player.queue)), inline=True)
+    
+    # Añadir imagen de Nanali
+    file = discord.File("nanali.jpg", filename="nanali.jpg")
+    embed.set_thumbnail(url="attachment://nanali.jpg")
+    embed.set_footer(text=f"Solicitado por {song_info.requester} • Nanali Music Bot", icon_url="attachment://nanali.jpg")
+    
+    if processing_msg:
+        await processing_msg.edit(content="", embed=embed, attachments=[file])
+    else:
         await ctx.send(file=file, embed=embed)
-        await play_next(ctx)
+    
+    # Solo iniciar reproducción si no hay nada reproduciéndose
+    await start_playback(ctx, player)
 
 @bot.command(name="play", aliases=['p'])
 async def play_command(ctx, *, url: str):
-    global song_queue, voice_client, is_processing
     
     # Verificar si el usuario está en un canal de voz
     if not ctx.author.voice:
@@ -196,14 +833,49 @@ async def play_command(ctx, *, url: str):
     processing_msg = await ctx.send("🔍 Procesando tu solicitud...")
     
     try:
+        if MusicUtils.is_playlist_url(url):
+            player = players.get(ctx.guild)
+            player.text_channel = ctx.channel
+            try:
+                playlist_title, added, truncated, error = await import_playlist(ctx, player, url, processing_msg)
+            except ExtractorUnavailable as e:
+                await processing_msg.edit(content=ERROR_MESSAGES['extractor_unavailable'].format(seconds=int(e.retry_after) + 1))
+                return
+            if not added:
+                await processing_msg.edit(content="❌ No encontré canciones reproducibles en esa playlist.")
+                return
+            
+            embed = discord.Embed(
+                title="📥 Playlist añadida",
+                description=f"**{playlist_title or 'Playlist'}**\n\nHe añadido **{added} canciones** a la cola.",
+                color=0x00ff7f
+            )
+            if truncated:
+                embed.add_field(
+                    name="⚠️ Cola llena",
+                    value=f"Límite alcanzado: {player.queue.max_size} canciones por servidor, {player.queue.max_per_user} por persona",
+                    inline=False
+                )
+            if error:
+                embed.add_field(name="⚠️ Importación incompleta", value=error, inline=False)
+            file = discord.File("nanali.jpg", filename="nanali.jpg")
+            embed.set_thumbnail(url="attachment://nanali.jpg")
+            embed.set_footer(text=f"Solicitado por {ctx.author.display_name} • Nanali Music Bot", icon_url="attachment://nanali.jpg")
+            await processing_msg.edit(content="", embed=embed, attachments=[file])
+            return
+        
         # Obtener información del audio de forma asíncrona
-        audio_url, title, duration, uploader = await get_audio_source(url)
+        track = await get_audio_source(url)
         
-        if not audio_url:
+        if not track:
             log_debug(f"Fallo en extracción para URL: {url}", "play_command")
+            description = "No pude procesar tu solicitud. Por favor verifica:\n• La URL sea válida\n• El video esté disponible\n• Tengas conexión a internet"
+            if extraction_engine.breaker.is_open:
+                retry_after = int(extraction_engine.breaker.retry_after()) + 1
+                description = ERROR_MESSAGES['extractor_unavailable'].format(seconds=retry_after)
             embed = discord.Embed(
                 title="❌ Error de procesamiento",
-                description="No pude procesar tu solicitud. Por favor verifica:\n• La URL sea válida\n• El video esté disponible\n• Tengas conexión a internet\n• No sea una playlist",
+                description=description,
                 color=0xff0000
             )
             file = discord.File("nanali.jpg", filename="nanali.jpg")
@@ -212,39 +884,18 @@ async def play_command(ctx, *, url: str):
             await processing_msg.edit(content="", embed=embed, attachments=[file])
             return
         
-        # Crear objeto de canción
-        song_info = {
-            'url': audio_url,
-            'title': title,
-            'duration': duration,
-            'uploader': uploader,
-            'requester': ctx.author.display_name,
-            'original_url': url
-        }
-        
-        # Añadir a la cola
-        song_queue.append(song_info)
-        
-        # Crear embed de confirmación
-        embed = discord.Embed(
-            title="✅ Añadido a la cola",
-            description=f"**{title}**",
-            color=0x00ff7f
+        # Crear objeto de canción (solo metadatos: la URL se resuelve al reproducir)
+        song_info = Track(
+            title=track['title'],
+            duration=track['duration'],
+            uploader=track['uploader'],
+            requester=ctx.author.display_name,
+            webpage_url=track.get('webpage_url', url),
+            cache_key=track.get('cache_key'),
+            original_url=url,
+            requester_id=ctx.author.id
         )
-        embed.add_field(name="👤 Canal", value=uploader, inline=True)
-        embed.add_field(name="⏱️ Duración", value=format_duration(duration), inline=True)
-        embed.add_field(name="📍 Posición en cola", value=str(len(song_queue)), inline=True)
-        
-        # Añadir imagen de Nanali
-        file = discord.File("nanali.jpg", filename="nanali.jpg")
-        embed.set_thumbnail(url="attachment://nanali.jpg")
-        embed.set_footer(text=f"Solicitado por {ctx.author.display_name} • Nanali Music Bot", icon_url="attachment://nanali.jpg")
-        
-        await processing_msg.edit(content="", embed=embed, attachments=[file])
-        
-        # Solo iniciar reproducción si no hay nada reproduciéndose
-        if voice_client is None or not voice_client.is_playing():
-            await play_next(ctx)
+        await enqueue_song(ctx, song_info, processing_msg)
             
     except Exception as e:
         log_debug(f"Error en play_command: {e}", "play_command")
@@ -263,18 +914,20 @@ async def play_command(ctx, *, url: str):
 # Comando para saltar la canción actual
 @bot.command()
 async def skip(ctx):
-    global voice_client
-    if voice_client and voice_client.is_playing():
-        voice_client.stop()
+    player = players.get(ctx.guild)
+    if player.is_playing():
+        # after_playing se encarga de pasar a la siguiente canción
+        player.skip_requested = True
+        player.voice_client.stop()
         await ctx.send("¡Canción saltada!")
-        await play_next(ctx)
     else:
         await ctx.send("No hay ninguna canción reproduciéndose para saltar.")
 
 # Comando para ver la cola de reproducción
 @bot.command(aliases=['q'])
 async def queue(ctx):
-    global song_queue, current_song
+    player = players.get(ctx.guild)
+    song_queue, current_song = player.queue, player.current_song
     
     if not current_song and not song_queue:
         await ctx.send("❌ La cola está vacía.")
@@ -289,19 +942,19 @@ async def queue(ctx):
     if current_song:
         embed.add_field(
             name="🎵 Reproduciendo ahora",
-            value=f"**{current_song['title']}**\n👤 Solicitado por {current_song['requester']}",
+            value=f"**{current_song.title}**\n👤 Solicitado por {current_song.requester}",
             inline=False
         )
     
     # Mostrar próximas canciones (máximo 10)
     if song_queue:
         next_songs = []
-        for i, song in enumerate(song_queue[:10]):
+        for i, song in enumerate(song_queue.page(0, 10)):
             duration_str = ""
-            if song['duration']:
-                minutes, seconds = divmod(song['duration'], 60)
+            if song.duration:
+                minutes, seconds = divmod(song.duration, 60)
                 duration_str = f" `[{minutes:02d}:{seconds:02d}]`"
-            next_songs.append(f"`{i+1}.` **{song['title']}**{duration_str}\n    👤 {song['requester']}")
+            next_songs.append(f"`{i+1}.` **{song.title}**{duration_str}\n    👤 {song.requester}")
         
         embed.add_field(
             name=f"⏭️ Próximas canciones ({len(song_queue)} en total)",
@@ -323,58 +976,89 @@ async def queue(ctx):
 # Comando para ver la canción que se está reproduciendo actualmente
 @bot.command(aliases=['np'])
 async def nowplaying(ctx):
-    global voice_client, current_song
+    player = players.get(ctx.guild)
+    current_song = player.current_song
     
-    if not voice_client or not voice_client.is_playing() or not current_song:
+    if not player.is_playing() or not current_song:
         await ctx.send("❌ No hay ninguna canción reproduciéndose actualmente.")
         return
     
     embed = discord.Embed(
         title="🎵 Reproduciendo ahora",
-        description=f"**{current_song['title']}**",
+        description=f"**{current_song.title}**",
         color=0x9932cc
     )
-    embed.add_field(name="👤 Canal", value=current_song['uploader'], inline=True)
-    if current_song['duration']:
-        minutes, seconds = divmod(current_song['duration'], 60)
+    embed.add_field(name="👤 Canal", value=current_song.uploader, inline=True)
+    if current_song.duration:
+        minutes, seconds = divmod(current_song.duration, 60)
         embed.add_field(name="⏱️ Duración", value=f"{minutes:02d}:{seconds:02d}", inline=True)
-    embed.add_field(name="📋 En cola", value=str(len(song_queue)), inline=True)
+    embed.add_field(name="📋 En cola", value=str(len(player.queue)), inline=True)
     
     # Añadir imagen de Nanali
     file = discord.File("nanali.jpg", filename="nanali.jpg")
     embed.set_thumbnail(url="attachment://nanali.jpg")
-    embed.set_footer(text=f"Solicitado por {current_song['requester']} • Nanali Music Bot", icon_url="attachment://nanali.jpg")
+    embed.set_footer(text=f"Solicitado por {current_song.requester} • Nanali Music Bot", icon_url="attachment://nanali.jpg")
     
     await ctx.send(file=file, embed=embed)
 
 @bot.command()
 async def stop(ctx):
-    global voice_client
-    global song_queue
-    if voice_client and voice_client.is_playing():
-        voice_client.stop()
-        song_queue = []  # Limpiar la cola al detener
+    player = players.get(ctx.guild)
+    if player.is_playing():
+        player.reset()  # Limpiar la cola al detener
+        queue_store.forget(ctx.guild.id)
+        player.voice_client.stop()
         await ctx.send("¡Reproducción detenida y la cola ha sido limpiada!")
     else:
         await ctx.send("No hay nada reproduciéndose.")
 
 @bot.command()
 async def leave(ctx):
-    global voice_client
-    global song_queue
-    if voice_client and voice_client.is_connected():
+    player = players.find(ctx.guild.id)
+    if player is not None and player.is_connected():
+        # Limpiar la cola y olvidar el reproductor del servidor al desconectar
+        voice_client = player.voice_client
+        players.remove(ctx.guild.id)
+        queue_store.forget(ctx.guild.id)
         await voice_client.disconnect()
-        voice_client = None
-        song_queue = []  # Limpiar la cola al desconectar
         await ctx.send("¡Me desconecté del canal de voz y la cola ha sido limpiada!")
     else:
         await ctx.send("No estoy conectado a ningún canal de voz.")
 
+async def resume_saved_queues():
+    """Vuelve a los canales de voz donde sonaba algo antes del reinicio
+
+    Solo se cargan estos servidores; el resto recupera su cola cuando se usa.
+    La canción actual se retoma en su posición con la URL de track_cache o el
+    archivo de audio_cache, sin volver a extraerla si sigue siendo válida.
+    """
+    for guild_id, voice_channel_id in queue_store.playing_guilds():
+        guild = bot.get_guild(guild_id)
+        channel = guild.get_channel(voice_channel_id) if guild else None
+        if channel is None:
+            continue
+        player = players.get(guild)
+        if not player.queue or player.text_channel is None or not player.is_idle():
+            continue
+        try:
+            player.voice_client = await channel.connect()
+        except (discord.DiscordException, asyncio.TimeoutError) as e:
+            log_debug(f"No se pudo volver a {channel.name}: {e}", "queue_store")
+            continue
+        await play_next(player)
+
 # Evento cuando el bot se conecta correctamente
 @bot.event
 async def on_ready():
     print(f'🌸 Nanali Music Bot conectada como {bot.user}')
     print('🎵 Lista para reproducir música!')
+    if WARM_POOL_CONFIG['enabled']:
+        catalog_warmer.start()
+    quality.start()
+    queue_store.start(players)
+    if not bot.restored:
+        bot.restored = True
+        bot.loop.create_task(resume_saved_queues())
     await bot.change_presence(
         activity=discord.Activity(
             type=discord.ActivityType.listening, 
@@ -407,13 +1091,15 @@ async def on_message(message):
 @bot.command()
 async def shuffle(ctx):
     """Mezcla aleatoriamente la cola de reproducción"""
-    global song_queue
+    player = players.get(ctx.guild)
+    song_queue = player.queue
     if len(song_queue) < 2:
         await ctx.send("❌ Necesitas al menos 2 canciones en la cola para mezclar.")
         return
     
-    import random
-    random.shuffle(song_queue)
+    song_queue.shuffle()
+    refresh_transition(player)
+    save_state(player)
     embed = discord.Embed(
         title="🔀 Cola mezclada",
         description=f"¡Perfecto! He mezclado **{len(song_queue)} canciones** aleatoriamente.",
@@ -427,13 +1113,16 @@ async def shuffle(ctx):
 @bot.command()
 async def clear(ctx):
     """Limpia toda la cola de reproducción"""
-    global song_queue
+    player = players.get(ctx.guild)
+    song_queue = player.queue
     if not song_queue:
         await ctx.send("❌ La cola ya está vacía.")
         return
     
     cleared_count = len(song_queue)
     song_queue.clear()
+    refresh_transition(player)
+    save_state(player)
     embed = discord.Embed(
         title="🗑️ Cola limpiada",
         description=f"He eliminado **{cleared_count} canciones** de la cola.\n¡Lista para nuevas aventuras musicales!",
@@ -447,7 +1136,8 @@ async def clear(ctx):
 @bot.command()
 async def remove(ctx, position: int):
     """Elimina una canción específica de la cola"""
-    global song_queue
+    player = players.get(ctx.guild)
+    song_queue = player.queue
     if not song_queue:
         await ctx.send("❌ La cola está vacía.")
         return
@@ -456,10 +1146,12 @@ async def remove(ctx, position: int):
         await ctx.send(f"❌ Posición inválida. Usa un número entre 1 y {len(song_queue)}.")
         return
     
-    removed_song = song_queue.pop(position - 1)
+    removed_song = song_queue.remove_at(position - 1)
+    refresh_transition(player)
+    save_state(player)
     embed = discord.Embed(
         title="🗑️ Canción eliminada",
-        description=f"He eliminado **{removed_song['title']}** de la posición {position}.",
+        description=f"He eliminado **{removed_song.title}** de la posición {position}.",
         color=0xff6347
     )
     file = discord.File("nanali.jpg", filename="nanali.jpg")
@@ -470,8 +1162,8 @@ async def remove(ctx, position: int):
 @bot.command(aliases=['vol', 'v'])
 async def volume(ctx, vol: int = None):
     """Ajusta el volumen (0-150) - ¡Ahora con boost!"""
-    global voice_client
-    if not voice_client or not voice_client.is_playing():
+    player = players.get(ctx.guild)
+    if not player.is_playing():
         embed = discord.Embed(
             title="❌ Sin reproducción",
             description="No hay música reproduciéndose actualmente.",
@@ -484,7 +1176,7 @@ async def volume(ctx, vol: int = None):
         return
     
     if vol is None:
-        current_vol = int(getattr(voice_client.source, 'volume', 1.0) * 100)
+        current_vol = player.volume
         embed = discord.Embed(
             title="🔊 Control de Volumen",
             description=f"**Volumen actual:** {current_vol}%\n\n**Uso:** `!volume <0-150>`\n• 0-100: Volumen normal\n• 101-150: Modo boost 🚀",
@@ -508,9 +1200,14 @@ async def volume(ctx, vol: int = None):
         await ctx.send(file=file, embed=embed)
         return
     
-    # Aplicar volumen con transformación
-    if hasattr(voice_client.source, 'volume'):
-        voice_client.source.volume = vol / 100
+    # Aplicar volumen con transformación (en paso directo, desde la próxima canción)
+    player.volume = vol
+    save_state(player)
+    prepared_source = player.prepared_track[3] if player.prepared_track else None
+    for stage in find_stages(player.mixer, VolumeAudioSource) + find_stages(prepared_source, VolumeAudioSource):
+        stage.volume = vol / 100
+    recheck_prepared(player)
+    applied_now = player.mixer is not None and not player.mixer.is_opus()
     
     # Crear embed de confirmación
     if vol <= 100:
@@ -527,6 +1224,8 @@ async def volume(ctx, vol: int = None):
         description=f"**Volumen:** {vol}% ({mode})\n\n{get_volume_bar(vol)}",
         color=color
     )
+    if not applied_now:
+        embed.add_field(name="⚠️ Audio sin procesar", value="El cambio se aplicará en la próxima canción", inline=False)
     file = discord.File("nanali.jpg", filename="nanali.jpg")
     embed.set_thumbnail(url="attachment://nanali.jpg")
     embed.set_footer(text="¡Disfruta tu música! • Nanali Music Bot", icon_url="attachment://nanali.jpg")
@@ -587,6 +1286,9 @@ async def help_music(ctx):
     advanced_commands = [
         ("🔊 !volume <0-150> (o !v)", "Control de volumen con boost"),
         ("🎛️ !bass_boost <0-4>", "Ecualizador y efectos de audio"),
+        ("🎚️ !filter <nombre> (o !fx)", "Filtros en vivo: agudos, voz, volumen extra"),
+        ("🌊 !crossfade <segundos> [curva]", "Fundido entre canciones (0 = sin huecos)"),
+        ("⚖️ !fair <fifo/round_robin/weighted>", "Reparto de la cola entre quienes piden"),
         ("ℹ️ !nanali", "Información sobre mí"),
         ("📊 !stats", "Estadísticas del servidor"),
         ("❓ !help_music", "Este menú de ayuda")
@@ -659,7 +1361,7 @@ async def nanali(ctx):
 @bot.command()
 async def stats(ctx):
     """Muestra estadísticas del bot y servidor"""
-    global song_queue, current_song
+    player = players.get(ctx.guild)
     
     # Obtener información del servidor
     guild = ctx.guild
@@ -685,24 +1387,24 @@ async def stats(ctx):
     # Estadísticas del bot
     embed.add_field(
         name="🤖 Estado del Bot",
-        value=f"**Latencia:** {bot_latency}ms\n**Servidores:** {len(bot.guilds)}\n**Versión:** v3.0\n**Estado:** {'🟢 Conectada' if voice_client and voice_client.is_connected() else '🔴 Desconectada'}",
+        value=f"**Latencia:** {bot_latency}ms\n**Servidores:** {len(bot.guilds)}\n**Reproduciendo en:** {quality.metrics['streams']} servidores\n**Versión:** v3.0\n**Estado:** {'🟢 Conectada' if player.is_connected() else '🔴 Desconectada'}",
         inline=True
     )
     
     # Estadísticas de música
-    queue_length = len(song_queue)
-    current_status = "🎵 Reproduciendo" if voice_client and voice_client.is_playing() else "⏸️ Pausada" if voice_client and voice_client.is_paused() else "⏹️ Detenida"
+    queue_length = len(player.queue)
+    current_status = "🎵 Reproduciendo" if player.is_playing() else "⏸️ Pausada" if player.is_connected() and player.voice_client.is_paused() else "⏹️ Detenida"
     
     embed.add_field(
         name="🎵 Estado Musical",
-        value=f"**Estado:** {current_status}\n**En cola:** {queue_length} canciones\n**Canción actual:** {'✅ Sí' if current_song else '❌ No'}\n**Calidad:** 320kbps",
+        value=f"**Estado:** {current_status}\n**En cola:** {queue_length} canciones\n**Canción actual:** {'✅ Sí' if player.current_song else '❌ No'}\n**Calidad:** {quality.level} ({quality.preset['bitrate']}bps)",
         inline=True
     )
     
     # Funciones disponibles
     embed.add_field(
         name="⚡ Funciones Activas",
-        value=f"**Modo repetición:** {getattr(bot, 'loop_mode', 'off').upper()}\n**Bass boost:** Nivel {getattr(bot, 'bass_level', 0)}\n**Auto-desconexión:** ✅ Activa\n**Búsqueda avanzada:** ✅ Disponible",
+        value=f"**Modo repetición:** {player.loop_mode.upper()}\n**Bass boost:** Nivel {player.bass_level}\n**Auto-desconexión:** ✅ Activa\n**Búsqueda avanzada:** ✅ Disponible",
         inline=True
     )
     
@@ -716,7 +1418,29 @@ async def stats(ctx):
     # Información técnica
     embed.add_field(
         name="🛠️ Información Técnica",
-        value="**Codec de audio:** Opus\n**Bitrate:** 320kbps\n**Canales:** Estéreo (2)\n**Frecuencia:** 48kHz\n**Buffer:** 512kb",
+        value=f"**Codec de audio:** Opus\n**Bitrate:** {quality.preset['bitrate']}bps\n**Canales:** Estéreo (2)\n**Frecuencia:** 48kHz\n**CPU:** {quality.metrics['cpu']:.0f}%\n**Lag del loop:** {quality.metrics['lag'] * 1000:.0f}ms",
+        inline=True
+    )
+    
+    # Salud del extractor
+    breaker = extraction_engine.breaker
+    breaker_status = {'closed': '🟢 Normal', 'open': '🔴 Pausado', 'half_open': '🟡 Probando'}[breaker.state]
+    p95 = extraction_engine.latency['full'].percentile(0.95)
+    embed.add_field(
+        name="⚙️ Extractor",
+        value=f"**Estado:** {breaker_status}\n**p95:** {f'{p95:.1f}s' if p95 else 'N/D'}\n**Timeout:** {extraction_engine.latency['full'].timeout():.0f}s\n**Errores:** {extraction_engine.latency['full'].error_rate():.0%}",
+        inline=True
+    )
+    
+    # Búfer de lectura de la canción actual
+    buffers = find_stages(player.mixer.current, BufferedAudioSource) if player.mixer else []
+    if buffers:
+        buffer_value = f"**Llenado:** {buffers[0].fill_level:.0%}\n**Capacidad:** {BUFFER_CONFIG['seconds']:.0f}s\n**Cortes:** {buffers[0].underruns}"
+    else:
+        buffer_value = "**Llenado:** N/D\n**Cortes:** 0"
+    embed.add_field(
+        name="📶 Búfer",
+        value=buffer_value,
         inline=True
     )
     
@@ -732,23 +1456,7 @@ async def stats(ctx):
 @bot.command()
 async def anime_op(ctx):
     """Reproduce openings de anime populares"""
-    anime_ops = [
-        "Attack on Titan opening 1 Guren no Yumiya",
-        "Demon Slayer opening Gurenge",
-        "Naruto opening 16 Silhouette",
-        "One Piece opening 1 We Are",
-        "Dragon Ball Z opening Cha-La Head-Cha-La",
-        "Death Note opening 1 The World",
-        "Tokyo Ghoul opening Unravel",
-        "Fullmetal Alchemist Brotherhood opening 1",
-        "My Hero Academia opening 1 The Day",
-        "Jujutsu Kaisen opening Kaikai Kitan",
-        "Mob Psycho 100 opening 99",
-        "One Punch Man opening The Hero"
-    ]
-    
-    import random
-    selected_op = random.choice(anime_ops)
+    selected_op = get_random_song('anime_op')
     
     embed = discord.Embed(
         title="🎵 Opening de Anime Seleccionado",
@@ -766,21 +1474,7 @@ async def anime_op(ctx):
 @bot.command()
 async def anime_ed(ctx):
     """Reproduce endings de anime emotivos"""
-    anime_eds = [
-        "Attack on Titan ending 1 Utsukushiki Zankoku na Sekai",
-        "Naruto Shippuden ending 6 Sign",
-        "Fullmetal Alchemist Brotherhood ending 1",
-        "Death Note ending 1 Alumina",
-        "Tokyo Ghoul ending On My Own",
-        "Demon Slayer ending Kamado Tanjiro no Uta",
-        "Your Name ending Nandemonaiya",
-        "Violet Evergarden ending Michishirube",
-        "Anohana ending Secret Base",
-        "Clannad ending Dango Daikazoku"
-    ]
-    
-    import random
-    selected_ed = random.choice(anime_eds)
+    selected_ed = get_random_song('anime_ed')
     
     embed = discord.Embed(
         title="🎶 Ending de Anime Seleccionado",
@@ -797,21 +1491,7 @@ async def anime_ed(ctx):
 @bot.command()
 async def vocaloid(ctx):
     """Reproduce música de Vocaloid"""
-    vocaloid_songs = [
-        "Hatsune Miku Senbonzakura",
-        "Hatsune Miku World is Mine",
-        "Kagamine Rin Len Servant of Evil",
-        "Hatsune Miku Tell Your World",
-        "GUMI Matryoshka",
-        "Hatsune Miku Rolling Girl",
-        "Kagamine Rin Kokoro",
-        "Hatsune Miku Love is War",
-        "IA Kagerou Days",
-        "Hatsune Miku Disappearance of Hatsune Miku"
-    ]
-    
-    import random
-    selected_song = random.choice(vocaloid_songs)
+    selected_song = get_random_song('vocaloid')
     
     embed = discord.Embed(
         title="🎼 Vocaloid Seleccionado",
@@ -828,21 +1508,7 @@ async def vocaloid(ctx):
 @bot.command()
 async def kawaii(ctx):
     """Reproduce música kawaii y J-Pop"""
-    kawaii_songs = [
-        "Kyary Pamyu Pamyu PonPonPon",
-        "Perfume Polyrhythm",
-        "AKB48 Heavy Rotation",
-        "Babymetal Gimme Chocolate",
-        "Kyary Pamyu Pamyu Fashion Monster",
-        "Perfume Chocolate Disco",
-        "Morning Musume Love Machine",
-        "Momoiro Clover Z Saraba",
-        "Scandal Harukaze",
-        "Silent Siren Cherry Hunter"
-    ]
-    
-    import random
-    selected_song = random.choice(kawaii_songs)
+    selected_song = get_random_song('kawaii')
     
     embed = discord.Embed(
         title="🌸 Música Kawaii Seleccionada",
@@ -859,21 +1525,7 @@ async def kawaii(ctx):
 @bot.command()
 async def epic_anime(ctx):
     """Reproduce música épica de anime"""
-    epic_songs = [
-        "Attack on Titan Vogel im Kafig",
-        "Demon Slayer Tanjiro no Uta",
-        "Naruto Strong and Strike",
-        "Dragon Ball Z Ultimate Battle",
-        "One Piece Overtaken",
-        "Bleach Number One",
-        "Fairy Tail Main Theme",
-        "Fullmetal Alchemist Brotherhood Lapis Philosophorum",
-        "Jujutsu Kaisen Domain Expansion",
-        "My Hero Academia You Say Run"
-    ]
-    
-    import random
-    selected_song = random.choice(epic_songs)
+    selected_song = get_random_song('epic')
     
     embed = discord.Embed(
         title="⚡ Música Épica de Anime",
@@ -906,16 +1558,16 @@ async def character(ctx, *, character_name: str):
 
 async def search_and_play(ctx, query):
     """Función auxiliar para buscar y reproducir automáticamente"""
+    if not ctx.author.voice:
+        await ctx.send("❌ Debes estar en un canal de voz para usar este comando.")
+        return
+    
     try:
-        search_query = f"ytsearch1:{query}"
-        data = await asyncio.get_running_loop().run_in_executor(
-            None, lambda: ydl.extract_info(search_query, download=False)
-        )
+        # Una sola búsqueda plana: la URL de audio se resuelve al reproducir
+        entries = await search_entries(query, 1)
         
-        if data and 'entries' in data and data['entries'] and data['entries'][0]:
-            entry = data['entries'][0]
-            url = f"https://www.youtube.com/watch?v={entry['id']}"
-            await play_command(ctx, url=url)
+        if entries:
+            await enqueue_song(ctx, song_from_entry(entries[0], ctx.author))
         else:
             await ctx.send(f"❌ No pude encontrar: {query}")
     except Exception as e:
@@ -972,13 +1624,10 @@ async def search(ctx, *, query: str):
     processing_msg = await ctx.send("🔍 Buscando música...")
     
     try:
-        # Buscar múltiples resultados
-        search_query = f"ytsearch5:{query}"
-        data = await asyncio.get_running_loop().run_in_executor(
-            None, lambda: ydl.extract_info(search_query, download=False)
-        )
+        # Buscar múltiples resultados (extracción plana)
+        entries = await search_entries(query, 5)
         
-        if not data or 'entries' not in data or not data['entries']:
+        if not entries:
             embed = discord.Embed(
                 title="❌ Sin resultados",
                 description=f"No encontré resultados para: **{query}**",
@@ -998,12 +1647,12 @@ async def search(ctx, *, query: str):
         )
         
         results = []
-        for i, entry in enumerate(data['entries'][:5]):
+        for i, entry in enumerate(entries[:5]):
             if entry:
-                duration = entry.get('duration', 0)
+                duration = int(entry.get('duration') or 0)
                 duration_str = f"{duration//60:02d}:{duration%60:02d}" if duration else "N/A"
-                uploader = entry.get('uploader', 'Desconocido')[:20]
-                title = entry.get('title', 'Sin título')[:50]
+                uploader = (entry.get('uploader') or entry.get('channel') or 'Desconocido')[:20]
+                title = (entry.get('title') or 'Sin título')[:50]
                 
                 embed.add_field(
                     name=f"{i+1}️⃣ {title}",
@@ -1036,9 +1685,8 @@ async def search(ctx, *, query: str):
             selected_index = reactions.index(str(reaction.emoji))
             selected_entry = results[selected_index]
             
-            # Reproducir la canción seleccionada
-            url = f"https://www.youtube.com/watch?v={selected_entry['id']}"
-            await play_command(ctx, url=url)
+            # Encolar directamente el resultado elegido, sin volver a buscarlo
+            await enqueue_song(ctx, song_from_entry(selected_entry, ctx.author))
             
         except asyncio.TimeoutError:
             embed.set_footer(text="⏰ Tiempo agotado • Nanali Music Bot", icon_url="attachment://nanali.jpg")
@@ -1051,15 +1699,12 @@ async def search(ctx, *, query: str):
 @bot.command(aliases=['loop', 'repeat'])
 async def loop_song(ctx, mode: str = None):
     """Activa/desactiva el modo repetición (song/queue/off)"""
-    global loop_mode, current_song
-    
-    if not hasattr(bot, 'loop_mode'):
-        bot.loop_mode = 'off'
+    player = players.get(ctx.guild)
     
     if mode is None:
         embed = discord.Embed(
             title="🔄 Modo Repetición",
-            description=f"**Estado actual:** {bot.loop_mode.upper()}\n\n**Modos disponibles:**\n• `song` - Repite la canción actual\n• `queue` - Repite toda la cola\n• `off` - Sin repetición",
+            description=f"**Estado actual:** {player.loop_mode.upper()}\n\n**Modos disponibles:**\n• `song` - Repite la canción actual\n• `queue` - Repite toda la cola\n• `off` - Sin repetición",
             color=0x9932cc
         )
         file = discord.File("nanali.jpg", filename="nanali.jpg")
@@ -1072,15 +1717,18 @@ async def loop_song(ctx, mode: str = None):
         await ctx.send("❌ Modo inválido. Usa: `song`, `queue` o `off`")
         return
     
-    bot.loop_mode = mode.lower()
+    player.loop_mode = mode.lower()
+    # La siguiente canción preparada depende del modo
+    refresh_transition(player)
+    save_state(player)
     
     mode_emojis = {'song': '🔂', 'queue': '🔁', 'off': '⏹️'}
     mode_names = {'song': 'Canción actual', 'queue': 'Cola completa', 'off': 'Desactivado'}
     
     embed = discord.Embed(
-        title=f"{mode_emojis[bot.loop_mode]} Repetición configurada",
-        description=f"**Modo:** {mode_names[bot.loop_mode]}\n\n{get_loop_description(bot.loop_mode)}",
-        color=0x00ff00 if bot.loop_mode != 'off' else 0x808080
+        title=f"{mode_emojis[player.loop_mode]} Repetición configurada",
+        description=f"**Modo:** {mode_names[player.loop_mode]}\n\n{get_loop_description(player.loop_mode)}",
+        color=0x00ff00 if player.loop_mode != 'off' else 0x808080
     )
     file = discord.File("nanali.jpg", filename="nanali.jpg")
     embed.set_thumbnail(url="attachment://nanali.jpg")
@@ -1098,6 +1746,7 @@ def get_loop_description(mode):
 @bot.command(aliases=['eq', 'equalizer'])
 async def bass_boost(ctx, level: int = None):
     """Aplica efectos de audio (bass boost, etc.)"""
+    player = players.get(ctx.guild)
     if level is None:
         embed = discord.Embed(
             title="🎛️ Ecualizador de Audio",
@@ -1114,15 +1763,17 @@ async def bass_boost(ctx, level: int = None):
         await ctx.send("❌ Nivel inválido. Usa un número entre 0-4.")
         return
     
-    # Guardar configuración de bass boost
-    bot.bass_level = level
+    # Guardar configuración de bass boost (la etapa DSP la aplica en el siguiente frame)
+    player.bass_level = level
+    player.effects.set_bass_level(level)
+    recheck_prepared(player)
     
     level_names = ['Normal', 'Ligero', 'Medio', 'Intenso', 'EXTREMO 💥']
     level_emojis = ['🎵', '🎶', '🎸', '🔊', '💥']
     
     embed = discord.Embed(
         title=f"{level_emojis[level]} Bass Boost Configurado",
-        description=f"**Nivel:** {level_names[level]}\n\n{'⚠️ El efecto se aplicará en la próxima canción' if level > 0 else '✅ Audio normal restaurado'}",
+        description=f"**Nivel:** {level_names[level]}\n\n{effects_status_text(player) if level > 0 else '✅ Audio normal restaurado'}",
         color=0xff6600 if level > 0 else 0x00ff00
     )
     file = discord.File("nanali.jpg", filename="nanali.jpg")
@@ -1130,10 +1781,128 @@ async def bass_boost(ctx, level: int = None):
     embed.set_footer(text="¡Configuración guardada! • Nanali Music Bot", icon_url="attachment://nanali.jpg")
     await ctx.send(file=file, embed=embed)
 
+def effects_status_text(player):
+    """Indica si los efectos ya suenan o esperan a la próxima canción"""
+    if player.mixer is not None and not player.mixer.is_opus():
+        return '✅ Efecto aplicado al instante'
+    return '⚠️ El efecto se aplicará en la próxima canción'
+
+@bot.command(name="filter", aliases=['fx'])
+async def filter_command(ctx, name: str = None):
+    """Activa o desactiva filtros de audio (se pueden combinar)"""
+    player = players.get(ctx.guild)
+    if name is None or (name.lower() not in AUDIO_FILTERS and name.lower() != 'off'):
+        active = ', '.join(player.effects.filters) or 'ninguno'
+        embed = discord.Embed(
+            title="🎛️ Filtros de Audio",
+            description=f"**Activos:** {active}\n\n**Disponibles:**\n" + "\n".join(f"• `{f}`" for f in AUDIO_FILTERS) + "\n• `off` - Quitar todos",
+            color=0xff6600
+        )
+        file = discord.File("nanali.jpg", filename="nanali.jpg")
+        embed.set_thumbnail(url="attachment://nanali.jpg")
+        embed.set_footer(text="Uso: !filter <nombre> • Nanali Music Bot", icon_url="attachment://nanali.jpg")
+        await ctx.send(file=file, embed=embed)
+        return
+    
+    name = name.lower()
+    if name == 'off':
+        player.effects.clear_filters()
+        recheck_prepared(player)
+        await ctx.send("✅ Filtros desactivados")
+        return
+    
+    enabled = player.effects.toggle_filter(name)
+    recheck_prepared(player)
+    if enabled:
+        await ctx.send(f"🎛️ Filtro **{name}** activado. {effects_status_text(player)}")
+    else:
+        await ctx.send(f"🎵 Filtro **{name}** desactivado")
+
+@bot.command(aliases=['cf'])
+async def crossfade(ctx, seconds: str = None, curve: str = None):
+    """Configura el fundido entre canciones"""
+    player = players.get(ctx.guild)
+    max_duration = CROSSFADE_CONFIG['max_duration']
+    if seconds is None:
+        embed = discord.Embed(
+            title="🌊 Fundido entre canciones",
+            description=f"**Actual:** {player.crossfade_seconds}s ({player.crossfade_curve})\n\n**Uso:** `!crossfade <0-{max_duration}> [equal_power|linear]`\n• `0` o `off`: sin fundido, pero sin huecos entre canciones",
+            color=0x00bfff
+        )
+        file = discord.File("nanali.jpg", filename="nanali.jpg")
+        embed.set_thumbnail(url="attachment://nanali.jpg")
+        embed.set_footer(text="¡Transiciones suaves! • Nanali Music Bot", icon_url="attachment://nanali.jpg")
+        await ctx.send(file=file, embed=embed)
+        return
+    
+    value = 0 if seconds.lower() == 'off' else int(seconds) if seconds.isdigit() else -1
+    if value < 0 or value > max_duration:
+        await ctx.send(f"❌ Duración inválida. Usa un número entre 0 y {max_duration}.")
+        return
+    if curve is not None and curve.lower() not in ('equal_power', 'linear'):
+        await ctx.send("❌ Curva inválida. Usa `equal_power` o `linear`.")
+        return
+    
+    player.crossfade_seconds = value
+    if curve is not None:
+        player.crossfade_curve = curve.lower()
+    if player.mixer is not None:
+        player.mixer.crossfade = player.crossfade_seconds
+        player.mixer.curve = player.crossfade_curve
+        # La siguiente canción debe abrirse antes si el fundido es más largo
+        # (y puede que ya no vaya en paso directo)
+        player.mixer.clear_next()
+        player.discard_prepared()
+        if player.current_song:
+            schedule_transition(player, player.current_song)
+    
+    if player.crossfade_seconds:
+        await ctx.send(f"🌊 Fundido de **{player.crossfade_seconds}s** ({player.crossfade_curve}) entre canciones")
+    else:
+        await ctx.send("🎵 Fundido desactivado: las canciones se encadenan sin huecos")
+
+@bot.command(aliases=['reparto'])
+async def fair(ctx, mode: str = None):
+    """Elige cómo se reparte la cola entre quienes piden canciones"""
+    player = players.get(ctx.guild)
+    modes = {
+        'fifo': "Orden de llegada",
+        'round_robin': "Una canción de cada persona por turno",
+        'weighted': "Tiempo de reproducción repartido según el peso de cada persona"
+    }
+    if mode is None:
+        embed = discord.Embed(
+            title="⚖️ Reparto de la cola",
+            description=f"**Actual:** {modes[player.queue.scheduler.name]}\n\n**Uso:** `!fair <fifo|round_robin|weighted>`\n" + "\n".join(f"• `{name}`: {desc}" for name, desc in modes.items()),
+            color=0x00bfff
+        )
+        embed.add_field(name="📏 Límites", value=f"{player.queue.max_size} canciones por servidor, {player.queue.max_per_user} por persona", inline=False)
+        file = discord.File("nanali.jpg", filename="nanali.jpg")
+        embed.set_thumbnail(url="attachment://nanali.jpg")
+        embed.set_footer(text="¡Música para todos! • Nanali Music Bot", icon_url="attachment://nanali.jpg")
+        await ctx.send(file=file, embed=embed)
+        return
+    
+    if mode.lower() not in SCHEDULERS:
+        await ctx.send(f"❌ Modo inválido. Usa: {', '.join(f'`{name}`' for name in SCHEDULERS)}")
+        return
+    
+    player.queue.set_scheduler(mode.lower())
+    refresh_transition(player)
+    save_state(player)
+    await ctx.send(f"⚖️ Reparto de la cola: **{modes[mode.lower()]}**")
+
 # Ejecutar el bot
 if __name__ == "__main__":
     token = os.getenv('DISCORD_TOKEN')
     if not token:
         print("❌ Error: No se encontró el token de Discord. Crea un archivo .env con DISCORD_TOKEN=tu_token")
     else:
-        bot.run(token)
\ No newline at end of file
+        try:
+            bot.run(token)
+        finally:
+            extraction_engine.close()
+            track_cache.close()
+            audio_cache.close()
+            loudness.close()
+            queue_store.close()
\ No newline at end of file
@@ -0,0 +1,225 @@
+# 🌸 Nanali Music Bot v3.0 - Cachés de extracción
+# Evitan repetir el trabajo de yt-dlp para videos que ya fueron resueltos
+
+import json
+import os
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+# ═══════════════════════════════════════════════════════════════
+# 🔗 UTILIDADES DE URLS FIRMADAS
+# ═══════════════════════════════════════════════════════════════
+
+_PATH_EXPIRE_RE = re.compile(r'/expire/(\d+)')
+
+def get_stream_expiry(stream_url: str) -> Optional[float]:
+    """Obtiene el timestamp 'expire=' de una URL firmada (googlevideo)"""
+    if not stream_url:
+        return None
+
+    parsed = urlparse(stream_url)
+    values = parse_qs(parsed.query).get('expire')
+    if values and values[0].isdigit():
+        return float(values[0])
+
+    # Algunas URLs de manifiesto llevan la caducidad en la ruta
+    match = _PATH_EXPIRE_RE.search(parsed.path)
+    if match:
+        return float(match.group(1))
+    return None
+
+# ═══════════════════════════════════════════════════════════════
+# 🎵 CACHÉ DE PISTAS RESUELTAS
+# ═══════════════════════════════════════════════════════════════
+
+class ResolvedTrackCache:
+    """Caché LRU en memoria respaldada por SQLite para pistas ya extraídas
+
+    Las entradas se indexan por el ID canónico del video y caducan según el
+    parámetro 'expire=' de la URL firmada, así un acierto evita por completo
+    la extracción y un reinicio no deja la caché vacía.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_entries: int = 500,
+        expiry_margin: int = 300,
+        default_ttl: int = 600
+    ):
+        self.max_entries = max_entries
+        self.expiry_margin = expiry_margin
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Un único hilo escribe en SQLite para no bloquear el event loop
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS resolved_tracks ('
+            'video_id TEXT PRIMARY KEY, expires_at REAL NOT NULL, data TEXT NOT NULL)'
+        )
+        self._db.commit()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='track-cache')
+        self._load()
+
+    def _load(self):
+        """Carga en memoria las entradas vigentes del disco"""
+        now = time.time()
+        self._db.execute('DELETE FROM resolved_tracks WHERE expires_at <= ?', (now + self.expiry_margin,))
+        self._db.commit()
+        rows = self._db.execute(
+            'SELECT video_id, expires_at, data FROM resolved_tracks ORDER BY expires_at DESC LIMIT ?',
+            (self.max_entries,)
+        ).fetchall()
+        # Las que caducan antes quedan al frente para ser las primeras en salir
+        for video_id, expires_at, data in reversed(rows):
+            entry = json.loads(data)
+            entry['expires_at'] = expires_at
+            self._entries[video_id] = entry
+
+    def _is_fresh(self, entry: Dict) -> bool:
+        return entry['expires_at'] - self.expiry_margin > time.time()
+
+    def get(self, video_id: Optional[str]) -> Optional[Dict]:
+        """Devuelve la entrada si sigue vigente, o None"""
+        if not video_id:
+            return None
+
+        entry = self._entries.get(video_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if not self._is_fresh(entry):
+            self.invalidate(video_id)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(video_id)
+        self.hits += 1
+        return entry
+
+    def put(self, video_id: Optional[str], info: Dict) -> None:
+        """Guarda una pista resuelta (url, title, duration, uploader...)"""
+        if not video_id or not info.get('url'):
+            return
+
+        expires_at = get_stream_expiry(info['url'])
+        if expires_at is None:
+            if not self.default_ttl:
+                return
+            expires_at = time.time() + self.default_ttl
+
+        entry = dict(info)
+        entry['expires_at'] = expires_at
+        if not self._is_fresh(entry):
+            return
+
+        self._entries[video_id] = entry
+        self._entries.move_to_end(video_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        data = json.dumps({k: v for k, v in entry.items() if k != 'expires_at'})
+        self._writer.submit(self._db_put, video_id, expires_at, data)
+
+    def invalidate(self, video_id: str) -> None:
+        """Elimina una entrada (p. ej. cuando la URL dejó de funcionar)"""
+        if self._entries.pop(video_id, None) is not None:
+            self._writer.submit(self._db_delete, video_id)
+
+    def _db_put(self, video_id: str, expires_at: float, data: str):
+        self._db.execute(
+            'INSERT OR REPLACE INTO resolved_tracks (video_id, expires_at, data) VALUES (?, ?, ?)',
+            (video_id, expires_at, data)
+        )
+        self._db.commit()
+
+    def _db_delete(self, video_id: str):
+        self._db.execute('DELETE FROM resolved_tracks WHERE video_id = ?', (video_id,))
+        self._db.commit()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def close(self) -> None:
+        """Termina las escrituras pendientes y cierra la base de datos"""
+        self._writer.shutdown(wait=True)
+        self._db.close()
+
+# ═══════════════════════════════════════════════════════════════
+# 🔍 CACHÉ DE BÚSQUEDAS
+# ═══════════════════════════════════════════════════════════════
+
+_PUNCTUATION_RE = re.compile(r'[^\w\s]+')
+
+def normalize_query(query: str) -> str:
+    """Normaliza una búsqueda: sin mayúsculas, puntuación ni espacios repetidos"""
+    return ' '.join(_PUNCTUATION_RE.sub(' ', query.casefold()).split())
+
+def compact_entry(entry: Dict) -> Dict:
+    """Reduce un resultado de búsqueda a los campos que mostramos y encolamos"""
+    duration = entry.get('duration')
+    return {
+        'id': entry['id'],
+        'title': entry.get('title') or 'Sin título',
+        'duration': int(duration) if duration else None,
+        'uploader': entry.get('uploader') or entry.get('channel') or 'Desconocido'
+    }
+
+class SearchCache:
+    """Caché LRU con TTL para listas de resultados de búsqueda"""
+
+    def __init__(self, max_entries: int = 1000, ttl: int = 21600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, List[Dict]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(query: str, limit: int) -> str:
+        return f"{limit}:{normalize_query(query)}"
+
+    def get(self, query: str, limit: int) -> Optional[List[Dict]]:
+        """Devuelve los resultados guardados para la búsqueda, si no caducaron"""
+        key = self.make_key(query, limit)
+        item = self._entries.get(key)
+        if item is None or item[0] <= time.time():
+            if item is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def put(self, query: str, limit: int, entries: List[Dict]) -> List[Dict]:
+        """Guarda los resultados en formato compacto y los devuelve"""
+        results = [compact_entry(entry) for entry in entries]
+        if not results:
+            return results
+
+        key = self.make_key(query, limit)
+        self._entries[key] = (time.time() + self.ttl, results)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return results
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -40,7 +40,7 @@ AUDIO_QUALITY = {
 
 # Opciones FFmpeg optimizadas para máxima calidad
 FFMPEG_OPTIONS = {
-    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -probesize 200M',
+    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -probesize 1048576 -analyzeduration 1000000',
     'options': '-vn -b:a 320k -bufsize 512k -ar 48000 -ac 2 -acodec libopus -compression_level 10 -frame_duration 60 -application audio'
 }
 
@@ -60,6 +60,8 @@ ANIME_OPENINGS = [
     "Death Note OP 1 The World",
     "Tokyo Ghoul OP 1 Unravel",
     "Fullmetal Alchemist OP 1 Again",
+    "Naruto Shippuden OP 16 Silhouette",
+    "Dragon Ball Z OP Cha-La Head-Cha-La",
     "One Punch Man OP 1 The Hero",
     "Mob Psycho 100 OP 1 99",
     "Hunter x Hunter OP 1 Departure",
@@ -86,6 +88,7 @@ ANIME_ENDINGS = [
     "Grave of the Fireflies ED Home Sweet Home",
     "Tokyo Ghoul ED Saints",
     "Naruto ED 1 Wind",
+    "Naruto Shippuden ED 6 Sign",
     "Fullmetal Alchemist ED 1 Kesenai Tsumi",
     "Death Note ED 1 Alumina",
     "Bleach ED 1 Life is Like a Boat",
@@ -141,7 +144,9 @@ KAWAII_JPOP = [
     "E-girls Follow Me",
     "Twice TT Japanese Version",
     "BLACKPINK DDU-DU DDU-DU Japanese Version",
-    "Red Velvet Psycho Japanese Version"
+    "Red Velvet Psycho Japanese Version",
+    "Scandal Harukaze",
+    "Silent Siren Cherry Hunter"
 ]
 
 # OSTs épicos de anime
@@ -165,9 +170,20 @@ EPIC_ANIME_OST = [
     "Cowboy Bebop Rush",
     "JoJo's Bizarre Adventure Giorno's Theme",
     "Fairy Tail Dragon Force",
-    "Sword Art Online Swordland"
+    "Sword Art Online Swordland",
+    "Attack on Titan Vogel im Kafig",
+    "Fullmetal Alchemist Brotherhood Lapis Philosophorum"
 ]
 
+# Playlists usadas por los comandos temáticos (única fuente para get_random_song)
+THEMED_PLAYLISTS = {
+    'anime_op': ANIME_OPENINGS,
+    'anime_ed': ANIME_ENDINGS,
+    'vocaloid': VOCALOID_SONGS,
+    'kawaii': KAWAII_JPOP,
+    'epic': EPIC_ANIME_OST
+}
+
 # ═══════════════════════════════════════════════════════════════
 # 🎨 CONFIGURACIÓN VISUAL
 # ═══════════════════════════════════════════════════════════════
@@ -256,13 +272,13 @@ ACTIVITY = discord.Activity(
 # 🔧 CONFIGURACIÓN AVANZADA
 # ═══════════════════════════════════════════════════════════════
 
-# Configuración de bass boost
+# Configuración de bass boost (ganancia en dB del filtro low-shelf por nivel)
 BASS_BOOST_FILTERS = {
-    0: '',  # Sin filtro
-    1: '-af "bass=g=2"',
-    2: '-af "bass=g=4"',
-    3: '-af "bass=g=6"',
-    4: '-af "bass=g=8"'
+    0: 0,  # Sin filtro
+    1: 2,
+    2: 4,
+    3: 6,
+    4: 8
 }
 
 # Configuración de loop
@@ -332,16 +348,8 @@ def get_random_song(playlist_type: str) -> str:
     """Obtiene una canción aleatoria de la playlist especificada"""
     import random
     
-    playlists = {
-        'anime_op': ANIME_OPENINGS,
-        'anime_ed': ANIME_ENDINGS,
-        'vocaloid': VOCALOID_SONGS,
-        'kawaii': KAWAII_JPOP,
-        'epic': EPIC_ANIME_OST
-    }
-    
-    if playlist_type in playlists:
-        return random.choice(playlists[playlist_type])
+    if playlist_type in THEMED_PLAYLISTS:
+        return random.choice(THEMED_PLAYLISTS[playlist_type])
     return None
 
 def get_embed_color(embed_type: str) -> int:
@@ -0,0 +1,444 @@
+# 🌸 Nanali Music Bot v3.0 - Motor de Extracción
+# Workers de yt-dlp en procesos dedicados, con cola acotada y cancelación real
+
+import asyncio
+import multiprocessing
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+# ═══════════════════════════════════════════════════════════════
+# ⚠️ ERRORES DE EXTRACCIÓN
+# ═══════════════════════════════════════════════════════════════
+
+class ExtractionError(Exception):
+    """Error base del motor de extracción"""
+    pass
+
+class ExtractionTimeout(ExtractionError):
+    """La extracción superó el tiempo máximo y su worker fue terminado"""
+    pass
+
+class ExtractionQueueFull(ExtractionError):
+    """Hay demasiadas extracciones pendientes"""
+    pass
+
+class ExtractorUnavailable(ExtractionError):
+    """El circuit breaker está abierto: el extractor falla de forma sostenida"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+# Errores de yt-dlp que indican un problema del servicio y no del video pedido
+# ('Unable to download webpage: HTTP Error 404' o un video privado no cuentan;
+# '<urlopen error' sí: DNS o conexión rechazada)
+_UPSTREAM_ERROR_MARKERS = (
+    'HTTP Error 429', 'HTTP Error 5', '<urlopen error', 'timed out',
+    'Temporary failure', 'Connection reset', 'confirm you', 'rate-limit'
+)
+
+def is_upstream_error(message: str) -> bool:
+    return any(marker in message for marker in _UPSTREAM_ERROR_MARKERS)
+
+# ═══════════════════════════════════════════════════════════════
+# 📈 SALUD DEL EXTRACTOR
+# ═══════════════════════════════════════════════════════════════
+
+class LatencyTracker:
+    """Ventana deslizante de latencias y errores para derivar el timeout del p95"""
+
+    def __init__(
+        self,
+        window_size: int = 50,
+        min_samples: int = 10,
+        multiplier: float = 2.0,
+        min_timeout: float = 8,
+        max_timeout: float = 30
+    ):
+        self.samples = deque(maxlen=window_size)
+        self.min_samples = min_samples
+        self.multiplier = multiplier
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+
+    def record(self, latency: float, ok: bool):
+        self.samples.append((latency, ok))
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Percentil de las latencias exitosas, o None sin muestras suficientes"""
+        latencies = sorted(latency for latency, ok in self.samples if ok)
+        if len(latencies) < self.min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+    def error_rate(self) -> float:
+        """Proporción de fallos en la ventana, 0 sin muestras suficientes"""
+        if len(self.samples) < self.min_samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def timeout(self) -> float:
+        """Timeout actual: p95 observado con margen, acotado entre mínimo y máximo"""
+        p95 = self.percentile(0.95)
+        if p95 is None:
+            return self.max_timeout
+        return max(self.min_timeout, min(self.max_timeout, p95 * self.multiplier))
+
+class CircuitBreaker:
+    """Corta las extracciones durante fallos sostenidos y se recupera con backoff
+
+    Estados: 'closed' (normal), 'open' (falla al instante con el último error)
+    y 'half_open' (deja pasar una única prueba para comprobar si se recuperó).
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        base_delay: float = 2,
+        max_delay: float = 300,
+        exponential_backoff: bool = True
+    ):
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.exponential_backoff = exponential_backoff
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.open_count = 0
+        self.opened_until = 0.0
+        self.last_error = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == 'open' and time.monotonic() < self.opened_until
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_until - time.monotonic())
+
+    def before_call(self):
+        """Lanza ExtractorUnavailable si no se permite extraer ahora mismo"""
+        if self.state == 'closed':
+            return
+        if self.state == 'open' and time.monotonic() >= self.opened_until:
+            self.state = 'half_open'
+        if self.state == 'half_open' and not self._probing:
+            self._probing = True
+            return
+        raise ExtractorUnavailable(self.last_error or "Extractor no disponible", self.retry_after())
+
+    def release_probe(self):
+        """Libera la prueba en curso sin registrar resultado"""
+        self._probing = False
+
+    def record_success(self):
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.open_count = 0
+        self._probing = False
+
+    def record_failure(self, message: str, error_rate: float = 0.0, error_rate_threshold: float = 1.0):
+        self.last_error = message
+        self.consecutive_failures += 1
+        probe_failed = self.state == 'half_open'
+        self._probing = False
+        if probe_failed or self.consecutive_failures >= self.failure_threshold or error_rate >= error_rate_threshold:
+            self._open()
+
+    def _open(self):
+        self.open_count += 1
+        delay = self.base_delay
+        if self.exponential_backoff:
+            delay *= 2 ** (self.open_count - 1)
+        self.state = 'open'
+        self.opened_until = time.monotonic() + min(delay, self.max_delay)
+
+# ═══════════════════════════════════════════════════════════════
+# 👷 PROCESO WORKER
+# ═══════════════════════════════════════════════════════════════
+
+# Campos pesados que no necesitamos devolver al proceso principal
+_HEAVY_FIELDS = (
+    'formats', 'requested_formats', 'thumbnails', 'automatic_captions',
+    'subtitles', 'heatmap', 'chapters', 'description'
+)
+
+def _compact(info):
+    """Elimina los campos que no usamos para abaratar la comunicación entre procesos"""
+    if not isinstance(info, dict):
+        return info
+    for field in _HEAVY_FIELDS:
+        info.pop(field, None)
+    if isinstance(info.get('entries'), list):
+        info['entries'] = [_compact(entry) for entry in info['entries']]
+    return info
+
+def _worker_main(conn, ytdl_options):
+    """Bucle del proceso worker: una instancia propia de YoutubeDL por proceso"""
+    import yt_dlp
+
+    ydl = yt_dlp.YoutubeDL(ytdl_options)
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+
+        query, overrides = request
+        saved = {key: ydl.params.get(key) for key in overrides}
+        ydl.params.update(overrides)
+        try:
+            data = ydl.extract_info(query, download=False)
+            conn.send(('ok', _compact(ydl.sanitize_info(data))))
+        except Exception as e:
+            conn.send(('error', str(e)))
+        finally:
+            ydl.params.update(saved)
+
+# El cambio de __main__ al arrancar un worker no debe solaparse entre hilos
+_spawn_lock = threading.Lock()
+
+def _start_isolated(process):
+    """Arranca un proceso 'spawn' sin que vuelva a ejecutar el script principal
+
+    Con 'spawn' el hijo importa de nuevo el __main__ del padre (bot.py) como
+    __mp_main__, lo que recrearía las cachés, la cola persistente y demás
+    objetos de nivel de módulo, y cargaría discord y numpy en cada worker.
+    Mientras se arranca, __main__ apunta a este módulo, que solo usa la
+    biblioteca estándar y no tiene efectos al importarse.
+    """
+    with _spawn_lock:
+        main_module = sys.modules['__main__']
+        sys.modules['__main__'] = sys.modules[__name__]
+        try:
+            process.start()
+        finally:
+            sys.modules['__main__'] = main_module
+
+class _ExtractionWorker:
+    """Proceso worker con su extremo de la tubería"""
+
+    def __init__(self, context, ytdl_options):
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, ytdl_options),
+            daemon=True,
+            name='nanali-ytdl-worker'
+        )
+        _start_isolated(self.process)
+        child_conn.close()
+
+    def call(self, query: str, overrides: Dict):
+        """Envía una extracción y espera la respuesta (bloqueante, corre en un hilo)"""
+        try:
+            self._conn.send((query, overrides))
+            return self._conn.recv()
+        except (EOFError, OSError):
+            # El proceso fue terminado mientras extraía
+            self._conn.close()
+            return ('killed', None)
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self):
+        """Termina el proceso inmediatamente, liberando el hilo que lo espera"""
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=1)
+
+    def stop(self):
+        """Pide al proceso que termine de forma ordenada"""
+        try:
+            self._conn.send(None)
+        except (EOFError, OSError):
+            pass
+        self.process.join(timeout=1)
+        self.kill()
+        self._conn.close()
+
+# ═══════════════════════════════════════════════════════════════
+# ⚙️ MOTOR DE EXTRACCIÓN
+# ═══════════════════════════════════════════════════════════════
+
+class ExtractionEngine:
+    """Pool de procesos yt-dlp con concurrencia configurable
+
+    Cada worker tiene su propia instancia de YoutubeDL (no es thread-safe).
+    Cuando una extracción supera el timeout o se cancela, su proceso se termina
+    y se reemplaza por uno nuevo, así nunca quedan workers ocupados de más.
+    """
+
+    def __init__(
+        self,
+        ytdl_options: Dict,
+        workers: int = 2,
+        max_pending: int = 16,
+        timeout: float = 30,
+        health: Optional[Dict] = None,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.ytdl_options = ytdl_options
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        health = dict(health or {})
+        self.error_rate_threshold = health.pop('error_rate_threshold', 1.0)
+        # Las búsquedas planas son mucho más rápidas que una extracción completa
+        self.latency = {
+            'full': LatencyTracker(max_timeout=timeout, **health),
+            'flat': LatencyTracker(max_timeout=timeout, **health)
+        }
+        self.breaker = breaker or CircuitBreaker()
+        self._context = multiprocessing.get_context('spawn')
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ytdl-worker')
+        self._idle: Optional[asyncio.Queue] = None
+        self._pending = 0
+        self.killed_workers = 0
+
+    def _spawn(self) -> _ExtractionWorker:
+        return _ExtractionWorker(self._context, self.ytdl_options)
+
+    def _ensure_started(self):
+        # Los procesos se crean con el primer uso, no al importar el bot
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for _ in range(self.workers):
+                self._idle.put_nowait(self._spawn())
+
+    @property
+    def pending(self) -> int:
+        """Extracciones en curso o esperando un worker"""
+        return self._pending
+
+    async def extract(
+        self,
+        query: str,
+        overrides: Optional[Dict] = None,
+        timeout: Optional[float] = None
+    ) -> Dict:
+        """Extrae información con yt-dlp en un worker dedicado
+
+        Args:
+            query (str): URL o búsqueda ('ytsearch5:...')
+            overrides (Dict, optional): Opciones de yt-dlp solo para esta llamada
+            timeout (float, optional): Tiempo máximo; por defecto el derivado del p95
+
+        Returns:
+            Dict: Información extraída (sin formatos ni miniaturas)
+
+        Raises:
+            ExtractorUnavailable: Si el circuit breaker está abierto
+            ExtractionQueueFull: Si se superó el máximo de extracciones pendientes
+            ExtractionTimeout: Si se superó el tiempo máximo
+            ExtractionError: Si yt-dlp falló
+        """
+        if self._pending >= self.max_pending:
+            raise ExtractionQueueFull(f"Hay {self._pending} extracciones pendientes")
+        self.breaker.before_call()
+
+        self._ensure_started()
+        tracker = self.latency['flat' if overrides and overrides.get('extract_flat') else 'full']
+        timeout = timeout or tracker.timeout()
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        try:
+            worker = await self._idle.get()
+            if not worker.is_alive():
+                worker = self._spawn()
+
+            start_time = time.monotonic()
+            job = loop.run_in_executor(self._executor, worker.call, query, overrides or {})
+            try:
+                status, payload = await asyncio.wait_for(job, timeout=timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                # Cancelación real: terminar el proceso y reemplazarlo
+                worker.kill()
+                self.killed_workers += 1
+                worker = self._spawn()
+                if isinstance(e, asyncio.TimeoutError):
+                    message = f"La extracción superó {timeout:.0f}s"
+                    tracker.record(timeout, ok=False)
+                    self.breaker.record_failure(message, tracker.error_rate(), self.error_rate_threshold)
+                    raise ExtractionTimeout(message) from None
+                raise
+            finally:
+                self._idle.put_nowait(worker)
+        except asyncio.CancelledError:
+            # Una prueba cancelada no dice nada sobre la salud del extractor
+            self.breaker.release_probe()
+            raise
+        finally:
+            self._pending -= 1
+
+        latency = time.monotonic() - start_time
+        if status == 'ok':
+            tracker.record(latency, ok=True)
+            self.breaker.record_success()
+            return payload
+
+        message = payload or "El worker de extracción terminó inesperadamente"
+        if status == 'killed' or is_upstream_error(message):
+            tracker.record(latency, ok=False)
+            self.breaker.record_failure(message, tracker.error_rate(), self.error_rate_threshold)
+        else:
+            # Video no disponible, URL inválida...: el servicio sí respondió, pero
+            # esa latencia no es la de una extracción completa y no entra en el p95
+            self.breaker.record_success()
+        raise ExtractionError(message)
+
+    def close(self):
+        """Detiene todos los workers"""
+        if self._idle is not None:
+            while not self._idle.empty():
+                self._idle.get_nowait().stop()
+        self._executor.shutdown(wait=False)
+
+# ═══════════════════════════════════════════════════════════════
+# 🤝 AGRUPACIÓN DE PETICIONES IDÉNTICAS
+# ═══════════════════════════════════════════════════════════════
+
+class SingleFlight:
+    """Comparte una única extracción entre peticiones concurrentes con la misma clave"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.shared = 0
+
+    async def do(self, key: str, factory):
+        """Ejecuta factory() o se une a la ejecución en curso para la misma clave
+
+        Args:
+            key (str): Clave normalizada de la petición
+            factory: Función sin argumentos que devuelve la corrutina a ejecutar
+
+        Returns:
+            El resultado de la corrutina compartida
+        """
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._finish(key, f))
+        else:
+            self.shared += 1
+
+        # shield: si un solicitante se cancela, los demás siguen esperando el resultado
+        return await asyncio.shield(future)
+
+    def _finish(self, key: str, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # Marcar la excepción como recuperada aunque todos los solicitantes se hayan ido
+        if not future.cancelled():
+            future.exception()
+
+    def __len__(self) -> int:
+        return len(self._inflight)
@@ -0,0 +1,140 @@
+# 🌸 Nanali Music Bot v3.0 - Análisis de sonoridad
+# Mide una sola vez la sonoridad integrada de cada pista para igualar el volumen de la cola
+
+import asyncio
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from audio_config import FFMPEG_BEFORE_OPTIONS, log_debug
+
+# Línea "I: -14.2 LUFS" del resumen final del filtro ebur128
+_INTEGRATED_RE = re.compile(rb'I:\s+(-?\d+(?:\.\d+)?) LUFS')
+
+class LoudnessAnalyzer:
+    """Calcula en segundo plano la ganancia tipo ReplayGain de cada pista
+
+    El análisis (filtro ebur128 de FFmpeg) se hace una vez por pista, sobre
+    el archivo de la caché de audio en cuanto existe (o sobre la URL si la
+    pista nunca va a cachearse), y la ganancia resultante se guarda en SQLite
+    junto a la caché de pistas.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        target_lufs: float = -16.0,
+        max_gain: float = 6.0,
+        min_gain: float = -12.0,
+        max_duration: int = 900,
+        concurrency: int = 1,
+        enabled: bool = True
+    ):
+        self.target_lufs = target_lufs
+        self.max_gain = max_gain
+        self.min_gain = min_gain
+        self.max_duration = max_duration
+        self.enabled = enabled
+        self._gains: Dict[str, float] = {}
+        self._pending = set()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.analyzed = 0
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS track_loudness ('
+            'video_id TEXT PRIMARY KEY, integrated REAL NOT NULL, gain_db REAL NOT NULL)'
+        )
+        self._db.commit()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='loudness')
+        for video_id, gain_db in self._db.execute('SELECT video_id, gain_db FROM track_loudness'):
+            self._gains[video_id] = gain_db
+
+    def get_gain(self, video_id: Optional[str]) -> float:
+        """Ganancia en dB a aplicar a la pista (0 si aún no se analizó)"""
+        if not self.enabled or not video_id:
+            return 0.0
+        return self._gains.get(video_id, 0.0)
+
+    def needs_analysis(self, video_id: Optional[str], duration: Optional[int]) -> bool:
+        return (
+            self.enabled
+            and bool(video_id)
+            and video_id not in self._gains
+            and video_id not in self._pending
+            and bool(duration) and duration <= self.max_duration
+        )
+
+    async def measure(self, source: str) -> Optional[float]:
+        """Sonoridad integrada (LUFS) de un archivo o URL, o None si falló"""
+        before = FFMPEG_BEFORE_OPTIONS.split() if source.startswith(('http://', 'https://')) else ['-nostdin']
+        process = await asyncio.create_subprocess_exec(
+            'ffmpeg', *before, '-hide_banner', '-nostats', '-threads', '1', '-i', source,
+            # framelog=quiet: sin una línea por frame, solo el resumen final
+            '-vn', '-af', 'ebur128=framelog=quiet', '-f', 'null', '-',
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            _, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+        _, _, summary = stderr.rpartition(b'Summary:')
+        match = _INTEGRATED_RE.search(summary)
+        if process.returncode != 0 or not match:
+            return None
+        return float(match.group(1))
+
+    async def analyze(self, video_id: str, source: str):
+        """Mide la pista y guarda su ganancia"""
+        if video_id in self._pending:
+            return
+        self._pending.add(video_id)
+        try:
+            async with self._semaphore:
+                integrated = await self.measure(source)
+            # -70 LUFS es el umbral absoluto de la norma: silencio o pista vacía
+            if integrated is None or integrated <= -70:
+                log_debug(f"No se pudo medir la sonoridad de {video_id}", "loudness")
+                return
+            gain_db = min(self.max_gain, max(self.min_gain, self.target_lufs - integrated))
+            self._gains[video_id] = gain_db
+            self.analyzed += 1
+            self._writer.submit(self._db_put, video_id, integrated, gain_db)
+            log_debug(f"Sonoridad de {video_id}: {integrated:.1f} LUFS -> {gain_db:+.1f} dB", "loudness")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log_debug(f"Error analizando {video_id}: {e}", "loudness")
+        finally:
+            self._pending.discard(video_id)
+
+    def schedule(self, video_id: Optional[str], source: str, duration: Optional[int]):
+        """Programa el análisis en segundo plano si la pista aún no tiene ganancia"""
+        if self.needs_analysis(video_id, duration) and source:
+            asyncio.get_running_loop().create_task(self.analyze(video_id, source))
+
+    def _db_put(self, video_id: str, integrated: float, gain_db: float):
+        self._db.execute(
+            'INSERT OR REPLACE INTO track_loudness (video_id, integrated, gain_db) VALUES (?, ?, ?)',
+            (video_id, integrated, gain_db)
+        )
+        self._db.commit()
+
+    def __len__(self) -> int:
+        return len(self._gains)
+
+    def close(self) -> None:
+        """Termina las escrituras pendientes y cierra la base de datos"""
+        self._writer.shutdown(wait=True)
+        self._db.close()
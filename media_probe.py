@@ -0,0 +1,119 @@
+# 🌸 Nanali Music Bot v3.0 - Enlaces directos a archivos de audio
+# Detecta URLs que FFmpeg puede reproducir tal cual para no pasar por yt-dlp
+
+import asyncio
+import os
+from typing import Dict, Optional
+from urllib.parse import unquote, urlparse
+
+import aiohttp
+
+from audio_config import log_debug
+
+# ═══════════════════════════════════════════════════════════════
+# 🔎 DETECCIÓN DE MEDIOS DIRECTOS
+# ═══════════════════════════════════════════════════════════════
+
+# Sitios que siempre necesitan al extractor
+_EXTRACTOR_HOSTS = ('youtube.com', 'youtu.be', 'soundcloud.com', 'bandcamp.com', 'twitch.tv', 'vimeo.com')
+
+_MEDIA_CONTENT_TYPES = ('audio/', 'video/', 'application/ogg')
+
+class MediaProbe:
+    """Sondea URLs con un HEAD (o un GET de un byte) sobre una sesión HTTP compartida
+
+    Solo se sondean enlaces http(s) fuera de los sitios conocidos del
+    extractor; si la respuesta es audio o video, la URL va directa a FFmpeg.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 3,
+        max_connections: int = 10,
+        media_extensions: tuple = ()
+    ):
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_connections = max_connections
+        self.media_extensions = media_extensions
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Se crea dentro del event loop del bot, en el primer uso
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300),
+                timeout=self.timeout
+            )
+        return self._session
+
+    @staticmethod
+    def is_candidate(url: str) -> bool:
+        """Indica si vale la pena sondear la URL antes de usar el extractor"""
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+            return False
+        host = parsed.netloc.lower().split(':')[0]
+        return not any(host == site or host.endswith('.' + site) for site in _EXTRACTOR_HOSTS)
+
+    def _is_media(self, content_type: str, url: str) -> bool:
+        if content_type.startswith(_MEDIA_CONTENT_TYPES):
+            return True
+        # Muchos servidores sirven los archivos como binario genérico
+        extension = os.path.splitext(urlparse(url).path)[1].lower()
+        return content_type in ('application/octet-stream', '') and extension in self.media_extensions
+
+    async def _request(self, method: str, url: str, headers: Optional[Dict] = None):
+        async with self._get_session().request(method, url, headers=headers, allow_redirects=True) as response:
+            return response.status, response.headers.copy(), str(response.url)
+
+    async def probe(self, url: str) -> Optional[Dict]:
+        """Devuelve la pista si la URL es un archivo de audio/video directo, o None
+
+        Returns:
+            Dict: url, title, duration, uploader, webpage_url, cache_key,
+            content_type y content_length (como get_audio_source)
+        """
+        try:
+            status, headers, final_url = await self._request('HEAD', url)
+            if status >= 400:
+                # Hay servidores que no aceptan HEAD: pedir solo el primer byte
+                status, headers, final_url = await self._request('GET', url, headers={'Range': 'bytes=0-0'})
+            if status >= 400:
+                self.misses += 1
+                return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log_debug(f"No se pudo sondear {url[:60]}: {e}", "media_probe")
+            self.misses += 1
+            return None
+
+        content_type = headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if not self._is_media(content_type, final_url):
+            self.misses += 1
+            return None
+
+        # En una respuesta 206 el tamaño total va en Content-Range
+        content_length = headers.get('Content-Length')
+        content_range = headers.get('Content-Range', '')
+        if '/' in content_range and content_range.rsplit('/', 1)[1].isdigit():
+            content_length = content_range.rsplit('/', 1)[1]
+
+        parsed = urlparse(final_url)
+        filename = unquote(os.path.basename(parsed.path)) or parsed.netloc
+        self.hits += 1
+        return {
+            'url': final_url,
+            'title': os.path.splitext(filename)[0] or filename,
+            'duration': None,
+            'uploader': parsed.netloc,
+            'webpage_url': url,
+            'cache_key': None,
+            'content_type': content_type,
+            'content_length': int(content_length) if content_length and content_length.isdigit() else None
+        }
+
+    async def close(self):
+        """Cierra la sesión HTTP compartida"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
@@ -0,0 +1,159 @@
+# 🌸 Nanali Music Bot v3.0 - Reproductor por servidor
+# Cada servidor tiene su propia cola, conexión de voz, efectos y volumen
+
+from typing import Callable, Dict, Iterator, Optional
+
+import discord
+
+from audio_sources import AudioEffects
+from tracks import TrackQueue
+
+# ═══════════════════════════════════════════════════════════════
+# 🎚️ ESTADO DE REPRODUCCIÓN DE UN SERVIDOR
+# ═══════════════════════════════════════════════════════════════
+
+class GuildPlayer:
+    """Todo lo que antes eran globales de bot.py, aislado por servidor
+
+    Los comandos y play_next reciben el reproductor de su servidor, así que
+    dos servidores nunca comparten cola, conexión ni ajustes de audio. Cada
+    reproductor solo se toca desde el event loop, por lo que no necesita locks.
+    """
+
+    def __init__(
+        self,
+        guild_id: int,
+        bass_levels: Dict[int, float],
+        crossfade: float = 0.0,
+        crossfade_curve: str = 'equal_power',
+        queue_options: Optional[Dict] = None
+    ):
+        self.guild_id = guild_id
+        # Planificador y cupos de la cola (ver tracks.TrackQueue)
+        self.queue = TrackQueue(**(queue_options or {}))
+        self.voice_client: Optional[discord.VoiceClient] = None
+        # Canal donde se anuncian las canciones (el del último comando de reproducción)
+        self.text_channel: Optional[discord.abc.Messageable] = None
+        self.current_song = None
+        self.is_processing = False
+        # off, song (repite la actual) o queue (la terminada vuelve al final de la cola)
+        self.loop_mode = 'off'
+        # !skip pasa a la siguiente aunque la canción actual se esté repitiendo
+        self.skip_requested = False
+        self.volume = 100
+        self.bass_level = 0
+        # Bass boost y filtros, aplicados en vivo a cada frame PCM de este servidor
+        self.effects = AudioEffects(bass_levels)
+        self.crossfade_seconds = crossfade
+        self.crossfade_curve = crossfade_curve
+        # Fuente única del reproductor (encadena y funde las pistas) y su preparación
+        self.mixer = None
+        self.prefetch_task = None
+        self.transition_task = None
+        # Siguiente canción ya abierta que el mezclador no pudo encadenar: (canción, stream, local_path, fuente)
+        self.prepared_track = None
+        # Reintentos de la canción actual tras cortes a mitad de reproducción
+        self.recovery_attempts = 0
+        # Canción restaurada tras un reinicio y segundo en que iba: (pista, posición)
+        self.resume_from = None
+
+    def is_connected(self) -> bool:
+        return self.voice_client is not None and self.voice_client.is_connected()
+
+    def is_playing(self) -> bool:
+        return self.is_connected() and self.voice_client.is_playing()
+
+    def is_idle(self) -> bool:
+        """Ni reproduciendo ni abriendo una canción: hay que arrancar play_next"""
+        return not self.is_processing and not self.is_playing()
+
+    def upcoming(self):
+        """Canción que sonará a continuación: la actual si se repite, si no la primera de la cola"""
+        if self.loop_mode == 'song' and self.current_song is not None:
+            return self.current_song
+        return self.queue.peek()
+
+    def advance(self):
+        """Pasa a la siguiente canción según el modo de repetición y la devuelve
+
+        Nada se vuelve a extraer: la pista repetida conserva su cache_key, así
+        que se abre desde audio_cache o con la URL aún vigente de track_cache.
+        """
+        finished, skipped = self.current_song, self.skip_requested
+        self.skip_requested = False
+        if finished is not None:
+            if self.loop_mode == 'song' and not skipped:
+                return finished
+            if self.loop_mode == 'queue':
+                # La terminada vuelve detrás de todas: la cola rota sin copiarse
+                self.queue.rotate(finished)
+        self.current_song = self.queue.popleft() if self.queue else None
+        return self.current_song
+
+    def discard_prepared(self):
+        """Cierra la canción abierta en espera (y su proceso FFmpeg), si la hay"""
+        if self.prepared_track is not None:
+            self.prepared_track[3].cleanup()
+            self.prepared_track = None
+
+    def take_prepared(self, song_info):
+        """Devuelve (stream, local_path, fuente) si song_info ya estaba abierta en espera"""
+        if self.prepared_track is None or self.prepared_track[0] is not song_info:
+            self.discard_prepared()
+            return None
+        _, stream, local_path, source = self.prepared_track
+        self.prepared_track = None
+        return stream, local_path, source
+
+    def cancel_tasks(self):
+        for task in (self.prefetch_task, self.transition_task):
+            if task and not task.done():
+                task.cancel()
+
+    def reset(self):
+        """Vacía la cola y suelta todo lo preparado para la siguiente canción"""
+        self.queue.clear()
+        self.current_song = None
+        self.skip_requested = False
+        self.resume_from = None
+        self.cancel_tasks()
+        self.discard_prepared()
+
+# ═══════════════════════════════════════════════════════════════
+# 🗂️ REGISTRO DE REPRODUCTORES
+# ═══════════════════════════════════════════════════════════════
+
+class PlayerRegistry:
+    """Reproductores por ID de servidor, creados en el primer uso
+
+    on_create(player) se llama con cada reproductor nuevo (p. ej. para
+    restaurar su cola guardada).
+    """
+
+    def __init__(self, on_create: Optional[Callable[[GuildPlayer], None]] = None, **player_options):
+        self.on_create = on_create
+        self.player_options = player_options
+        self._players: Dict[int, GuildPlayer] = {}
+
+    def get(self, guild: discord.abc.Snowflake) -> GuildPlayer:
+        player = self._players.get(guild.id)
+        if player is None:
+            player = self._players[guild.id] = GuildPlayer(guild.id, **self.player_options)
+            if self.on_create:
+                self.on_create(player)
+        return player
+
+    def find(self, guild_id: int) -> Optional[GuildPlayer]:
+        return self._players.get(guild_id)
+
+    def remove(self, guild_id: int) -> None:
+        """Descarta el reproductor de un servidor (al desconectarse)"""
+        player = self._players.pop(guild_id, None)
+        if player is not None:
+            player.reset()
+
+    def __iter__(self) -> Iterator[GuildPlayer]:
+        return iter(list(self._players.values()))
+
+    def __len__(self) -> int:
+        return len(self._players)
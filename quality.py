@@ -0,0 +1,162 @@
+# 🌸 Nanali Music Bot v3.0 - Calidad de audio adaptativa
+# Baja el bitrate de Opus cuando el proceso se satura para que ningún stream se entrecorte
+
+import asyncio
+import os
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from audio_config import log_debug
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# ═══════════════════════════════════════════════════════════════
+# 📉 CONTROL DE CALIDAD SEGÚN LA CARGA
+# ═══════════════════════════════════════════════════════════════
+
+class QualityController:
+    """Elige el preset de calidad según la CPU del proceso, el retraso del event loop y los streams activos
+
+    Cada métrica tiene dos umbrales (tranquilo, saturado): si alguna supera
+    el de saturación se pasa al preset más bajo, si alguna supera el de
+    tranquilidad al intermedio, y si no al más alto. Bajar es inmediato;
+    subir se hace de un nivel en un nivel tras 'upgrade_after' muestras
+    seguidas en calma, para no oscilar. Los streams nuevos usan el preset
+    vigente y los que ya suenan se reajustan en el codificador Opus.
+    """
+
+    def __init__(
+        self,
+        presets: Dict[str, Dict],
+        voice_clients: Callable[[], Iterable],
+        levels: Sequence[str] = ('low', 'medium', 'high'),
+        interval: float = 5.0,
+        cpu_percent: Tuple[float, float] = (60, 85),
+        loop_lag: Tuple[float, float] = (0.02, 0.1),
+        streams: Tuple[int, int] = (4, 12),
+        upgrade_after: int = 3,
+        enabled: bool = True
+    ):
+        self.presets = presets
+        self.voice_clients = voice_clients
+        self.levels = list(levels)
+        self.interval = interval
+        self.limits = {'cpu': cpu_percent, 'lag': loop_lag, 'streams': streams}
+        self.upgrade_after = upgrade_after
+        self.enabled = enabled
+        self.level = self.levels[-1]
+        self.metrics = {'cpu': 0.0, 'lag': 0.0, 'streams': 0}
+        self.downgrades = 0
+        self._calm_samples = 0
+        self._process = psutil.Process(os.getpid()) if psutil else None
+        self._task = None
+
+    @property
+    def preset(self) -> Dict:
+        return self.presets[self.level]
+
+    @staticmethod
+    def _kbps(preset: Dict) -> int:
+        return int(str(preset['bitrate']).rstrip('k'))
+
+    def play_kwargs(self, channel_bitrate: Optional[int] = None) -> Dict:
+        """Parámetros del codificador Opus para voice_client.play()
+
+        El bitrate no pasa del del canal de voz (en bps): Discord lo recorta igual.
+        """
+        kbps = self._kbps(self.preset)
+        if channel_bitrate:
+            kbps = min(kbps, channel_bitrate // 1000)
+        return {'bitrate': kbps, 'bandwidth': self.preset['bandwidth']}
+
+    def _target_level(self) -> str:
+        index = len(self.levels) - 1
+        for name, value in self.metrics.items():
+            calm, saturated = self.limits[name]
+            if value >= saturated:
+                return self.levels[0]
+            if value >= calm:
+                index = min(index, len(self.levels) - 2)
+        return self.levels[max(0, index)]
+
+    def update(self):
+        """Recalcula el nivel con las últimas métricas y reajusta los streams si cambió"""
+        current = self.levels.index(self.level)
+        target = self.levels.index(self._target_level())
+        if target < current:
+            self._calm_samples = 0
+            self.downgrades += 1
+            self._set_level(self.levels[target])
+        elif target > current:
+            self._calm_samples += 1
+            if self._calm_samples >= self.upgrade_after:
+                self._calm_samples = 0
+                self._set_level(self.levels[current + 1])
+        else:
+            self._calm_samples = 0
+
+    def _set_level(self, level: str):
+        log_debug(
+            f"Calidad {self.level} -> {level} (CPU {self.metrics['cpu']:.0f}%, "
+            f"lag {self.metrics['lag'] * 1000:.0f}ms, {self.metrics['streams']} streams)",
+            "quality"
+        )
+        self.level = level
+        self.retune()
+
+    def retune(self):
+        """Aplica el preset vigente a los codificadores de los streams que ya suenan
+
+        El cambio se entrega al hilo de audio del mezclador, que es el que
+        codifica: libopus no admite que otro hilo toque el mismo codificador a
+        la vez. Las fuentes sin ese enganche se ajustan en su próximo play().
+        """
+        for voice_client in self.voice_clients():
+            # En paso directo Opus no hay codificador (discord.py deja MISSING, que es falso)
+            encoder = getattr(voice_client, 'encoder', None)
+            source = getattr(voice_client, 'source', None)
+            if not encoder or not voice_client.is_playing() or source is None or source.is_opus():
+                continue
+            call_in_audio_thread = getattr(source, 'call_in_audio_thread', None)
+            if call_in_audio_thread is None:
+                continue
+            kwargs = self.play_kwargs(getattr(voice_client.channel, 'bitrate', None))
+            call_in_audio_thread(lambda encoder=encoder, kwargs=kwargs: self._apply(encoder, kwargs))
+
+    @staticmethod
+    def _apply(encoder, kwargs: Dict):
+        encoder.set_bitrate(kwargs['bitrate'])
+        encoder.set_bandwidth(kwargs['bandwidth'])
+
+    def sample(self, lag: float):
+        """Toma las métricas de carga; lag es el retraso medido del event loop"""
+        # CPU del proceso del bot en % de un núcleo: DSP y Opus comparten el GIL
+        self.metrics['cpu'] = self._process.cpu_percent(None) if self._process else 0.0
+        self.metrics['lag'] = lag
+        self.metrics['streams'] = sum(1 for voice_client in self.voice_clients() if voice_client.is_playing())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        if self._process:
+            # La primera lectura de cpu_percent solo fija el punto de partida
+            self._process.cpu_percent(None)
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            try:
+                self.sample(max(0.0, loop.time() - started - self.interval))
+                self.update()
+            except Exception as e:
+                # Un cliente de voz en mal estado no debe parar el control de calidad
+                log_debug(f"Error al ajustar la calidad: {e}", "quality")
+
+    def start(self):
+        """Inicia el muestreo periódico (idempotente)"""
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
@@ -0,0 +1,230 @@
+# 🌸 Nanali Music Bot v3.0 - Persistencia de colas
+# Guarda la cola y la canción actual de cada servidor para retomarlas tras un reinicio
+
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from audio_config import log_debug
+from tracks import Track
+
+# Posición reservada en guild_queue_tracks para la canción que estaba sonando
+_CURRENT_INDEX = -1
+
+_TRACK_COLUMNS = 'title, duration, uploader, requester, webpage_url, cache_key, original_url, requester_id'
+
+class QueueStore:
+    """Colas por servidor en SQLite (WAL) con escrituras agrupadas y diferidas
+
+    Los cambios solo marcan el servidor como pendiente; 'flush_delay'
+    segundos después se toma una foto de todos los pendientes y se escribe
+    en una sola transacción en el hilo de escritura, fuera del event loop.
+    Mientras suena algo, la posición se guarda cada 'checkpoint_interval'.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        flush_delay: float = 2.0,
+        checkpoint_interval: float = 15.0,
+        enabled: bool = True
+    ):
+        self.flush_delay = flush_delay
+        self.checkpoint_interval = checkpoint_interval
+        self.enabled = enabled
+        self.writes = 0
+        # guild_id -> reproductor con cambios sin guardar
+        self._dirty: Dict[int, object] = {}
+        self._flush_handle = None
+        self._checkpoint_task = None
+        self._closed = False
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS guild_queue_state ('
+            'guild_id INTEGER PRIMARY KEY, voice_channel_id INTEGER, text_channel_id INTEGER, '
+            'position REAL NOT NULL, loop_mode TEXT NOT NULL, volume INTEGER NOT NULL, updated_at REAL NOT NULL)'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS guild_queue_tracks ('
+            'guild_id INTEGER NOT NULL, idx INTEGER NOT NULL, title TEXT NOT NULL, duration INTEGER, '
+            'uploader TEXT NOT NULL, requester TEXT NOT NULL, webpage_url TEXT NOT NULL, '
+            'cache_key TEXT, original_url TEXT, requester_id INTEGER, PRIMARY KEY (guild_id, idx))'
+        )
+        # Bases creadas antes de guardar el ID de quien pidió cada canción
+        columns = {row[1] for row in self._db.execute('PRAGMA table_info(guild_queue_tracks)')}
+        if 'requester_id' not in columns:
+            self._db.execute('ALTER TABLE guild_queue_tracks ADD COLUMN requester_id INTEGER')
+        self._db.commit()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='queue-store')
+        # Las lecturas van por su propia conexión: con WAL no esperan a las escrituras
+        self._reader = sqlite3.connect(db_path, check_same_thread=False)
+
+    # ─── Lectura (perezosa, por servidor) ───
+
+    def load(self, guild_id: int) -> Optional[Dict]:
+        """Estado guardado de un servidor, o None
+
+        Returns:
+            Dict: tracks (la canción actual primero, si la había), position
+            (segundo en que iba esa canción), voice_channel_id, text_channel_id,
+            loop_mode y volume
+        """
+        if not self.enabled:
+            return None
+        row = self._reader.execute(
+            'SELECT voice_channel_id, text_channel_id, position, loop_mode, volume '
+            'FROM guild_queue_state WHERE guild_id = ?', (guild_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        rows = self._reader.execute(
+            f'SELECT idx, {_TRACK_COLUMNS} FROM guild_queue_tracks WHERE guild_id = ? ORDER BY idx',
+            (guild_id,)
+        ).fetchall()
+        tracks = [
+            Track(title, duration, uploader, requester, webpage_url, cache_key, original_url, requester_id)
+            for _, title, duration, uploader, requester, webpage_url, cache_key, original_url, requester_id in rows
+        ]
+        has_current = bool(rows) and rows[0][0] == _CURRENT_INDEX
+        voice_channel_id, text_channel_id, position, loop_mode, volume = row
+        return {
+            'tracks': tracks,
+            'position': position if has_current else 0.0,
+            'voice_channel_id': voice_channel_id,
+            'text_channel_id': text_channel_id,
+            'loop_mode': loop_mode,
+            'volume': volume
+        }
+
+    def playing_guilds(self) -> List[Tuple[int, int]]:
+        """(servidor, canal de voz) de los que estaban reproduciendo al guardarse"""
+        if not self.enabled:
+            return []
+        return self._reader.execute(
+            'SELECT s.guild_id, s.voice_channel_id FROM guild_queue_state s JOIN guild_queue_tracks t '
+            'ON t.guild_id = s.guild_id AND t.idx = ? WHERE s.voice_channel_id IS NOT NULL',
+            (_CURRENT_INDEX,)
+        ).fetchall()
+
+    # ─── Escritura diferida ───
+
+    def mark_dirty(self, player) -> None:
+        """Anota que el estado del servidor cambió; se guardará en el próximo lote"""
+        if not self.enabled or self._closed:
+            return
+        self._dirty[player.guild_id] = player
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.flush_delay, self.flush)
+
+    @staticmethod
+    def _snapshot(player):
+        # Solo referencias: las pistas no cambian, se serializan en el hilo de escritura
+        current = player.current_song
+        voice_client = player.voice_client
+        connected = voice_client is not None and voice_client.is_connected()
+        return (
+            player.guild_id,
+            voice_client.channel.id if connected and current is not None else None,
+            player.text_channel.id if getattr(player.text_channel, 'id', None) else None,
+            player.mixer.position if player.mixer is not None and current is not None else 0.0,
+            player.loop_mode,
+            player.volume,
+            current,
+            list(player.queue)
+        )
+
+    def flush(self) -> None:
+        """Escribe ya todos los servidores pendientes (una transacción)"""
+        self._flush_handle = None
+        if not self._dirty:
+            return
+        snapshots = [self._snapshot(player) for player in self._dirty.values()]
+        self._dirty.clear()
+        self._writer.submit(self._db_write, snapshots)
+
+    def forget(self, guild_id: int) -> None:
+        """Borra el estado de un servidor (cola vaciada o bot desconectado)"""
+        if not self.enabled or self._closed:
+            return
+        self._dirty.pop(guild_id, None)
+        self._writer.submit(self._db_delete, guild_id)
+
+    def _db_write(self, snapshots):
+        now = time.time()
+        try:
+            with self._db:
+                for guild_id, voice_channel_id, text_channel_id, position, loop_mode, volume, current, queue in snapshots:
+                    self._db.execute('DELETE FROM guild_queue_tracks WHERE guild_id = ?', (guild_id,))
+                    if current is None and not queue:
+                        self._db.execute('DELETE FROM guild_queue_state WHERE guild_id = ?', (guild_id,))
+                        continue
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO guild_queue_state '
+                        '(guild_id, voice_channel_id, text_channel_id, position, loop_mode, volume, updated_at) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (guild_id, voice_channel_id, text_channel_id, position, loop_mode, volume, now)
+                    )
+                    entries = ([(_CURRENT_INDEX, current)] if current is not None else []) + list(enumerate(queue))
+                    self._db.executemany(
+                        f'INSERT INTO guild_queue_tracks (guild_id, idx, {_TRACK_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        [
+                            (guild_id, idx, t.title, t.duration, t.uploader, t.requester, t.webpage_url, t.cache_key, t.original_url, t.requester_id)
+                            for idx, t in entries
+                        ]
+                    )
+            self.writes += 1
+        except sqlite3.Error as e:
+            log_debug(f"No se pudieron guardar las colas: {e}", "queue_store")
+
+    def _db_delete(self, guild_id: int):
+        with self._db:
+            self._db.execute('DELETE FROM guild_queue_tracks WHERE guild_id = ?', (guild_id,))
+            self._db.execute('DELETE FROM guild_queue_state WHERE guild_id = ?', (guild_id,))
+
+    # ─── Posición de lo que está sonando ───
+
+    async def _checkpoint(self, players):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            for player in players:
+                if player.mixer is not None and player.current_song is not None:
+                    self.mark_dirty(player)
+
+    def start(self, players: Iterable) -> None:
+        """Inicia el guardado periódico de posiciones (idempotente)"""
+        if self.enabled and (self._checkpoint_task is None or self._checkpoint_task.done()):
+            self._checkpoint_task = asyncio.get_running_loop().create_task(self._checkpoint(players))
+
+    def shutdown(self, players: Iterable) -> None:
+        """Guarda por última vez lo que suena y deja de aceptar cambios
+
+        Se llama antes de desconectar la voz, para que el cierre de los
+        reproductores no se guarde como si la cola hubiera avanzado.
+        """
+        if not self.enabled or self._closed:
+            return
+        if self._checkpoint_task:
+            self._checkpoint_task.cancel()
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        for player in players:
+            if player.current_song is not None or player.queue:
+                self._dirty[player.guild_id] = player
+        self.flush()
+        self._closed = True
+
+    def close(self) -> None:
+        """Termina las escrituras pendientes y cierra la base de datos"""
+        self._closed = True
+        self._writer.shutdown(wait=True)
+        self._reader.close()
+        self._db.close()
@@ -58,12 +58,13 @@ def install_requirements():
     print(f"\n{Colors.BLUE}📦 Instalando dependencias de Python...{Colors.END}")
     
     requirements = [
-        'discord.py[voice]>=2.3.0',
+        'discord.py[voice]>=2.4.0',
         'yt-dlp>=2023.7.6',
         'PyNaCl>=1.5.0',
         'python-dotenv>=1.0.0',
         'aiohttp>=3.8.0',
-        'psutil>=5.9.0'
+        'psutil>=5.9.0',
+        'numpy>=1.24.0'
     ]
     
     for req in requirements:
@@ -45,7 +45,8 @@ def check_dependencies():
         'yt_dlp': 'yt-dlp',
         'dotenv': 'python-dotenv',
         'aiohttp': 'aiohttp',
-        'psutil': 'psutil'
+        'psutil': 'psutil',
+        'numpy': 'numpy'
     }
     
     missing_packages = []
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pruebas de la caché de audio en disco (audio_cache.py)
+"""
+
+import asyncio
+
+from audio_cache import AudioFileCache
+
+STREAM = {'url': 'https://example.com/audio.webm', 'acodec': 'opus'}
+
+def schedule_plays(cache, video_id, plays):
+    """Simula varias reproducciones por streaming y devuelve cuáles programaron la descarga"""
+    stored = []
+
+    async def fake_store(video_id, stream, on_stored=None):
+        stored.append(video_id)
+
+    cache.store = fake_store
+
+    async def run():
+        results = [cache.schedule_store(video_id, STREAM, 200) for _ in range(plays)]
+        await asyncio.sleep(0)
+        return results
+
+    return asyncio.run(run()), stored
+
+def test_first_play_does_not_download_twice(tmp_path):
+    """La primera reproducción solo se cuenta; la segunda guarda la pista"""
+    cache = AudioFileCache(str(tmp_path / 'audio'), str(tmp_path / 'cache.db'), store_after=2)
+    try:
+        results, stored = schedule_plays(cache, 'abc', 2)
+        assert results == [False, True]
+        assert stored == ['abc']
+    finally:
+        cache.close()
+
+def test_store_after_one_keeps_first_play_caching(tmp_path):
+    cache = AudioFileCache(str(tmp_path / 'audio'), str(tmp_path / 'cache.db'), store_after=1)
+    try:
+        results, stored = schedule_plays(cache, 'abc', 1)
+        assert results == [True]
+        assert stored == ['abc']
+    finally:
+        cache.close()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pruebas de las fuentes de audio en el bot (audio_sources.py)
+"""
+
+import threading
+
+import discord
+import numpy as np
+import pytest
+
+from audio_sources import (
+    CHANNELS, FRAME_BYTES, FRAME_SAMPLES, OPUS_SILENCE, SUB_BLOCK,
+    AudioEffects, BlockBiquad, BufferedAudioSource, CrossfadeMixer, EffectsProcessor,
+    VolumeAudioSource, shelf_coefficients
+)
+
+BLOCKS = FRAME_SAMPLES // SUB_BLOCK
+
+class FrameSource(discord.AudioSource):
+    """Fuente PCM sintética: 'frames' frames de 20 ms con un valor constante"""
+
+    def __init__(self, frames, value=1000, opus=False):
+        self.remaining = frames
+        self.value = value
+        self.opus = opus
+        self.cleaned = False
+
+    def read(self):
+        if self.remaining <= 0:
+            return b''
+        self.remaining -= 1
+        if self.opus:
+            return b'\x01\x02'
+        return np.full(FRAME_SAMPLES * CHANNELS, self.value, dtype=np.int16).tobytes()
+
+    def is_opus(self):
+        return self.opus
+
+    def cleanup(self):
+        self.cleaned = True
+
+def frame_value(frame):
+    return np.frombuffer(frame, dtype=np.int16)
+
+def reference_biquad(b, a, samples):
+    """Biquad muestra a muestra (forma directa II transpuesta, como lfilter)"""
+    b0, b1, b2 = b
+    a1, a2 = a
+    out = np.empty_like(samples)
+    z1 = np.zeros(samples.shape[1])
+    z2 = np.zeros(samples.shape[1])
+    for n, x in enumerate(samples):
+        y = b0 * x + z1
+        z1 = b1 * x - a1 * y + z2
+        z2 = b2 * x - a2 * y
+        out[n] = y
+    return out
+
+# ═══════════════════════════════════════════════════════════════
+# 🎛️ FILTROS
+# ═══════════════════════════════════════════════════════════════
+
+@pytest.mark.parametrize('kind,gain_db,frequency', [('low', 9, 100), ('high', -6, 3000), ('high', 4, 8000)])
+def test_block_biquad_matches_per_sample_filter(kind, gain_db, frequency):
+    """El filtrado por bloques coincide con la recursión muestra a muestra, también entre frames"""
+    b, a = shelf_coefficients(kind, gain_db, frequency)
+    rng = np.random.default_rng(0)
+    signal = rng.uniform(-1, 1, (4 * FRAME_SAMPLES, CHANNELS))
+
+    biquad = BlockBiquad(b, a)
+    out = np.empty((BLOCKS, SUB_BLOCK, CHANNELS))
+    blocked = []
+    for start in range(0, len(signal), FRAME_SAMPLES):
+        frame = signal[start:start + FRAME_SAMPLES].reshape(BLOCKS, SUB_BLOCK, CHANNELS)
+        blocked.append(biquad.process(frame, out).reshape(FRAME_SAMPLES, CHANNELS).copy())
+
+    np.testing.assert_allclose(np.concatenate(blocked), reference_biquad(b, a, signal), rtol=0, atol=1e-9)
+
+def test_effects_processor_matches_cascaded_reference():
+    """Bass + agudos sobre frames int16 equivalen a los dos shelves en cascada (±1 LSB)"""
+    effects = AudioEffects({1: 6})
+    effects.set_bass_level(1)
+    effects.toggle_filter('vocal')
+    params = effects.parameters()
+    processor = EffectsProcessor(effects)
+
+    rng = np.random.default_rng(1)
+    # Amplitud baja para que el limitador no intervenga
+    pcm = rng.integers(-3000, 3000, (3 * FRAME_SAMPLES, CHANNELS), dtype=np.int16)
+    processed = np.concatenate([
+        frame_value(processor.process(pcm[start:start + FRAME_SAMPLES].tobytes())).reshape(FRAME_SAMPLES, CHANNELS)
+        for start in range(0, len(pcm), FRAME_SAMPLES)
+    ])
+
+    expected = pcm / 32768
+    expected = reference_biquad(*shelf_coefficients('low', params['bass'], processor.bass_frequency), expected)
+    expected = reference_biquad(*shelf_coefficients('high', params['treble'], processor.treble_frequency), expected)
+    expected = np.clip(expected * 32768, -32768, 32767).astype(np.int16)
+    assert np.abs(processed.astype(np.int32) - expected).max() <= 1
+
+# ═══════════════════════════════════════════════════════════════
+# 🔊 VOLUMEN
+# ═══════════════════════════════════════════════════════════════
+
+def test_volume_passes_through_at_unity():
+    frame = FrameSource(1, value=1234).read()
+    source = VolumeAudioSource(FrameSource(1, value=1234))
+    assert source.read() == frame
+
+def test_volume_scales_and_ramps():
+    source = VolumeAudioSource(FrameSource(4, value=10000), volume=0.5, ramp_step=0.25)
+    steady = frame_value(source.read())
+    assert np.abs(steady.astype(np.int32) - 5000).max() <= 1
+
+    # Subir de 0.5 a 1.0 se reparte en rampas de como mucho 0.25 por frame
+    source.volume = 1.0
+    ramp = frame_value(source.read()).reshape(FRAME_SAMPLES, CHANNELS)[:, 0]
+    assert np.all(np.diff(ramp.astype(np.int32)) >= 0)
+    assert abs(int(ramp[-1]) - 7500) <= 1
+    assert abs(int(frame_value(source.read())[-1]) - 10000) <= 1
+    # Alcanzado el objetivo, el frame siguiente ya no tiene rampa
+    assert np.abs(frame_value(source.read()).astype(np.int32) - 10000).max() <= 1
+
+def test_volume_soft_clips_above_full_scale():
+    source = VolumeAudioSource(FrameSource(1, value=30000), volume=1.5, max_volume=1.5)
+    samples = frame_value(source.read())
+    # Sin recorte duro ni desbordamiento: queda entre la entrada y el fondo de escala
+    assert np.all(samples > 30000)
+    assert np.all(samples < 32767)
+
+    negative = VolumeAudioSource(FrameSource(1, value=-30000), volume=1.5, max_volume=1.5)
+    np.testing.assert_array_equal(frame_value(negative.read()), -samples)
+
+def test_volume_clamps_to_max_volume():
+    source = VolumeAudioSource(FrameSource(1), volume=5.0, max_volume=1.5)
+    assert source.volume == 1.5
+    source.volume = -1
+    assert source.volume == 0.0
+
+# ═══════════════════════════════════════════════════════════════
+# 📶 BÚFER
+# ═══════════════════════════════════════════════════════════════
+
+class BlockingSource(FrameSource):
+    """Entrega unos frames y luego se bloquea hasta que se libera"""
+
+    def __init__(self, frames, value=1000):
+        super().__init__(frames + 1, value)
+        self.before_block = frames
+        self.release = threading.Event()
+
+    def read(self):
+        if self.before_block == 0:
+            self.release.wait()
+            return b''
+        self.before_block -= 1
+        return super().read()
+
+class CountingSource(FrameSource):
+    """Cada frame lleva su número de orden como valor"""
+
+    def read(self):
+        self.value = self.frames_read = getattr(self, 'frames_read', -1) + 1
+        return super().read()
+
+def test_buffered_source_keeps_order_and_ends():
+    original = CountingSource(5)
+    source = BufferedAudioSource(original, seconds=0.2, prefill=0.02)
+    frames = [source.read() for _ in range(6)]
+    assert [int(frame_value(frame)[0]) for frame in frames[:5]] == [0, 1, 2, 3, 4]
+    assert frames[5] == b''
+    assert source.underruns == 0
+    source.cleanup()
+    assert original.cleaned
+
+def test_buffered_source_fills_underrun_with_silence():
+    original = BlockingSource(2)
+    source = BufferedAudioSource(original, seconds=0.2, prefill=0.04, underrun_wait=0.01)
+    assert len(source.read()) == FRAME_BYTES
+    assert len(source.read()) == FRAME_BYTES
+    assert source.read() == bytes(FRAME_BYTES)
+    assert source.underruns == 1
+    original.release.set()
+    source.cleanup()
+
+def test_buffered_opus_underrun_uses_opus_silence():
+    original = BlockingSource(0)
+    original.opus = True
+    source = BufferedAudioSource(original, seconds=0.2, prefill=0.02, startup_timeout=0.01, underrun_wait=0.01)
+    assert source.is_opus()
+    assert source.read() == OPUS_SILENCE
+    original.release.set()
+    source.cleanup()
+
+# ═══════════════════════════════════════════════════════════════
+# 🔀 MEZCLADOR
+# ═══════════════════════════════════════════════════════════════
+
+def read_all(mixer, limit=1000):
+    frames = []
+    for _ in range(limit):
+        frame = mixer.read()
+        if not frame:
+            break
+        frames.append(frame)
+    return frames
+
+def test_mixer_advances_gaplessly_and_resets_position():
+    advanced = []
+    mixer = CrossfadeMixer(FrameSource(5, value=1), duration=0.1, on_advance=advanced.append)
+    second = FrameSource(3, value=2)
+    assert mixer.set_next(second, 0.06, token='b')
+
+    frames = read_all(mixer)
+    assert [int(frame_value(frame)[0]) for frame in frames] == [1] * 5 + [2] * 3
+    assert advanced == ['b']
+    assert mixer.position == pytest.approx(0.06)
+
+def test_mixer_stops_on_early_end_and_records_interruption():
+    advanced = []
+    first = FrameSource(100)
+    mixer = CrossfadeMixer(first, duration=10.0, on_advance=advanced.append, end_tolerance=3.0)
+    mixer.set_next(FrameSource(10), 10.0, token='b')
+
+    assert len(read_all(mixer)) == 100
+    assert mixer.interrupted_at == pytest.approx(2.0)
+    assert advanced == []
+    assert mixer.next_token == 'b'
+
+def test_mixer_end_tolerance_counts_start_offset():
+    """Una pista retomada en el segundo 7 que termina en el 9 acabó a tiempo"""
+    advanced = []
+    mixer = CrossfadeMixer(FrameSource(100), duration=10.0, on_advance=advanced.append, start_offset=7.0, end_tolerance=3.0)
+    mixer.set_next(FrameSource(1), 1.0, token='b')
+
+    assert len(read_all(mixer)) == 101
+    assert mixer.interrupted_at is None
+    assert advanced == ['b']
+
+def test_mixer_position_ignores_buffer_underruns():
+    original = BlockingSource(2)
+    buffered = BufferedAudioSource(original, seconds=0.2, prefill=0.04, underrun_wait=0.01)
+    mixer = CrossfadeMixer(buffered, duration=10.0)
+    for _ in range(4):
+        mixer.read()
+    assert buffered.underruns == 2
+    assert mixer.position == pytest.approx(0.04)
+    original.release.set()
+    mixer.cleanup()
+
+def test_mixer_linear_crossfade():
+    advanced = []
+    first = FrameSource(50, value=1000)
+    second = FrameSource(50, value=2000)
+    mixer = CrossfadeMixer(first, duration=1.0, crossfade=0.1, curve='linear', on_advance=advanced.append)
+    mixer.set_next(second, 1.0, token='b')
+
+    frames = [frame_value(frame) for frame in read_all(mixer)]
+    # 45 frames solos, 5 de fundido y el resto de la segunda pista
+    assert len(frames) == 95
+    assert all(frame[0] == 1000 for frame in frames[:45])
+    fade = np.concatenate([frame.reshape(FRAME_SAMPLES, CHANNELS)[:, 0] for frame in frames[45:50]]).astype(np.int32)
+    assert np.all(np.diff(fade) >= 0)
+    assert 1000 <= fade[0] < 1010 and 1990 <= fade[-1] <= 2000
+    assert all(frame[0] == 2000 for frame in frames[50:])
+    assert advanced == ['b']
+    assert first.cleaned
+
+def test_mixer_runs_audio_thread_calls_before_reading():
+    calls = []
+    mixer = CrossfadeMixer(FrameSource(1))
+    mixer.call_in_audio_thread(lambda: calls.append('encoder'))
+    assert calls == []
+    mixer.read()
+    assert calls == ['encoder']
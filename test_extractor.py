@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pruebas del motor de extracción (extractor.py)
+"""
+
+import os
+import subprocess
+import sys
+import textwrap
+
+from extractor import CircuitBreaker, LatencyTracker, is_upstream_error
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+def test_spawned_worker_does_not_rerun_main_module(tmp_path):
+    """Arrancar un worker no vuelve a crear las cachés del script principal"""
+    log_path = tmp_path / 'imports.log'
+    cache_dir = tmp_path / 'audio'
+    part_path = cache_dir / 'descarga.ogg.part'
+    script = tmp_path / 'fake_bot.py'
+    script.write_text(textwrap.dedent(f'''
+        import multiprocessing
+        import sys
+        sys.path.insert(0, {REPO!r})
+        from audio_cache import AudioFileCache
+
+        # Como bot.py: objetos con efectos al importarse
+        with open({str(log_path)!r}, 'a') as log:
+            log.write(__name__ + '\\n')
+        audio_cache = AudioFileCache({str(cache_dir)!r}, {str(tmp_path / 'cache.db')!r})
+
+        if __name__ == '__main__':
+            from extractor import _ExtractionWorker
+            # Descarga en curso del proceso principal
+            open({str(part_path)!r}, 'wb').close()
+            worker = _ExtractionWorker(multiprocessing.get_context('spawn'), {{'quiet': True}})
+            worker.stop()
+            audio_cache.close()
+    '''))
+
+    result = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, timeout=60)
+
+    assert result.returncode == 0, result.stderr
+    assert log_path.read_text().split() == ['__main__']
+    assert part_path.exists()
+
+def test_single_failure_does_not_open_breaker_on_sparse_tracker():
+    """Sin min_samples muestras el error_rate no cuenta: manda failure_threshold"""
+    tracker = LatencyTracker(min_samples=10)
+    breaker = CircuitBreaker(failure_threshold=3)
+    tracker.record(5.0, ok=False)
+    assert tracker.error_rate() == 0.0
+    breaker.record_failure("HTTP Error 503", tracker.error_rate(), error_rate_threshold=0.5)
+    assert breaker.state == 'closed'
+
+def test_error_rate_counts_once_window_has_min_samples():
+    tracker = LatencyTracker(min_samples=4)
+    for ok in (True, True, False, False):
+        tracker.record(1.0, ok=ok)
+    assert tracker.error_rate() == 0.5
+
+def test_video_level_errors_are_not_upstream():
+    assert not is_upstream_error("ERROR: [youtube] abc: Unable to download webpage: HTTP Error 404: Not Found")
+    assert not is_upstream_error("ERROR: [youtube] abc: Private video. Sign in if you've been granted access")
+    assert is_upstream_error("ERROR: Unable to download webpage: HTTP Error 503: Service Unavailable")
+    assert is_upstream_error("ERROR: Unable to download webpage: <urlopen error [Errno -3] Temporary failure>")
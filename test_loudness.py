@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pruebas del análisis de sonoridad (loudness.py)
+"""
+
+import asyncio
+
+import loudness
+from loudness import LoudnessAnalyzer
+
+# Salida de ffmpeg con una línea de frame suelta antes del resumen final
+STDERR = b"""[Parsed_ebur128_0 @ 0x1] t: 0.4 TARGET:-23 LUFS M: -30.1 S:-120.7 I: -30.1 LUFS LRA: 0.0 LU
+[Parsed_ebur128_0 @ 0x1] Summary:
+
+  Integrated loudness:
+    I:         -14.2 LUFS
+    Threshold: -24.5 LUFS
+
+  Loudness range:
+    LRA:         5.3 LU
+"""
+
+class FakeProcess:
+    returncode = 0
+
+    async def communicate(self):
+        return b'', STDERR
+
+def test_measure_reads_only_the_summary(tmp_path, monkeypatch):
+    calls = []
+
+    async def fake_exec(*args, **kwargs):
+        calls.append(args)
+        return FakeProcess()
+
+    monkeypatch.setattr(loudness.asyncio, 'create_subprocess_exec', fake_exec)
+    analyzer = LoudnessAnalyzer(str(tmp_path / 'cache.db'))
+    try:
+        assert asyncio.run(analyzer.measure('pista.ogg')) == -14.2
+        assert 'ebur128=framelog=quiet' in calls[0]
+    finally:
+        analyzer.close()
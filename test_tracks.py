@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pruebas del reparto justo de la cola (tracks.TrackQueue)
+"""
+
+import pytest
+
+from tracks import QueueFull, Track, TrackQueue
+
+def make_track(requester, index, duration=200):
+    return Track(f"{requester}{index}", duration, 'Canal', requester, f"https://example.com/{requester}{index}")
+
+@pytest.mark.parametrize('scheduler', ['round_robin', 'weighted'])
+def test_readding_on_start_does_not_monopolize(scheduler):
+    """Quien añade una canción cada vez que empieza la suya no se queda con todos los turnos"""
+    queue = TrackQueue(scheduler=scheduler)
+    queue.extend(make_track('A', i) for i in range(10))
+    queue.append(make_track('B', 0))
+    played = []
+    added = 1
+    for _ in range(8):
+        track = queue.popleft()
+        played.append(track.title)
+        if track.requester == 'B':
+            queue.append(make_track('B', added))
+            added += 1
+    assert played == ['A0', 'B0', 'A1', 'B1', 'A2', 'B2', 'A3', 'B3']
+
+def test_fifo_keeps_arrival_order():
+    queue = TrackQueue(scheduler='fifo')
+    for i in range(3):
+        queue.append(make_track('A', i))
+        queue.append(make_track('B', i))
+    assert [queue.popleft().title for _ in range(6)] == ['A0', 'B0', 'A1', 'B1', 'A2', 'B2']
+
+def test_caps_follow_user_id_not_display_name():
+    """Cambiar de apodo no da más cupo, y dos personas con el mismo nombre no lo comparten"""
+    queue = TrackQueue(scheduler='round_robin', max_per_user=2)
+    queue.enqueue(Track('a', 200, 'Canal', 'Nana', 'https://example.com/a', requester_id=1))
+    queue.enqueue(Track('b', 200, 'Canal', 'Nanali', 'https://example.com/b', requester_id=1))
+    with pytest.raises(QueueFull):
+        queue.enqueue(Track('c', 200, 'Canal', 'Otro apodo', 'https://example.com/c', requester_id=1))
+    queue.enqueue(Track('d', 200, 'Canal', 'Nana', 'https://example.com/d', requester_id=2))
+    assert queue.room_for(1) == 0
+    assert queue.room_for(2) == 1
+
+@pytest.mark.parametrize('scheduler', ['fifo', 'round_robin', 'weighted'])
+def test_rotate_puts_track_behind_every_queued_track(scheduler):
+    """!loop queue: la canción terminada vuelve detrás de todas, sin repetirse antes de tiempo"""
+    queue = TrackQueue(scheduler=scheduler)
+    queue.extend([make_track('A', 0), make_track('A', 1), make_track('B', 0)])
+    first = [track.title for track in queue]
+    played = []
+    for _ in range(9):
+        track = queue.popleft()
+        played.append(track.title)
+        queue.rotate(track)
+    assert played == first * 3
+    assert len(queue) == 3
+
+def test_move_keeps_new_tracks_behind_the_moved_one():
+    """Tras mover la pista de B al final, la siguiente de B va detrás de ella"""
+    queue = TrackQueue(scheduler='round_robin')
+    queue.extend([make_track('A', 0), make_track('A', 1), make_track('A', 2), make_track('B', 0)])
+    queue.move(1, 3)
+    assert [track.title for track in queue] == ['A0', 'A1', 'A2', 'B0']
+    queue.append(make_track('B', 1))
+    assert [track.title for track in queue][-2:] == ['B0', 'B1']
+
+def test_positional_access_matches_order():
+    queue = TrackQueue(scheduler='round_robin')
+    queue.extend(make_track(requester, i) for i in range(3) for requester in 'ABC')
+    order = [track.title for track in queue]
+    assert [queue[i].title for i in range(len(queue))] == order
+    assert queue[-1].title == order[-1]
+    assert [track.title for track in queue.page(2, 3)] == order[2:5]
+    assert queue.remove_at(4).title == order[4]
+    assert [track.title for track in queue] == order[:4] + order[5:]
+    with pytest.raises(IndexError):
+        queue[len(queue)]
@@ -0,0 +1,308 @@
+# 🌸 Nanali Music Bot v3.0 - Pistas y cola de reproducción
+# Registros compactos para las canciones en cola y una cola con reparto justo entre quienes piden
+
+import heapq
+import random
+import sys
+from collections import Counter
+from itertools import count
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional
+
+# ═══════════════════════════════════════════════════════════════
+# 🎵 PISTA EN COLA
+# ═══════════════════════════════════════════════════════════════
+
+class Track:
+    """Canción de la cola: solo metadatos, la URL de audio se resuelve al reproducir
+
+    Con __slots__ cada pista ocupa una fracción de lo que ocupaba el dict
+    equivalente, y los nombres de quien la pidió y del canal se internan:
+    miles de pistas del mismo usuario o canal comparten una sola cadena.
+    """
+
+    __slots__ = ('title', 'duration', 'uploader', 'requester', 'requester_id', 'original_url', 'webpage_url', 'cache_key')
+
+    def __init__(
+        self,
+        title: str,
+        duration: Optional[int],
+        uploader: str,
+        requester: str,
+        webpage_url: str,
+        cache_key: Optional[str] = None,
+        original_url: Optional[str] = None,
+        requester_id: Optional[int] = None
+    ):
+        self.title = title
+        self.duration = int(duration) if duration else None
+        # Pistas ya guardadas en track_cache pueden traer None de extractores que no lo dan
+        self.uploader = sys.intern(uploader or 'Canal desconocido')
+        # El nombre solo se muestra; cupos y turnos van por el ID, que no cambia con el apodo
+        self.requester = sys.intern(requester)
+        self.requester_id = requester_id
+        self.webpage_url = webpage_url
+        # Casi siempre es la misma URL: no guardar una segunda copia
+        self.original_url = webpage_url if original_url in (None, webpage_url) else original_url
+        self.cache_key = cache_key
+
+    @property
+    def requester_key(self):
+        """Quién pidió la pista para cupos y turnos (el nombre en pistas guardadas sin ID)"""
+        return self.requester_id if self.requester_id is not None else self.requester
+
+    def __repr__(self) -> str:
+        return f"Track({self.title!r}, {self.cache_key!r})"
+
+# ═══════════════════════════════════════════════════════════════
+# ⚖️ PLANIFICADORES DE LA COLA
+# ═══════════════════════════════════════════════════════════════
+
+class QueueFull(Exception):
+    """La cola del servidor o el cupo de quien pide ya está lleno"""
+
+    def __init__(self, message: str, limit: int):
+        super().__init__(message)
+        self.limit = limit
+
+class FifoScheduler:
+    """Orden de llegada: todas las pistas comparten un solo flujo"""
+
+    name = 'fifo'
+
+    def flow(self, track: Track) -> Optional[Hashable]:
+        return None
+
+    def cost(self, track: Track) -> float:
+        return 1.0
+
+class RoundRobinScheduler(FifoScheduler):
+    """Una pista de cada persona por turno, en el orden en que se unieron"""
+
+    name = 'round_robin'
+
+    def flow(self, track: Track) -> Optional[Hashable]:
+        return track.requester_key
+
+class WeightedFairScheduler(RoundRobinScheduler):
+    """Reparto del tiempo de reproducción (no de pistas) según el peso de cada persona
+
+    Una canción de 8 minutos gasta el turno de dos de 4; quien tiene peso 2
+    recibe el doble de tiempo que quien tiene peso 1.
+    """
+
+    name = 'weighted'
+
+    def __init__(self, weights: Optional[Dict[int, float]] = None, default_duration: int = 240):
+        self.weights = weights or {}
+        self.default_duration = default_duration
+
+    def cost(self, track: Track) -> float:
+        return (track.duration or self.default_duration) / self.weights.get(track.requester_key, 1.0)
+
+SCHEDULERS = {scheduler.name: scheduler for scheduler in (FifoScheduler, RoundRobinScheduler, WeightedFairScheduler)}
+
+# ═══════════════════════════════════════════════════════════════
+# 📋 COLA DE REPRODUCCIÓN
+# ═══════════════════════════════════════════════════════════════
+
+class TrackQueue:
+    """Cola de prioridad por etiquetas de fin virtual (fair queuing)
+
+    Cada pista recibe al entrar la etiqueta max(tiempo virtual, fin de la
+    última pista de su flujo) + coste, y sale la de etiqueta menor; el tiempo
+    virtual es la etiqueta de la última pista que salió. Con un
+    solo flujo es FIFO, con un flujo por persona y coste 1 es round-robin, y
+    con coste = duración / peso es weighted fair queuing. Añadir y sacar la
+    siguiente es O(log n) sobre un heap; ver la primera es O(1). Las
+    operaciones por posición (mostrar, quitar) usan nsmallest sin ordenar
+    el resto de la cola; solo mover y mezclar la reordenan entera.
+
+    enqueue() aplica los cupos por servidor y por persona; append() no
+    (pistas restauradas o devueltas a la cola).
+    """
+
+    def __init__(
+        self,
+        tracks: Iterable[Track] = (),
+        scheduler: str = 'fifo',
+        max_size: Optional[int] = None,
+        max_per_user: Optional[int] = None,
+        weights: Optional[Dict[int, float]] = None,
+        default_duration: int = 240
+    ):
+        self.max_size = max_size
+        self.max_per_user = max_per_user
+        self.weights = weights
+        self.default_duration = default_duration
+        self.set_scheduler(scheduler)
+        self.extend(tracks)
+
+    def set_scheduler(self, name: str) -> None:
+        """Cambia el modo de reparto; las pistas en cola se reordenan con el nuevo"""
+        scheduler_class = SCHEDULERS[name]
+        if scheduler_class is WeightedFairScheduler:
+            self.scheduler = scheduler_class(self.weights, self.default_duration)
+        else:
+            self.scheduler = scheduler_class()
+        tracks = list(self) if hasattr(self, '_heap') else []
+        # Entradas [fin virtual, secuencia, pista]; la secuencia desempata por llegada
+        self._heap: List[list] = []
+        self._sequence = count()
+        self._virtual_time = 0.0
+        # Cota superior de todas las etiquetas en cola (para poner una pista la última)
+        self._max_finish = 0.0
+        self._last_finish: Dict[Optional[Hashable], float] = {}
+        self._per_user: Counter = Counter()
+        self.extend(tracks)
+
+    # ─── Entrada ───
+
+    def room_for(self, requester_id: int) -> int:
+        """Cuántas pistas más puede añadir ese usuario sin pasarse de ningún cupo"""
+        room = sys.maxsize if self.max_size is None else self.max_size - len(self._heap)
+        if self.max_per_user is not None:
+            room = min(room, self.max_per_user - self._per_user[requester_id])
+        return max(0, room)
+
+    def enqueue(self, track: Track) -> None:
+        """Añade una pista pedida por un usuario, respetando los cupos
+
+        Raises:
+            QueueFull: si la cola del servidor o el cupo de quien la pide está lleno
+        """
+        if self.max_size is not None and len(self._heap) >= self.max_size:
+            raise QueueFull(f"La cola está llena (máximo {self.max_size} canciones)", self.max_size)
+        if self.max_per_user is not None and self._per_user[track.requester_key] >= self.max_per_user:
+            raise QueueFull(f"Ya tienes {self.max_per_user} canciones en la cola, espera a que suene alguna", self.max_per_user)
+        self.append(track)
+
+    def append(self, track: Track) -> None:
+        flow = self.scheduler.flow(track)
+        start = max(self._virtual_time, self._last_finish.get(flow, 0.0))
+        finish = self._last_finish[flow] = start + self.scheduler.cost(track)
+        self._max_finish = max(self._max_finish, finish)
+        heapq.heappush(self._heap, [finish, next(self._sequence), track])
+        self._per_user[track.requester_key] += 1
+
+    def rotate(self, track: Track) -> None:
+        """Pone al final, detrás de todas las de la cola, una pista que ya sonó
+
+        Es lo que hace !loop queue: con etiqueta igual a la mayor y la
+        secuencia más nueva, sale después de cualquier pista en cola sea cual
+        sea el planificador. Cuenta como la última de su flujo.
+        """
+        finish = self._max_finish = max(self._max_finish, self._virtual_time)
+        self._last_finish[self.scheduler.flow(track)] = finish
+        heapq.heappush(self._heap, [finish, next(self._sequence), track])
+        self._per_user[track.requester_key] += 1
+
+    def extend(self, tracks: Iterable[Track]) -> None:
+        for track in tracks:
+            self.append(track)
+
+    def push_front(self, track: Track) -> None:
+        """Devuelve una pista al principio (p. ej. si no se pudo reproducir)"""
+        if self._heap:
+            head = self._heap[0]
+            entry = [head[0], head[1] - 1, track]
+        else:
+            entry = [self._virtual_time, next(self._sequence), track]
+        heapq.heappush(self._heap, entry)
+        self._per_user[track.requester_key] += 1
+
+    # ─── Salida ───
+
+    def popleft(self) -> Track:
+        finish, _, track = heapq.heappop(self._heap)
+        # El tiempo virtual avanza hasta el fin de la pista que empieza (SCFQ): quien
+        # añade una canción cuando suena la suya queda detrás del turno de los demás
+        self._virtual_time = max(self._virtual_time, finish)
+        flow = self.scheduler.flow(track)
+        if self._last_finish.get(flow) == finish:
+            # Era la última pista de su flujo
+            del self._last_finish[flow]
+        self._release(track)
+        return track
+
+    def peek(self) -> Optional[Track]:
+        return self._heap[0][2] if self._heap else None
+
+    def _release(self, track: Track) -> None:
+        self._per_user[track.requester_key] -= 1
+        if not self._per_user[track.requester_key]:
+            del self._per_user[track.requester_key]
+
+    # ─── Operaciones por posición (comandos) ───
+
+    def _entry_at(self, index: int) -> list:
+        if index < 0:
+            index += len(self._heap)
+        if not 0 <= index < len(self._heap):
+            raise IndexError('posición fuera de la cola')
+        if index == 0:
+            return self._heap[0]
+        return heapq.nsmallest(index + 1, self._heap)[-1]
+
+    def _rebuild_last_finish(self) -> None:
+        """Recalcula el fin de la última pista en cola de cada flujo a partir del heap"""
+        last_finish: Dict[Optional[Hashable], float] = {}
+        for finish, _, track in self._heap:
+            flow = self.scheduler.flow(track)
+            last_finish[flow] = max(last_finish.get(flow, finish), finish)
+        self._last_finish = last_finish
+
+    def _reorder(self, tracks: List[Track]) -> None:
+        """Reparte las etiquetas actuales, en orden, entre las pistas en el orden dado"""
+        self._heap = [[*key[:2], track] for key, track in zip(sorted(self._heap), tracks)]
+        # Las pistas cambiaron de etiqueta: la última de cada flujo puede ser otra
+        self._rebuild_last_finish()
+
+    def remove_at(self, index: int) -> Track:
+        """Quita la pista en la posición index (empezando en 0)"""
+        entry = self._entry_at(index)
+        self._heap.remove(entry)
+        heapq.heapify(self._heap)
+        self._rebuild_last_finish()
+        self._release(entry[2])
+        return entry[2]
+
+    def move(self, source: int, destination: int) -> Track:
+        """Mueve una pista de una posición a otra"""
+        tracks = list(self)
+        track = tracks.pop(source)
+        tracks.insert(destination, track)
+        self._reorder(tracks)
+        return track
+
+    def page(self, start: int, size: int) -> List[Track]:
+        """Pistas de start a start + size sin ordenar el resto de la cola"""
+        return [entry[2] for entry in heapq.nsmallest(start + size, self._heap)[start:]]
+
+    def shuffle(self) -> None:
+        tracks = list(self)
+        random.shuffle(tracks)
+        self._reorder(tracks)
+
+    def clear(self) -> None:
+        self._heap.clear()
+        self._max_finish = self._virtual_time
+        self._last_finish.clear()
+        self._per_user.clear()
+
+    def count_for(self, requester_id: int) -> int:
+        return self._per_user[requester_id]
+
+    def __getitem__(self, index: int) -> Track:
+        return self._entry_at(index)[2]
+
+    def __iter__(self) -> Iterator[Track]:
+        # Vaciar una copia del heap: quien solo mira las primeras no ordena el resto
+        heap = self._heap.copy()
+        while heap:
+            yield heapq.heappop(heap)[2]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __bool__(self) -> bool:
+        return bool(self._heap)
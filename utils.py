@@ -74,6 +74,19 @@ class MusicUtils:
                 return True
         return False
     
+    @staticmethod
+    def is_playlist_url(url: str) -> bool:
+        """Indica si la URL apunta a una playlist completa (no a un video dentro de ella)"""
+        playlist_patterns = [
+            r'(?:https?://)?(?:www\.|music\.|m\.)?youtube\.com/playlist\?(?:.*&)?list=([\w-]+)',
+            r'(?:https?://)?(?:www\.)?soundcloud\.com/[\w-]+/sets/[\w-]+'
+        ]
+        
+        for pattern in playlist_patterns:
+            if re.match(pattern, url):
+                return True
+        return False
+    
     @staticmethod
     def extract_video_id(url: str) -> Optional[str]:
         """Extrae el ID del video de una URL de YouTube"""
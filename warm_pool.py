@@ -0,0 +1,92 @@
+# 🌸 Nanali Music Bot v3.0 - Precalentamiento de Playlists
+# Mantiene resueltas las playlists temáticas para que los comandos otaku suenen al instante
+
+import asyncio
+import time
+from typing import Dict, List
+
+from audio_config import log_debug
+
+class CatalogWarmer:
+    """Resuelve en segundo plano las playlists curadas y las refresca antes de que caduquen
+
+    Usa las mismas funciones que los comandos (búsqueda plana con caché y
+    resolución con caché de pistas), así que un comando temático encuentra
+    tanto la búsqueda como la URL de audio ya listas.
+    """
+
+    def __init__(
+        self,
+        catalogs: Dict[str, List[str]],
+        search,
+        resolve,
+        track_cache,
+        is_busy=None,
+        concurrency: int = 1,
+        refresh_interval: int = 1800,
+        refresh_margin: int = 3600
+    ):
+        self.catalogs = catalogs
+        self.search = search
+        self.resolve = resolve
+        self.track_cache = track_cache
+        self.is_busy = is_busy or (lambda: False)
+        self.concurrency = concurrency
+        self.refresh_interval = refresh_interval
+        self.refresh_margin = refresh_margin
+        self.warmed = 0
+        self.failed = 0
+        self._task = None
+
+    def _queries(self) -> List[str]:
+        # Sin duplicados y en orden estable
+        return list(dict.fromkeys(query for songs in self.catalogs.values() for query in songs))
+
+    def _needs_refresh(self, video_id: str) -> bool:
+        entry = self.track_cache.get(video_id)
+        return entry is None or entry['expires_at'] - time.time() < self.refresh_margin
+
+    async def _warm_one(self, query: str, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            # Las peticiones de los usuarios tienen prioridad sobre el precalentamiento
+            while self.is_busy():
+                await asyncio.sleep(1)
+            try:
+                entries = await self.search(query, 1)
+                if not entries:
+                    self.failed += 1
+                    return
+                entry = entries[0]
+                if self._needs_refresh(entry['id']):
+                    if await self.resolve(entry, refresh=True):
+                        self.warmed += 1
+                    else:
+                        self.failed += 1
+            except Exception as e:
+                self.failed += 1
+                log_debug(f"No se pudo precalentar '{query}': {e}", "warm_pool")
+
+    async def warm_all(self):
+        """Recorre todas las playlists resolviendo lo que falte o esté por caducar"""
+        start_time = time.time()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._warm_one(query, semaphore) for query in self._queries()))
+        log_debug(
+            f"Playlists precalentadas en {time.time() - start_time:.0f}s "
+            f"({self.warmed} resueltas, {self.failed} fallidas)",
+            "warm_pool"
+        )
+
+    async def _run(self):
+        while True:
+            await self.warm_all()
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        """Inicia el precalentamiento periódico (idempotente)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()